@@ -1,6 +1,8 @@
 # categories.py
 from fastapi import APIRouter, Request, Depends, HTTPException
 
+from services.category_tree import CategorySnapshot, get_category_tree, load_snapshot
+from utils.http_cache import catalog_cache
 from utils.throttle import throttle
 
 router = APIRouter(prefix="/categories", tags=["categories"])
@@ -383,133 +385,121 @@ _SUB_EN = {
     'sauces_other': 'Other sauces',
 }
 
+# ─── Counts (services/category_tree.py) ───────────────────────────────────
+
+async def _snapshot(db) -> CategorySnapshot:
+    """In-memory tree; live counts until its first load."""
+    tree = get_category_tree()
+    if tree.ready:
+        return tree.snapshot
+    return await load_snapshot(db, live=True)
+
+
+def _main_out(r) -> dict:
+    return {
+        "code": r["code"],
+        "label": r["label_et"],
+        "label_et": r["label_et"],
+        "label_ru": _MAIN_RU.get(r["code"], r["label_et"]),
+        "label_en": _MAIN_EN.get(r["code"], r["label_en"] or r["label_et"]),
+        "product_count": r["product_count"],
+    }
+
+
+def _sub_out(r, has_children: bool) -> dict:
+    return {
+        "code": r["code"],
+        "label": r["label_et"],
+        "label_et": r["label_et"],
+        "label_ru": _SUB_RU.get(r["code"], r["label_et"]),
+        "label_en": _SUB_EN.get(r["code"], r["label_en"] or r["label_et"]),
+        "product_count": r["product_count"],
+        "has_children": has_children,
+    }
+
+
+# Rendered /tree response for the last snapshot (the tree rarely changes).
+_tree_payload: tuple = (None, None)
+
 # ─────────────────────────────────────────────────────────
-# 1) Main categories
+# 0) Whole tree: main -> sub -> sub-sub, with counts
 # ─────────────────────────────────────────────────────────
-@router.get("/main")
+@router.get("/tree")
 @throttle(limit=120, window=60)
-async def list_main_categories(
+@catalog_cache("category_counts")
+async def category_tree(
     request: Request,
     db=Depends(get_db),
 ):
-    sql = """
-        SELECT
-            m.code,
-            m.label_et,
-            COALESCE(m.label_en, m.label_et) AS label_en,
-            COUNT(DISTINCT p.id) AS product_count
-        FROM categories_main m
-        LEFT JOIN categories_sub s ON s.main_id = m.id
-        LEFT JOIN products p ON p.sub_code = s.code
-        GROUP BY m.id, m.code, m.label_et, m.label_en, m.sort_order
-        ORDER BY m.sort_order, m.id;
-    """
-    rows = await db.fetch(sql)
-    return [
+    global _tree_payload
+    snap = await _snapshot(db)
+    cached_snap, payload = _tree_payload
+    if cached_snap is snap:
+        return payload
+    payload = [
         {
-            "code": r["code"],
-            "label": r["label_et"],
-            "label_et": r["label_et"],
-            "label_ru": _MAIN_RU.get(r["code"], r["label_et"]),
-            "label_en": _MAIN_EN.get(r["code"], r["label_en"] or r["label_et"]),
-            "product_count": r["product_count"],
+            **_main_out(m),
+            "subcategories": [
+                {
+                    **_sub_out(s, bool(snap.children_by_sub.get(s["code"]))),
+                    "children": [
+                        _sub_out(c, False) for c in snap.children_by_sub.get(s["code"], ())
+                    ],
+                }
+                for s in snap.subs_by_main.get(m["code"], ())
+            ],
         }
-        for r in rows
+        for m in snap.mains
     ]
+    _tree_payload = (snap, payload)
+    return payload
+
+# ─────────────────────────────────────────────────────────
+# 1) Main categories
+# ─────────────────────────────────────────────────────────
+@router.get("/main")
+@throttle(limit=120, window=60)
+@catalog_cache("category_counts")
+async def list_main_categories(
+    request: Request,
+    db=Depends(get_db),
+):
+    snap = await _snapshot(db)
+    return [_main_out(m) for m in snap.mains]
 
 # ─────────────────────────────────────────────────────────
 # 2) Subcategories under a main category (only top-level, no parent)
 # ─────────────────────────────────────────────────────────
 @router.get("/{main_code}/sub")
 @throttle(limit=120, window=60)
+@catalog_cache("category_counts")
 async def list_subcategories(
     main_code: str,
     request: Request,
     db=Depends(get_db),
 ):
-    main_row = await db.fetchrow(
-        "SELECT id, code, label_et FROM categories_main WHERE code = $1",
-        main_code,
-    )
-    if not main_row:
+    snap = await _snapshot(db)
+    if main_code not in snap.main_codes:
         raise HTTPException(status_code=404, detail="Main category not found")
-    sql = """
-        SELECT
-            s.code,
-            s.label_et,
-            COALESCE(s.label_en, s.label_et) AS label_en,
-            s.parent_id,
-            COUNT(DISTINCT p.id) AS product_count
-        FROM categories_sub s
-        JOIN categories_main m ON s.main_id = m.id
-        LEFT JOIN products p ON p.sub_code = s.code
-        WHERE m.code = $1
-          AND s.parent_id IS NULL
-        GROUP BY s.id, s.code, s.label_et, s.label_en, s.sort_order, s.parent_id
-        ORDER BY s.sort_order, s.id;
-    """
-    rows = await db.fetch(sql, main_code)
-    result = []
-    for r in rows:
-        count = r["product_count"]
-        if r["code"] == "drinks_spirits":
-            child_count = await db.fetchval("""
-                SELECT COUNT(DISTINCT p.id)
-                FROM categories_sub s
-                LEFT JOIN products p ON p.sub_code = s.code
-                WHERE s.parent_id = (SELECT id FROM categories_sub WHERE code = 'drinks_spirits')
-            """)
-            count = (count or 0) + (child_count or 0)
-        result.append({
-            "code": r["code"],
-            "label": r["label_et"],
-            "label_et": r["label_et"],
-            "label_ru": _SUB_RU.get(r["code"], r["label_et"]),
-            "label_en": _SUB_EN.get(r["code"], r["label_en"] or r["label_et"]),
-            "product_count": count,
-            "has_children": r["code"] == "drinks_spirits",
-        })
-    return result
+    # product_count includes sub-subcategories (drinks_spirits -> spirits_*).
+    return [
+        _sub_out(s, bool(snap.children_by_sub.get(s["code"])))
+        for s in snap.subs_by_main.get(main_code, ())
+    ]
 
 # ─────────────────────────────────────────────────────────
 # 3) Sub-subcategories under a subcategory (by sub_code)
 # ─────────────────────────────────────────────────────────
 @router.get("/{main_code}/sub/{sub_code}/sub")
 @throttle(limit=120, window=60)
+@catalog_cache("category_counts")
 async def list_sub_subcategories(
     main_code: str,
     sub_code: str,
     request: Request,
     db=Depends(get_db),
 ):
-    parent_row = await db.fetchrow(
-        "SELECT id, code, label_et FROM categories_sub WHERE code = $1",
-        sub_code,
-    )
-    if not parent_row:
+    snap = await _snapshot(db)
+    if sub_code not in snap.sub_codes:
         raise HTTPException(status_code=404, detail="Subcategory not found")
-    sql = """
-        SELECT
-            s.code,
-            s.label_et,
-            COALESCE(s.label_en, s.label_et) AS label_en,
-            COUNT(DISTINCT p.id) AS product_count
-        FROM categories_sub s
-        LEFT JOIN products p ON p.sub_code = s.code
-        WHERE s.parent_id = $1
-        GROUP BY s.id, s.code, s.label_et, s.label_en, s.sort_order
-        ORDER BY s.sort_order, s.id;
-    """
-    rows = await db.fetch(sql, parent_row["id"])
-    return [
-        {
-            "code": r["code"],
-            "label": r["label_et"],
-            "label_et": r["label_et"],
-            "label_ru": _SUB_RU.get(r["code"], r["label_et"]),
-            "label_en": _SUB_EN.get(r["code"], r["label_en"] or r["label_et"]),
-            "product_count": r["product_count"],
-            "has_children": False,
-        }
-        for r in rows
-    ]
+    return [_sub_out(c, False) for c in snap.children_by_sub.get(sub_code, ())]
@@ -3,6 +3,8 @@
 from fastapi import APIRouter, Request, Header, HTTPException
 from typing import Optional, Dict, Any
 
+from services.product_cards import fetch_product_cards
+
 router = APIRouter()
 
 
@@ -46,43 +48,31 @@ async def get_favourites(
     pool = await _get_pool(request)
     async with pool.acquire() as conn:
         user_id = await _require_user_id(conn, authorization)
-        rows = await conn.fetch("""
-            SELECT
-                p.id,
-                COALESCE(pg.canonical_name, p.name) AS name,
-                p.image_url,
-                COALESCE(pg.brand, p.brand) AS brand,
-                p.size_text,
-                p.sub_code,
-                gc.chains AS available_chains,
-                gc.min_price,
-                CASE WHEN p.size_text = 'kg' THEN true ELSE false END AS is_per_kg,
-                f.created_at AS favourited_at
-            FROM favourite_products f
-            JOIN products p ON p.id = f.product_id
-            LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
-            LEFT JOIN product_groups pg ON pg.id = pgm.group_id
-            LEFT JOIN mv_group_chains gc
-                ON gc.dedup_key = COALESCE(pgm.group_id::text, 'u_' || p.id::text)
-            WHERE f.user_id = $1
-            ORDER BY f.created_at DESC
+        favs = await conn.fetch("""
+            SELECT product_id, created_at
+            FROM favourite_products
+            WHERE user_id = $1
+            ORDER BY created_at DESC
         """, user_id)
+        cards = await fetch_product_cards(conn, [f["product_id"] for f in favs])
 
     items = []
-    for r in rows:
-        d = dict(r)
+    for f in favs:
+        d = cards.get(f["product_id"])
+        if d is None:
+            continue
         chains = d.get("available_chains") or []
         items.append({
             "id": d["id"],
-            "name": d["name"] or "",
+            "name": d["canonical_name"] or d["name"] or "",
             "image_url": d["image_url"],
-            "brand": d["brand"] or "",
+            "brand": d["group_brand"] or d["product_brand"] or "",
             "size_text": d["size_text"] or "",
             "sub_code": d["sub_code"],
             "available_chains": sorted(list(set(chains))) if chains else [],
             "min_price": float(d["min_price"]) if d["min_price"] is not None else None,
-            "is_per_kg": d["is_per_kg"],
-            "favourited_at": d["favourited_at"].isoformat() if d["favourited_at"] else None,
+            "is_per_kg": d["size_text"] == "kg",
+            "favourited_at": f["created_at"].isoformat() if f["created_at"] else None,
         })
 
     return {"items": items, "count": len(items)}
@@ -1,10 +1,23 @@
 # api/products.py
 
+import base64
+import json
 import logging
 import re
+from decimal import Decimal, InvalidOperation
 from fastapi import APIRouter, Request, Query, HTTPException, Header
-from typing import Optional, List, Dict, Any
-
+from typing import Optional, List, Dict, Any, Tuple
+
+from settings import SEARCH_INDEX_ENABLED
+from services.produce_family import (
+    ALTERNATIVE_FAMILY_FILTER_SUB_CODES,
+    FAMILY_KEYWORDS_BY_NAME,
+    detect_produce_family,
+    family_ilike_patterns,
+)
+from services.product_cards import fetch_product_cards
+from services.search_index import get_search_index
+from utils.http_cache import catalog_cache
 from utils.throttle import throttle
 
 logger = logging.getLogger("uvicorn.error")
@@ -12,130 +25,7 @@ logger = logging.getLogger("uvicorn.error")
 router = APIRouter()
 
 MAX_LIMIT = 50  # server-side hard cap
-
-PRICE_FRESHNESS_FILTER = "EXISTS (SELECT 1 FROM prices pr WHERE pr.product_id = p.id AND pr.collected_at > NOW() - INTERVAL '14 days')"
-
-# v10 fix (ChatGPT lopplik soovitus): asendatud jarjekorra-pohine
-# sonastik EKSPLITSIITSE prioriteediga reeglite loendiga. Eelmine
-# PRODUCE_FAMILIES dict tootas oigesti, aga tugines VAIKIMISI
-# insertion-order'ile ("chili enne pepper", "cauliflower enne cabbage",
-# "zucchini enne pumpkin") - see on habras: jargmine uus markssona voib
-# vaikselt uuesti mone kollisiooni tekitada, kui keegi ei mainita
-# kommentaare loe. Nyyd on prioriteet OTSE nahtav (100 = spetsiifilisem
-# liitsona/alamliik, mis voidab yldisema 50-prioriteediga vaste ule,
-# soltumata sellest, millises jarjekorras loend on kirjutatud).
-#
-# Eestikeelsed markssonad on TYVED (mitte taisvormid), et katta
-# kaandeid ILIKE '%tyvi%' substring-matchiga. Kaashaalikuuhenduse tottu
-# (nt kurk->kurgi, peet->peedi) on mone perekonna jaoks kaks tyve.
-PRODUCE_FAMILY_RULES: List[tuple] = [
-    # Prioriteet 100: TEADAOLEVALT spetsiifilisemad/liitsona-markssonad,
-    # mis peavad voitma uldisema 50-prioriteediga vaste ule.
-    ("chili", ("tšilli", "tsilli", "chili"), 100),       # voidab "pepper" (paprika)
-    ("cauliflower", ("lillkaps",), 100),                  # voidab "cabbage" (kapsa)
-    ("zucchini", ("suvikõrvits", "suvikorvits"), 100),    # voidab "pumpkin" (kõrvits)
-    # Prioriteet 50: pohiperekonnad.
-    ("tomato", ("tomat",), 50),  # katab tomat/tomatid/kirsstomat/ploomtomat/kobartomat
-    ("potato", ("kartul",), 50),
-    ("onion", ("sibul",), 50),
-    ("garlic", ("küüslauk", "kuuslauk"), 50),
-    ("leek", ("porru",), 50),
-    ("cucumber", ("kurk", "kurgi"), 50),  # kurk (nom) / kurgi (gen, k->g gradatsioon)
-    ("pepper", ("paprika",), 50),
-    ("carrot", ("porgand",), 50),
-    ("broccoli", ("brokoli",), 50),
-    ("cabbage", ("kapsa",), 50),  # katab kapsas/kapsad/kapsaga/punane kapsas
-    ("beet", ("peet", "peedi"), 50),  # peet (nom) / peedi (gen, t->d gradatsioon)
-    ("radish", ("redis",), 50),
-    ("turnip", ("naeris", "naeri"), 50),
-    ("swede", ("kaalikas", "kaalika"), 50),
-    ("celery", ("seller",), 50),
-    ("eggplant", ("baklažaan", "baklazaan"), 50),
-    ("pumpkin", ("kõrvits", "korvits"), 50),
-    ("corn", ("mais",), 50),
-    ("asparagus", ("spargel",), 50),
-]
-
-# v12 fix: assert ei toimi Python -O (optimeeritud) rezhiimis, kus
-# koik assert-laused eemaldatakse taielikult - "kukub deploy'l kohe"
-# poleks siis garanteeritud. Eksplitsiitne RuntimeError kontrollib
-# seda IGAS rezhiimis. Kontroll on ka teadlikult ENNE
-# _FAMILY_KEYWORDS_BY_NAME loomist, et duplikaadi korral ei looda
-# isegi ajutiselt juba vaikides yle kirjutatud lookup'i.
-_family_names = [family for family, _keywords, _priority in PRODUCE_FAMILY_RULES]
-_duplicate_family_names = sorted({
-    family for family in _family_names if _family_names.count(family) > 1
-})
-if _duplicate_family_names:
-    raise RuntimeError(
-        f"PRODUCE_FAMILY_RULES sisaldab duplikaat family nimesid: {_duplicate_family_names}"
-    )
-
-# Tuletatud lookup ILIKE mustrite jaoks (sub_code candidate filter).
-_FAMILY_KEYWORDS_BY_NAME: Dict[str, tuple] = {
-    family: keywords for family, keywords, _priority in PRODUCE_FAMILY_RULES
-}
-
-# Kategooriad, kus tooteperekonna hard filter rakendub (ChatGPT: ÄRGE
-# kasutage dünaamilist "kui >200 toodet" reeglit - suurus on riskisignaal,
-# mitte piisav otsus. Alustame käsitsi teadaoleva laia kategooriaga,
-# laiendame hiljem, kui automaatne heterogeensuse audit on tehtud).
-ALTERNATIVE_FAMILY_FILTER_SUB_CODES = {"produce_root_veg"}
-
-
-def _detect_produce_family(name: str) -> Optional[str]:
-    """Tuvastab tooteperekonna (tomato/potato/onion/...) nime pohjal.
-    Tagastab None, kui yhtegi teadaolevat perekonda ei tuvastata - sel
-    juhul EI rakendata hard filtrit (fail-open, mitte fail-closed),
-    kuna vale negatiiv oleks siin halvem kui filtri puudumine.
-
-    Kasutab EKSPLITSIITSET prioriteeti (vt PRODUCE_FAMILY_RULES), MITTE
-    stringi pikkust ega loendi jarjekorda. "Pikim vaste voidab" katsetati
-    ja lykati tagasi (vt v9 ajalugu) - see lohkus tšillipaprika juhtumi,
-    kuna "paprika" (7 tahte) on stringina pikem kui "tšilli" (6 tahte),
-    kuigi "tšilli" on siin oige/spetsiifilisem valik. Tšillipaprika on
-    liitsona, kus molemad markssonad esinevad SOLTUMATULT (mitte
-    uksteise sees) - stringi pikkus ei korreleeru siin oigsusega,
-    seetottu on vaja eraldi, KASITSI maaratud prioriteeti.
-
-    v11 fix (ChatGPT leid): varasem versioon kasutas max(matches, key=...),
-    mis VORDSE korgeima prioriteedi korral tagastas vaikimisi ESIMESE
-    loendis oleva vaste - see oli endiselt jarjekorra-pohine hapruse
-    jaak, lihtsalt varjatud kujul (praegu 100/50 kahe astmega ei teki
-    kollisiooni, aga tulevane 50-prioriteediga lisandus voiks tekitada).
-    Nyyd TUVASTATAKSE vordsed korgeima prioriteediga vasted eraldi ja
-    tagastatakse fail-open (None) + hoiatuslogi, MITTE ei valita
-    vaikides yht neist juhuslikult/jarjekorra jargi."""
-    if not name:
-        return None
-    name_lower = name.lower()
-    matches = [
-        (priority, family)
-        for family, keywords, priority in PRODUCE_FAMILY_RULES
-        if any(kw in name_lower for kw in keywords)
-    ]
-    if not matches:
-        return None
-
-    highest_priority = max(priority for priority, _family in matches)
-    winners = {family for priority, family in matches if priority == highest_priority}
-
-    if len(winners) > 1:
-        logger.warning(
-            "Ambiguous produce family: name=%r families=%s priority=%s",
-            name, sorted(winners), highest_priority,
-        )
-        return None
-
-    return next(iter(winners))
-
-
-
-
-def _family_ilike_patterns(family: str) -> List[str]:
-    """Tagastab ILIKE ANY() mustrid antud perekonna jaoks, nt
-    'tomato' -> ['%tomat%']."""
-    return [f"%{kw}%" for kw in _FAMILY_KEYWORDS_BY_NAME.get(family, ())]
+MAX_BATCH_IDS = 100  # /products/batch
 
 # Tuvastab mahu nimes -- nt "500ml", "0.5L", "75cl", "1.5 l", "6x568ml", "24x330ml"
 _SIZE_IN_NAME_RE = re.compile(
@@ -245,17 +135,17 @@ async def _get_user_id_from_token(conn, authorization: Optional[str]) -> Optiona
 def _build_token_search_clause(q: str, params: List[Any]) -> Optional[str]:
     """
     Tukeldab otsingu sonadeks (whitespace jargi) ja tagastab SQL tingimuse,
-    mis nouab, et IGA sona esineks kas:
-      - toote enda otsingutekstis (p.search_text = name + brand), VOI
-      - grupi otsingutekstis (pg.search_text = canonical_name + kureeritud brand)
+    mis nouab, et IGA sona esineks otsingudokumendis (d.search_text =
+    koigi grupi liikmete name + brand ning grupi canonical_name +
+    kureeritud brand, unaccent + lower).
 
     Sonade jarjekord ei loe ja iga sona voib tabada erinevat valja.
     See lahendab nt "kreeka proteiini" (sonad vastupidises jarjekorras nimes)
     ja "kreeka alma" (Alma on brand valjas, mitte name valjas) otsingud.
 
-    Eeldab, et paring kasutab aliaseid "p" (products) ja "pg" (product_groups),
-    ning et migration_search_text.sql on eelnevalt kaivitatud (search_text
-    veerud olemas).
+    Eeldab, et paring kasutab aliast "d" (product_search_docs, vt
+    migrations/2026-10-16-product-search-docs.sql). search_text-il on
+    trigrammi GIN-indeks, nii et iga sona ILIKE kasutab indeksit.
 
     Tagastab None, kui parast tukeldamist ei jaa uhtegi kasutatavat (>=2
     tahemargiga) sona jarele - sel juhul ei tohiks paringut uldse kaivitada.
@@ -264,111 +154,77 @@ def _build_token_search_clause(q: str, params: List[Any]) -> Optional[str]:
     if not tokens:
         return None
 
-    params.append(tokens)
-    idx = len(params)
+    # Iga sona eraldi tingimusena (mitte unnest), et planeerija naeks
+    # konstantseid mustreid ja saaks trigrammiindeksi tingimusi uhendada.
+    parts = []
+    for tok in tokens:
+        params.append(tok)
+        parts.append(f"d.search_text ILIKE '%' || lower(unaccent(${len(params)})) || '%'")
+    return "(" + " AND ".join(parts) + ")"
 
-    return f"""
-        NOT EXISTS (
-            SELECT 1 FROM unnest(${idx}::text[]) AS tok
-            WHERE NOT (
-                COALESCE(p.search_text, '') ILIKE '%' || lower(unaccent(tok)) || '%'
-                OR COALESCE(pg.search_text, '') ILIKE '%' || lower(unaccent(tok)) || '%'
-            )
-        )
-    """
 
+# Toode on nahtav, kui mone grupi liikme viimane hind on alla 14 paeva vana.
+DOC_FRESHNESS_FILTER = "d.last_price_at > NOW() - INTERVAL '14 days'"
 
-SOURCE_PRIORITY_SQL = """
-    CASE
-        WHEN p.source_url ILIKE '%prisma%'                             THEN 1
-        WHEN p.source_url ILIKE '%selver%'                             THEN 2
-        WHEN p.source_url ILIKE '%rimi%'                               THEN 3
-        WHEN p.source_url ILIKE '%barbora%'
-          OR p.source_url ILIKE '%maxima%'                             THEN 4
-        WHEN p.source_url ILIKE '%ecoop%'
-          OR (p.source_url ILIKE '%coop%'
-              AND p.source_url NOT ILIKE '%wolt%')                     THEN 5
-        WHEN p.source_url ILIKE '%wolt%'                               THEN 6
-        WHEN p.source_url IS NULL OR p.source_url = ''                 THEN 7
-        ELSE 8
-    END
-"""
-
-
-def _build_dedup_sql(where_sql: str) -> str:
-    if where_sql.strip().upper().startswith("WHERE"):
-        combined_where = f"{where_sql} AND {PRICE_FRESHNESS_FILTER}"
-    else:
-        combined_where = f"WHERE {PRICE_FRESHNESS_FILTER}"
 
-    return f"""
-        WITH base AS (
-            SELECT DISTINCT ON (COALESCE(pgm.group_id::text, 'u_' || p.id::text))
-                p.*,
-                pgm.group_id,
-                COALESCE(pgm.group_id::text, 'u_' || p.id::text) AS dedup_key
-            FROM products p
-            LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
-            LEFT JOIN product_groups pg ON pg.id = pgm.group_id
-            {combined_where}
-            ORDER BY
-                COALESCE(pgm.group_id::text, 'u_' || p.id::text),
-                {SOURCE_PRIORITY_SQL},
-                CASE WHEN p.image_url IS NOT NULL AND p.image_url != '' THEN 0 ELSE 1 END,
-                CASE WHEN p.ean      IS NOT NULL AND p.ean      != '' THEN 0 ELSE 1 END,
-                p.id
-        )
-        SELECT b.*, gc.chains AS available_chains, gc.min_price,
-               pg.canonical_name, pg.brand AS group_brand
-        FROM base b
-        LEFT JOIN mv_group_chains gc ON gc.dedup_key = b.dedup_key
-        LEFT JOIN product_groups pg ON pg.id = b.group_id
+def _build_docs_sql(where: List[str], order_sql: str, paging_sql: str,
+                    user_param_index: Optional[int] = None,
+                    rank_sql: Optional[str] = None) -> str:
     """
+    /products ja /products/search paring product_search_docs peal.
 
+    Dokumenditabel hoiab iga dedup-votme (grupp voi 'u_<id>') kohta juba
+    valitud esindajatoodet (allika prioriteet, pilt, EAN), kategooriat,
+    ketid ja min_price'i, nii et DISTINCT ON + mv_group_chains JOIN
+    paringu ajal ara jaab. Lehekulg (WHERE + ORDER + LIMIT) valitakse
+    dokumentidest, products JOIN tehakse ainult lehe ridadele.
 
-def _build_personalized_sql(where_sql: str, user_param_index: int) -> str:
-    if where_sql.strip().upper().startswith("WHERE"):
-        combined_where = f"{where_sql} AND {PRICE_FRESHNESS_FILTER}"
+    where / order_sql kasutavad aliast "d"; sama order_sql rakendub ka
+    valimises paringus, sest leht kannab samuti nime "d". rank_sql
+    (relevantsuse CASE) tagastatakse veeruna relevance_rank kursori jaoks.
+    """
+    where_sql = " AND ".join([DOC_FRESHNESS_FILTER] + where)
+
+    if user_param_index is not None:
+        # user_group_selections: kasutaja valikud juba dedup-votme kaupa
+        # kokku loetud (api/selections.py record_selection hoiab jooksvalt).
+        docs_cte = f"""
+        docs AS (
+            SELECT psd.*, COALESCE(ugs.count, 0) AS selection_count
+            FROM product_search_docs psd
+            LEFT JOIN user_group_selections ugs
+                   ON ugs.user_id = ${user_param_index}
+                  AND ugs.dedup_key = psd.dedup_key
+        ),"""
+        extra_cols = ", d.selection_count"
     else:
-        combined_where = f"WHERE {PRICE_FRESHNESS_FILTER}"
+        docs_cte = """
+        docs AS (
+            SELECT psd.* FROM product_search_docs psd
+        ),"""
+        extra_cols = ""
+    if rank_sql:
+        extra_cols += f", {rank_sql} AS relevance_rank"
 
     return f"""
-        WITH selection_totals AS (
-            SELECT
-                COALESCE(pgm.group_id::text, 'u_' || ups.product_id::text) AS dedup_key,
-                SUM(ups.count) AS selection_count
-            FROM user_product_selections ups
-            LEFT JOIN product_group_members pgm ON pgm.product_id = ups.product_id
-            WHERE ups.user_id = ${user_param_index}
-            GROUP BY COALESCE(pgm.group_id::text, 'u_' || ups.product_id::text)
-        ),
-        base AS (
-            SELECT DISTINCT ON (COALESCE(pgm.group_id::text, 'u_' || p.id::text))
-                p.*,
-                pgm.group_id,
-                COALESCE(pgm.group_id::text, 'u_' || p.id::text) AS dedup_key
-            FROM products p
-            LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
-            LEFT JOIN product_groups pg ON pg.id = pgm.group_id
-            {combined_where}
-            ORDER BY
-                COALESCE(pgm.group_id::text, 'u_' || p.id::text),
-                {SOURCE_PRIORITY_SQL},
-                CASE WHEN p.image_url IS NOT NULL AND p.image_url != '' THEN 0 ELSE 1 END,
-                CASE WHEN p.ean      IS NOT NULL AND p.ean      != '' THEN 0 ELSE 1 END,
-                p.id
+        WITH {docs_cte}
+        d AS (
+            SELECT d.*
+            FROM docs d
+            WHERE {where_sql}
+            {order_sql}
+            {paging_sql}
         )
-        SELECT b.*, COALESCE(st.selection_count, 0) AS selection_count,
-               gc.chains AS available_chains, gc.min_price,
-               pg.canonical_name, pg.brand AS group_brand
-        FROM base b
-        LEFT JOIN selection_totals st ON st.dedup_key = b.dedup_key
-        LEFT JOIN mv_group_chains gc ON gc.dedup_key = b.dedup_key
-        LEFT JOIN product_groups pg ON pg.id = b.group_id
+        SELECT p.*, d.group_id, d.dedup_key,
+               d.chains AS available_chains, d.min_price,
+               d.canonical_name, d.group_brand, d.display_name{extra_cols}
+        FROM d
+        JOIN products p ON p.id = d.product_id
+        {order_sql}
     """
 
 
-def _relevance_order_clause(q_norm_param: int) -> str:
+def _relevance_rank_sql(q_norm_param: int) -> str:
     """
     Lihtne relevantsuse jarjestus kui otsingusona on olemas:
     0 = tapne vaste canonical_name/name-le
@@ -377,16 +233,185 @@ def _relevance_order_clause(q_norm_param: int) -> str:
     3 = koik muu (tabas mone sona kuskil), tahestikuline jarjekord
     """
     return f"""
-        ORDER BY
             CASE
-                WHEN lower(COALESCE(NULLIF(canonical_name, ''), name)) = ${q_norm_param} THEN 0
-                WHEN lower(COALESCE(NULLIF(canonical_name, ''), name)) LIKE ${q_norm_param} || '%' THEN 1
-                WHEN lower(COALESCE(group_brand, '')) = ${q_norm_param} THEN 2
+                WHEN lower(d.display_name) = ${q_norm_param} THEN 0
+                WHEN lower(d.display_name) LIKE ${q_norm_param} || '%' THEN 1
+                WHEN lower(COALESCE(d.group_brand, '')) = ${q_norm_param} THEN 2
                 ELSE 3
-            END,
-            COALESCE(NULLIF(canonical_name, ''), name),
-            id
+            END"""
+
+
+def _relevance_order_clause(q_norm_param: int) -> str:
+    return f"ORDER BY {_relevance_rank_sql(q_norm_param)}, d.display_name, d.product_id"
+
+
+# ---------------------------------------------------------------------
+# Keyset-lehitsemine (/products?cursor=...)
+#
+# OFFSET sunnib Postgresi iga "lae veel" korral koik eelnevad read uuesti
+# valja arvutama ja ara viskama - sugaval lehel suurtes kategooriates
+# laks iga leht aeglasemaks. Kursor kannab eelmise lehe viimase rea
+# sorteerimisvotit ja jargmine leht algab WHERE (voti) > (kursor)
+# tingimusega, nii et lehe hind ei soltu sugavusest.
+#
+# Iga jarjestus = valikuline "pea" veerg + alati (display_name, product_id)
+# (product_id teeb votme unikaalseks). Pea: (SQL avaldis, tuup, DESC,
+# NULLS LAST). Kursor on base64url JSON {"m": rezhiim, "k": [vaartused]};
+# klient kasitleb seda labipaistmatuna.
+# ---------------------------------------------------------------------
+_KeysetHead = Tuple[str, str, bool, bool]
+
+_KEYSET_HEADS: Dict[str, Optional[_KeysetHead]] = {
+    "name": None,
+    "price_asc": ("d.min_price", "numeric", False, True),
+    "price_desc": ("d.min_price", "numeric", True, True),
+    "selection": ("d.selection_count", "bigint", True, False),
+    "relevance": ("", "int", False, False),   # avaldis = _relevance_rank_sql(...)
+}
+
+
+def _keyset_order_clause(head: Optional[_KeysetHead]) -> str:
+    if head is None:
+        return "ORDER BY d.display_name, d.product_id"
+    expr, _, desc, nullable = head
+    direction = " DESC" if desc else ""
+    nulls = " NULLS LAST" if nullable else ""
+    return f"ORDER BY {expr}{direction}{nulls}, d.display_name, d.product_id"
+
+
+def _keyset_clause(head: Optional[_KeysetHead], key: List[Any], params: List[Any]) -> str:
+    """WHERE tingimus: read, mis tulevad jarjestuses parast kursorit."""
+    params.append(key[-2])
+    params.append(key[-1])
+    tail = f"(d.display_name, d.product_id) > (${len(params) - 1}::text, ${len(params)}::int)"
+    if head is None:
+        return tail
+    expr, cast, desc, nullable = head
+    value = key[0]
+    if value is None:
+        # NULLS LAST: tyhja vaartuse jarel tulevad ainult teised tyhjad.
+        return f"({expr} IS NULL AND {tail})"
+    params.append(value)
+    ref = f"${len(params)}::{cast}"
+    after = f"{expr} {'<' if desc else '>'} {ref}"
+    if nullable:
+        after = f"{after} OR {expr} IS NULL"
+    return f"({after} OR ({expr} = {ref} AND {tail}))"
+
+
+def _encode_cursor(mode: str, key: List[Any]) -> str:
+    raw = json.dumps({"m": mode, "k": key}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, mode: str) -> List[Any]:
+    """Kontrollib, et kursor on sama jarjestuse oma, ja taastab tuubid."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = list(data["k"])
+        if data["m"] != mode:
+            raise ValueError("sort changed")
+        has_head = _KEYSET_HEADS[mode] is not None
+        if len(key) != (3 if has_head else 2):
+            raise ValueError("bad key")
+        key[-2] = str(key[-2])
+        key[-1] = int(key[-1])
+        if has_head and key[0] is not None:
+            key[0] = Decimal(str(key[0])) if mode.startswith("price") else int(key[0])
+        return key
+    except (ValueError, TypeError, KeyError, InvalidOperation):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _cursor_key(mode: str, row: Dict[str, Any]) -> List[Any]:
+    tail = [row.get("display_name"), row.get("id")]
+    if mode == "name":
+        return tail
+    head = {
+        "price_asc": "min_price",
+        "price_desc": "min_price",
+        "selection": "selection_count",
+        "relevance": "relevance_rank",
+    }[mode]
+    return [row.get(head)] + tail
+
+
+def _alternative_key(row: Any) -> str:
+    # Sama dedup_key kuju mis alternatiivide paringutes.
+    return str(row["group_id"]) if row["group_id"] is not None else f"u_{row['id']}"
+
+
+async def _precomputed_alternatives(
+    conn, dedup_key: str, store_id: int, limit: int, family: Optional[str]
+) -> Optional[List[Any]]:
     """
+    /products/alternatives eelarvutatud naabritest (product_alternatives,
+    vt migrations/2026-10-16-product-alternatives.sql). Tagastab samad
+    veerud mis otsene paring, voi None, kui originaalile pole naabreid
+    ehitatud voi need ehitati teise tooteperekonnaga - siis kasutab
+    kutsuja otsest paringut (ka siis, kui hinnaga naabreid on alla limit).
+
+    Naabrite jarjestus (similarity) on juba arvutatud; siin leitakse
+    ainult iga naabri odavaim liige poe hinnaallikas (store_effective_source,
+    7 paeva aken nagu otseses paringus).
+    """
+    built = await conn.fetchrow(
+        "SELECT family FROM product_alternatives WHERE dedup_key = $1 AND rank = 1",
+        dedup_key,
+    )
+    if built is None or built["family"] != family:
+        return None
+
+    return await conn.fetch("""
+        WITH effective_source AS (
+            SELECT COALESCE(
+                (SELECT source_store_id FROM store_effective_source WHERE store_id = $2::int),
+                $2::int
+            ) AS source_store_id
+        ),
+        alts AS (
+            SELECT rank, similarity, alt_group_id, alt_product_id
+            FROM product_alternatives
+            WHERE dedup_key = $1
+        ),
+        members AS (
+            SELECT a.rank, a.similarity, a.alt_group_id, pgm.product_id
+            FROM alts a
+            JOIN product_group_members pgm ON pgm.group_id = a.alt_group_id
+            UNION ALL
+            SELECT a.rank, a.similarity, NULL::int, a.alt_product_id
+            FROM alts a
+            WHERE a.alt_group_id IS NULL
+        ),
+        priced AS (
+            SELECT DISTINCT ON (m.rank)
+                m.rank, m.similarity, m.alt_group_id, m.product_id, cp.effective_price
+            FROM members m
+            JOIN current_prices cp
+              ON cp.product_id = m.product_id
+             AND cp.store_id = (SELECT source_store_id FROM effective_source)
+            WHERE cp.price > 0
+              AND cp.collected_at > NOW() - INTERVAL '7 days'
+            ORDER BY m.rank, cp.effective_price ASC, m.product_id
+        )
+        SELECT
+            p.id,
+            p.name,
+            p.brand,
+            p.size_text,
+            p.image_url,
+            COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) AS sub_code,
+            pr.alt_group_id AS group_id,
+            pg.canonical_name,
+            pg.brand AS group_brand,
+            pr.effective_price AS price,
+            pr.similarity AS similarity_score
+        FROM priced pr
+        JOIN products p ON p.id = pr.product_id
+        LEFT JOIN product_groups pg ON pg.id = pr.alt_group_id
+        ORDER BY pr.similarity DESC, pr.effective_price ASC, p.name ASC
+        LIMIT $3
+    """, dedup_key, store_id, limit)
 
 
 @router.get("/products/alternatives")
@@ -421,7 +446,8 @@ async def get_alternatives(
             # ei leidnud paring midagi ja tagastas tuhja tulemuse, isegi
             # kui toode ja sub_code on olemas.
             sub_code_row = await conn.fetchrow("""
-                SELECT COALESCE(NULLIF(TRIM(pg.sub_code), ''), NULLIF(TRIM(p.sub_code), '')) AS sub_code
+                SELECT COALESCE(NULLIF(TRIM(pg.sub_code), ''), NULLIF(TRIM(p.sub_code), '')) AS sub_code,
+                       COALESCE(pgm.group_id::text, 'u_' || p.id::text) AS dedup_key
                 FROM products p
                 LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
                 LEFT JOIN product_groups pg ON pg.id = pgm.group_id
@@ -449,11 +475,11 @@ async def get_alternatives(
             # tooteperekonna otse KLIENDI antud product_name pohjal (mitte
             # DB-st tagasi loetud nimest - lihtsam ja piisav, kuna
             # product_name ONGI see, mille jargi kasutaja midagi otsib).
-            family = _detect_produce_family(product_name)
+            family = detect_produce_family(product_name)
             apply_family_filter = (
                 family is not None and sub_code in ALTERNATIVE_FAMILY_FILTER_SUB_CODES
             )
-            family_patterns = _family_ilike_patterns(family) if apply_family_filter else None
+            family_patterns = family_ilike_patterns(family) if apply_family_filter else None
 
             # v6 fix (ChatGPT leid): word_similarity() peab kasutama PUHAST
             # vordlusteksti, mitte kogu product_name't (mis sisaldab brandi/
@@ -461,10 +487,20 @@ async def get_alternatives(
             # vale kandidaadi kasuks). Kui family tuvastati, kasutame
             # perekonna pohimarksona (nt "tomat"), mitte tervet nime.
             similarity_query = (
-                _FAMILY_KEYWORDS_BY_NAME[family][0] if apply_family_filter else product_name
+                FAMILY_KEYWORDS_BY_NAME[family][0] if apply_family_filter else product_name
             )
 
-            # 2. Leia selle poe tooted samast sub_code'ist.
+            # 2a. Eelarvutatud naabrid (scripts/build_product_alternatives.py):
+            #     ainult K naabri hinnad selle poe allikas. Kui originaalil
+            #     naabreid pole, need ehitati teise perekonnaga voi neist
+            #     on selles poes hinnaga alla `limit`, taidetakse loend
+            #     allolevast otsesest paringust.
+            rows = await _precomputed_alternatives(
+                conn, sub_code_row["dedup_key"], store_id, limit,
+                family if apply_family_filter else None,
+            )
+
+            # 2b. Leia selle poe tooted samast sub_code'ist.
             #
             # v2 fix (ChatGPT leid, august 2026): varem kusiti otse
             # "pr.store_id = $2" (fuusilise poe ID), mis eeldas, et
@@ -479,11 +515,11 @@ async def get_alternatives(
             # allikas (Barbora, store_id=441) oli paevakohaselt varske.
             #
             # Parandus: sama "effective_source" muster, mida
-            # services/compare_service.py _latest_prices() juba
+            # services/compare_service.py _effective_sources() juba
             # kasutab - COALESCE(store_price_source.source_store_id,
-            # fuusiline_store_id). See on query-time mapping, mitte
-            # andmete dubleerimine, seega pole vaja mingit
-            # sunkroniseerimist ega backfilli.
+            # fuusiline_store_id), nuud store_effective_source tabelist
+            # (trigerid hoiavad seda store_price_source'iga sunkroonis,
+            # vt migrations/2026-10-16-store-effective-source.sql).
             #
             # v3 fix (ChatGPT teine leid): esialgne v2 patch valis
             # DISTINCT ON + ORDER BY price ASC abil 7-paeva akna
@@ -529,66 +565,69 @@ async def get_alternatives(
             #    family tuvastati - kui perekonda ei tuvastatud, on
             #    kaitumine fail-open (vana sub_code-pohine kaitumine,
             #    nyyd similarity jargi jarjestatuna).
-            rows = await conn.fetch("""
-                WITH effective_source AS (
-                    SELECT COALESCE(sps.source_store_id, $2::int) AS source_store_id
-                    FROM (SELECT $2::int AS store_id) s
-                    LEFT JOIN (
-                        SELECT DISTINCT ON (store_id) store_id, source_store_id
-                        FROM store_price_source
-                        ORDER BY store_id, source_store_id
-                    ) sps ON sps.store_id = s.store_id
-                ),
-                latest_prices AS (
-                    SELECT DISTINCT ON (pr.product_id)
-                        pr.product_id,
-                        COALESCE(NULLIF(pr.promo_price, 0), pr.price) AS effective_price,
-                        pr.collected_at
-                    FROM prices pr
-                    WHERE pr.store_id = (SELECT source_store_id FROM effective_source)
-                      AND pr.price > 0
-                      AND pr.collected_at > NOW() - INTERVAL '7 days'
-                    ORDER BY pr.product_id, pr.collected_at DESC, pr.id DESC
-                ),
-                candidates AS (
-                    SELECT DISTINCT ON (COALESCE(pgm.group_id::text, 'u_' || p.id::text))
-                        p.id,
-                        p.name,
-                        p.brand,
-                        p.size_text,
-                        p.image_url,
-                        COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) AS sub_code,
-                        pgm.group_id,
-                        pg.canonical_name,
-                        pg.brand AS group_brand,
-                        lp.effective_price AS price,
-                        word_similarity(
-                            unaccent(lower($4)),
-                            unaccent(lower(COALESCE(NULLIF(pg.canonical_name, ''), p.name)))
-                        ) AS similarity_score
-                    FROM products p
-                    JOIN latest_prices lp ON lp.product_id = p.id
-                    LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
-                    LEFT JOIN product_groups pg ON pg.id = pgm.group_id
-                    WHERE COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) = $1
-                      AND (
-                            $5::text[] IS NULL
-                            OR p.name ILIKE ANY($5::text[])
-                            OR pg.canonical_name ILIKE ANY($5::text[])
-                          )
-                    ORDER BY
-                        COALESCE(pgm.group_id::text, 'u_' || p.id::text),
-                        word_similarity(
-                            unaccent(lower($4)),
-                            unaccent(lower(COALESCE(NULLIF(pg.canonical_name, ''), p.name)))
-                        ) DESC,
-                        lp.effective_price ASC,
-                        p.id
-                )
-                SELECT * FROM candidates
-                ORDER BY similarity_score DESC, price ASC, name ASC
-                LIMIT $3
-            """, sub_code, store_id, limit, similarity_query, family_patterns)
+            if rows is None or len(rows) < limit:
+                precomputed = list(rows or [])
+                live = await conn.fetch("""
+                    WITH effective_source AS (
+                        SELECT COALESCE(
+                            (SELECT source_store_id FROM store_effective_source WHERE store_id = $2::int),
+                            $2::int
+                        ) AS source_store_id
+                    ),
+                    latest_prices AS (
+                        SELECT
+                            pr.product_id,
+                            pr.effective_price,
+                            pr.collected_at
+                        FROM current_prices pr
+                        WHERE pr.store_id = (SELECT source_store_id FROM effective_source)
+                          AND pr.price > 0
+                          AND pr.collected_at > NOW() - INTERVAL '7 days'
+                    ),
+                    candidates AS (
+                        SELECT DISTINCT ON (COALESCE(pgm.group_id::text, 'u_' || p.id::text))
+                            p.id,
+                            p.name,
+                            p.brand,
+                            p.size_text,
+                            p.image_url,
+                            COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) AS sub_code,
+                            pgm.group_id,
+                            pg.canonical_name,
+                            pg.brand AS group_brand,
+                            lp.effective_price AS price,
+                            word_similarity(
+                                unaccent(lower($4)),
+                                unaccent(lower(COALESCE(NULLIF(pg.canonical_name, ''), p.name)))
+                            ) AS similarity_score
+                        FROM products p
+                        JOIN latest_prices lp ON lp.product_id = p.id
+                        LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
+                        LEFT JOIN product_groups pg ON pg.id = pgm.group_id
+                        WHERE COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) = $1
+                          AND (
+                                $5::text[] IS NULL
+                                OR p.name ILIKE ANY($5::text[])
+                                OR pg.canonical_name ILIKE ANY($5::text[])
+                              )
+                        ORDER BY
+                            COALESCE(pgm.group_id::text, 'u_' || p.id::text),
+                            word_similarity(
+                                unaccent(lower($4)),
+                                unaccent(lower(COALESCE(NULLIF(pg.canonical_name, ''), p.name)))
+                            ) DESC,
+                            lp.effective_price ASC,
+                            p.id
+                    )
+                    SELECT * FROM candidates
+                    ORDER BY similarity_score DESC, price ASC, name ASC
+                    LIMIT $3
+                """, sub_code, store_id, limit + len(precomputed), similarity_query, family_patterns)
+                # Eelarvutatud naabrid ees, otsene paring taidab ulejaanud
+                # kohad (sama grupp / grupeerimata toode ainult uks kord).
+                seen = {_alternative_key(r) for r in precomputed}
+                rows = precomputed + [r for r in live if _alternative_key(r) not in seen]
+                rows = rows[:limit]
 
 
         items = []
@@ -629,6 +668,7 @@ async def get_alternatives(
 
 @router.get("/products")
 @throttle(limit=120, window=60)
+@catalog_cache("product_search_docs", "product_groups", private_if_authorized=True)
 async def list_products(
     request: Request,
     q: Optional[str] = Query("", description="Search by product name (token-based, order-independent)."),
@@ -638,9 +678,11 @@ async def list_products(
     sub_code: Optional[str] = Query(None),
     brand: Optional[str] = Query(None, description="Filter by curated product_groups.brand (exact match)."),
     sort: Optional[str] = Query(None, description="Sort order: price_asc | price_desc"),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from the previous page (replaces offset)."),
     authorization: Optional[str] = Header(None),
 ) -> Dict[str, Any]:
     limit = min(limit, MAX_LIMIT)
+    cursor = (cursor or "").strip() or None
     q = (q or "").strip()
     main_code = (main_code or "").strip() or None
     sub_code = (sub_code or "").strip() or None
@@ -654,20 +696,20 @@ async def list_products(
 
     if sub_code:
         params.append(sub_code)
-        # Kasuta kureeritud grupikategooriat (pg.sub_code) grupeeritud toodetel,
-        # grupeerimata toodetel p.sub_code. NULLIF(TRIM(...)) tagab, et tuhi
-        # string voi tuhikud grupi valjal langevad samuti tagasi p.sub_code peale.
+        # d.category_code = COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code):
+        # kureeritud grupikategooria grupeeritud toodetel, grupeerimata
+        # toodetel p.sub_code (arvutatud dokumendi ehitamisel).
         # Nii pohineb /products sama kategooriaallikal kui /products/brands.
-        where.append(f"COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) = ${len(params)}")
+        where.append(f"d.category_code = ${len(params)}")
     elif main_code:
         params.append(main_code)
-        where.append(f"p.food_group = ${len(params)}")
+        where.append(f"d.food_group = ${len(params)}")
 
-    # Brandifilter -- tapne vaste kureeritud product_groups.brand valjale.
-    # pg on skoobis base CTE-s (LEFT JOIN product_groups pg).
+    # Brandifilter -- tapne vaste kureeritud product_groups.brand valjale
+    # (d.group_brand = NULLIF(TRIM(pg.brand), '')).
     if brand:
         params.append(brand)
-        where.append(f"TRIM(pg.brand) = ${len(params)}")
+        where.append(f"d.group_brand = ${len(params)}")
 
     q_norm = None
     if q:
@@ -679,53 +721,56 @@ async def list_products(
             # Koik sonad liiga luhikesed (alla 2 tahemargi) - ei tagasta midagi.
             where.append("FALSE")
 
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-    # Sorteerimise ORDER BY klausel
-    if sort == "price_asc":
-        price_order_clause = "ORDER BY min_price ASC NULLS LAST, COALESCE(NULLIF(canonical_name, ''), name), id"
-    elif sort == "price_desc":
-        price_order_clause = "ORDER BY min_price DESC NULLS LAST, COALESCE(NULLIF(canonical_name, ''), name), id"
-    else:
-        price_order_clause = None  # kasutame allpool vaikimisi jarjestust
-
     try:
         async with pool.acquire() as conn:
             user_id = await _get_user_id_from_token(conn, authorization)
 
-            if user_id and not sort:
-                # Personaliseeritud jarjestus ainult siis kui sort pole maaratud
-                user_param_index = len(params) + 1
-                params_for_query = params + [user_id]
-                dedup_sql = _build_personalized_sql(where_sql, user_param_index)
-                order_clause = "ORDER BY selection_count DESC, COALESCE(NULLIF(canonical_name, ''), name), id"
-            elif price_order_clause:
-                params_for_query = params
-                dedup_sql = _build_dedup_sql(where_sql)
-                order_clause = price_order_clause
+            # Jarjestuse rezhiim: sort > personaliseeritud (ainult kui sort
+            # pole maaratud) > otsingu relevantsus > tahestik.
+            user_param_index = None
+            rank_sql = None
+            params_for_query = list(params)
+            if sort in ("price_asc", "price_desc"):
+                mode = sort
+            elif user_id and not sort:
+                mode = "selection"
+                params_for_query.append(user_id)
+                user_param_index = len(params_for_query)
             elif q_norm:
                 # Otsingu relevantsuse jarjestus (tapne vaste / algab sonaga / muu)
-                params_for_query = params + [q_norm]
-                q_norm_param = len(params_for_query)
-                dedup_sql = _build_dedup_sql(where_sql)
-                order_clause = _relevance_order_clause(q_norm_param)
+                mode = "relevance"
+                params_for_query.append(q_norm)
+                rank_sql = _relevance_rank_sql(len(params_for_query))
             else:
-                params_for_query = params
-                dedup_sql = _build_dedup_sql(where_sql)
-                order_clause = "ORDER BY COALESCE(NULLIF(canonical_name, ''), name), id"
+                mode = "name"
+
+            head = _KEYSET_HEADS[mode]
+            if rank_sql:
+                head = (rank_sql,) + head[1:]
+            order_clause = _keyset_order_clause(head)
+
+            page_where = list(where)
+            if cursor:
+                page_where.append(
+                    _keyset_clause(head, _decode_cursor(cursor, mode), params_for_query)
+                )
 
             fetch_limit = limit + 1
-            params_with_paging = params_for_query + [fetch_limit, offset]
-            limit_param = len(params_for_query) + 1
-            offset_param = len(params_for_query) + 2
-
-            data_sql = (
-                f"SELECT * FROM ({dedup_sql}) AS deduped\n"
-                f"{order_clause}\n"
-                f"LIMIT ${limit_param} OFFSET ${offset_param}"
+            params_for_query.append(fetch_limit)
+            paging_sql = f"LIMIT ${len(params_for_query)}"
+            if not cursor:
+                params_for_query.append(offset)
+                paging_sql += f" OFFSET ${len(params_for_query)}"
+
+            data_sql = _build_docs_sql(
+                page_where,
+                order_clause,
+                paging_sql,
+                user_param_index,
+                rank_sql,
             )
 
-            rows = await conn.fetch(data_sql, *params_with_paging)
+            rows = await conn.fetch(data_sql, *params_for_query)
 
         has_more = len(rows) > limit
         rows = rows[:limit]
@@ -737,7 +782,9 @@ async def list_products(
             "limit": limit,
             "count": len(items),
             "has_more": has_more,
-            "next_offset": offset + len(items) if has_more else None,
+            "next_offset": offset + len(items) if has_more and not cursor else None,
+            # Eelistatud "lae veel" viis: lehe hind ei kasva sugavusega.
+            "next_cursor": _encode_cursor(mode, _cursor_key(mode, dict(rows[-1]))) if has_more else None,
             "filters": {
                 "q": q or None,
                 "main_code": main_code,
@@ -747,12 +794,15 @@ async def list_products(
             },
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"List products error: {e}")
 
 
 @router.get("/products/brands")
 @throttle(limit=120, window=60)
+@catalog_cache("product_search_docs", "product_groups")
 async def list_category_brands(
     request: Request,
     sub_code: str = Query(..., min_length=1, description="Category sub_code to list brands for."),
@@ -795,42 +845,35 @@ async def list_category_brands(
         }
 
     # 2. Nahtavate gruppide + brandide loendus (ainult grupid elus hinnaga).
-    #    EXISTS valdib mv_group_chains JOIN-i keti-duplikaate; koik loendused
-    #    kaivad COUNT(DISTINCT pg.id) jargi.
+    #    product_search_docs-is on iga grupi kohta tapselt uks rida
+    #    (dedup_key = grupi id), min_price tuleb mv_group_chains'ist --
+    #    COUNT(*) piisab, keti-duplikaate pole.
     try:
         async with pool.acquire() as conn:
             totals_row = await conn.fetchrow(
                 """
                 SELECT
-                    COUNT(DISTINCT pg.id) AS total_groups,
-                    COUNT(DISTINCT pg.id)
-                        FILTER (WHERE NULLIF(TRIM(pg.brand), '') IS NOT NULL)
-                        AS branded_groups
-                FROM product_groups pg
-                WHERE pg.sub_code = $1
-                  AND EXISTS (
-                        SELECT 1 FROM mv_group_chains mgc
-                        WHERE mgc.dedup_key = pg.id::text
-                          AND mgc.min_price IS NOT NULL
-                  )
+                    COUNT(*) AS total_groups,
+                    COUNT(*) FILTER (WHERE d.group_brand IS NOT NULL) AS branded_groups
+                FROM product_search_docs d
+                WHERE d.group_id IS NOT NULL
+                  AND d.group_sub_code = $1
+                  AND d.min_price IS NOT NULL
                 """,
                 sub_code,
             )
 
             brand_rows = await conn.fetch(
                 """
-                SELECT TRIM(pg.brand) AS brand,
-                       COUNT(DISTINCT pg.id) AS group_count
-                FROM product_groups pg
-                WHERE pg.sub_code = $1
-                  AND NULLIF(TRIM(pg.brand), '') IS NOT NULL
-                  AND EXISTS (
-                        SELECT 1 FROM mv_group_chains mgc
-                        WHERE mgc.dedup_key = pg.id::text
-                          AND mgc.min_price IS NOT NULL
-                  )
-                GROUP BY TRIM(pg.brand)
-                ORDER BY group_count DESC, TRIM(pg.brand) ASC
+                SELECT d.group_brand AS brand,
+                       COUNT(*) AS group_count
+                FROM product_search_docs d
+                WHERE d.group_id IS NOT NULL
+                  AND d.group_sub_code = $1
+                  AND d.group_brand IS NOT NULL
+                  AND d.min_price IS NOT NULL
+                GROUP BY d.group_brand
+                ORDER BY group_count DESC, d.group_brand ASC
                 """,
                 sub_code,
             )
@@ -894,6 +937,14 @@ async def search_products(
     if not q:
         raise HTTPException(status_code=422, detail="Search query cannot be empty")
 
+    # Typeahead: protsessisisene indeks (services/search_index.py) vastab
+    # ilma DB uhenduseta; SQL-rada jaab tagavaraks, kuni indeks pole laetud.
+    index = get_search_index()
+    if SEARCH_INDEX_ENABLED and index.ready:
+        rows = index.search(q, limit, sub_code.strip() if sub_code else None)
+        items = [_row_to_safe_product(r) for r in rows]
+        return {"items": items, "count": len(items), "q": q}
+
     pool = await _get_pool(request)
 
     params: List[Any] = []
@@ -908,10 +959,7 @@ async def search_products(
     if sub_code:
         params.append(sub_code.strip())
         # Sama kategooriaallikas kui /products ja /products/brands.
-        where_parts.append(f"COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code) = ${len(params)}")
-
-    where_sql = "WHERE " + " AND ".join(where_parts)
-    dedup_sql = _build_dedup_sql(where_sql)
+        where_parts.append(f"d.category_code = ${len(params)}")
 
     q_norm = " ".join(q.lower().split())
     params.append(q_norm)
@@ -920,13 +968,11 @@ async def search_products(
     params.append(limit)
     limit_param = len(params)
 
-    order_clause = _relevance_order_clause(q_norm_param)
-
-    sql = f"""
-        SELECT * FROM ({dedup_sql}) AS deduped
-        {order_clause}
-        LIMIT ${limit_param}
-    """
+    sql = _build_docs_sql(
+        where_parts,
+        _relevance_order_clause(q_norm_param),
+        f"LIMIT ${limit_param}",
+    )
 
     try:
         async with pool.acquire() as conn:
@@ -939,8 +985,49 @@ async def search_products(
         raise HTTPException(status_code=500, detail=f"Search products error: {e}")
 
 
+@router.get("/products/batch")
+@throttle(limit=120, window=60)
+@catalog_cache("product_search_docs", "product_groups")
+async def get_products_batch(
+    request: Request,
+    ids: str = Query(..., description=f"Comma-separated product ids (max {MAX_BATCH_IDS})."),
+) -> Dict[str, Any]:
+    """
+    Mitme tootekaardi laadimine uhe paringuga (product_cards, vt
+    services/product_cards.py). Vastus on ids jarjekorras; olematud
+    id'd on `missing` loendis.
+    """
+    try:
+        product_ids = list(dict.fromkeys(int(x) for x in ids.split(",") if x.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="ids is empty")
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+    pool = await _get_pool(request)
+
+    try:
+        async with pool.acquire() as conn:
+            cards = await fetch_product_cards(conn, product_ids)
+
+        items = [_row_to_safe_product(cards[pid]) for pid in product_ids if pid in cards]
+        return {
+            "items": items,
+            "count": len(items),
+            "missing": [pid for pid in product_ids if pid not in cards],
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch products error: {e}")
+
+
 @router.get("/products/{product_id}")
 @throttle(limit=120, window=60)
+@catalog_cache("product_search_docs", "product_groups")
 async def get_product(
     request: Request,
     product_id: int,
@@ -949,27 +1036,12 @@ async def get_product(
 
     try:
         async with pool.acquire() as conn:
-            row = await conn.fetchrow("""
-                SELECT
-                    p.*,
-                    pgm.group_id,
-                    gc.chains AS available_chains,
-                    gc.min_price,
-                    pg.canonical_name,
-                    pg.brand AS group_brand
-                FROM products p
-                LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
-                LEFT JOIN mv_group_chains gc
-                    ON gc.dedup_key = COALESCE(pgm.group_id::text, 'u_' || p.id::text)
-                LEFT JOIN product_groups pg ON pg.id = pgm.group_id
-                WHERE p.id = $1
-                LIMIT 1
-            """, product_id)
+            row = (await fetch_product_cards(conn, [product_id])).get(product_id)
 
         if not row:
             raise HTTPException(status_code=404, detail="Product not found")
 
-        return _row_to_safe_product(dict(row))
+        return _row_to_safe_product(row)
 
     except HTTPException:
         raise
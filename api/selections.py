@@ -36,12 +36,35 @@ async def record_selection(
         if user_id is None:
             raise HTTPException(status_code=404, detail="User not found")
 
+        # Samas lauses suurendatakse ka toote grupi (voi 'u_<id>') loendurit
+        # user_group_selections tabelis, mida personaliseeritud /products
+        # loeb (vt migrations/2026-10-16-user-group-selections.sql).
         await conn.execute(
             """
-            INSERT INTO user_product_selections (user_id, product_id, count, last_used)
-            VALUES ($1, $2, 1, now())
-            ON CONFLICT (user_id, product_id) DO UPDATE
-              SET count     = user_product_selections.count + 1,
+            WITH sel AS (
+                INSERT INTO user_product_selections (user_id, product_id, count, last_used)
+                VALUES ($1, $2, 1, now())
+                ON CONFLICT (user_id, product_id) DO UPDATE
+                  SET count     = user_product_selections.count + 1,
+                      last_used = now()
+                RETURNING product_id
+            ),
+            keys AS (
+                SELECT pgm.group_id::text AS dedup_key
+                FROM sel
+                JOIN product_group_members pgm ON pgm.product_id = sel.product_id
+                UNION ALL
+                SELECT 'u_' || sel.product_id::text
+                FROM sel
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM product_group_members pgm WHERE pgm.product_id = sel.product_id
+                )
+            )
+            INSERT INTO user_group_selections AS ugs (user_id, dedup_key, count, last_used)
+            SELECT $1, k.dedup_key, 1, now()
+            FROM keys k
+            ON CONFLICT (user_id, dedup_key) DO UPDATE
+              SET count     = ugs.count + 1,
                   last_used = now()
             """,
             user_id,
@@ -6,6 +6,7 @@ import math
 
 from settings import get_db_pool
 from utils.throttle import throttle
+from services.store_index import get_store_index
 
 router = APIRouter(prefix="/stores", tags=["stores"])
 
@@ -30,9 +31,27 @@ async def nearby_stores(
 ):
     """
     Returns stores within radius_km, ordered by distance ASC.
-    Prefers Postgres cube+earthdistance with earth_box prefilter; falls back to earthdistance-only;
-    finally falls back to Python haversine with SQL bbox prefilter.
+    Served from the in-process store index (services/store_index.py) once it is loaded.
+    Until then: prefers Postgres cube+earthdistance with earth_box prefilter; falls back to
+    earthdistance-only; finally falls back to Python haversine with SQL bbox prefilter.
     """
+    index = get_store_index()
+    if index.ready:
+        hits = index.within(lat, lon, radius_km, physical_only=False)
+        hits.sort(key=lambda h: (h[1], h[0].id))
+        items = [
+            {
+                "id": e.id,
+                "name": e.name,
+                "chain": e.chain,
+                "lat": e.lat,
+                "lon": e.lon,
+                "distance_km": round(d, 2),
+            }
+            for e, d in hits[offset: offset + limit]
+        ]
+        return {"items": items, "offset": offset, "limit": limit}
+
     if pool is None:
         raise HTTPException(status_code=500, detail="DB not ready")
 
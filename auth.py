@@ -768,6 +768,7 @@ async def delete_user(request: Request, user=Depends(get_current_user)):
                 await conn.execute("DELETE FROM baskets WHERE user_id = $1", uid)
                 await conn.execute("DELETE FROM favourite_products WHERE user_id = $1", uid)
                 await conn.execute("DELETE FROM user_product_selections WHERE user_id = $1", uid)
+                await conn.execute("DELETE FROM user_group_selections WHERE user_id = $1", uid)
 
                 # --- Anonumiseeri users rida ---
                 # role = 'regular': role_check CHECK lubab AINULT
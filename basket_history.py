@@ -10,7 +10,7 @@ import uuid
 
 from auth import get_current_user
 from settings import get_db_pool
-from services.compare_service import compare_basket_service
+from services.compare_service import compare_basket_service, compare_baskets_service
 
 router = APIRouter(prefix="/basket-history", tags=["basket-history"])
 
@@ -83,6 +83,23 @@ def _call_compare(pool, items_dicts, lat, lon, radius_km, require_all=False):
     return compare_basket_service(pool, body)
 
 
+def _call_compare_batch(pool, baskets_items, lat, lon, radius_km, require_all=False):
+    """Mitu salvestatud korvi ühe asukoha jaoks ühe compare_baskets_service
+    kutsega — nimed, grupid ja hinnad laetakse kõigi korvide peale korraga."""
+    body = {
+        "baskets": [
+            {"items": items_dicts, "include_lines": False, "require_all_items": require_all}
+            for items_dicts in baskets_items
+        ],
+        "lat": float(lat),
+        "lon": float(lon),
+        "radius_km": float(radius_km),
+        "limit_stores": 50,
+        "offset_stores": 0,
+    }
+    return compare_baskets_service(pool, body)
+
+
 def _winner_total(store_dict: dict) -> float:
     v = store_dict.get("total_price") or store_dict.get("total")
     return float(v) if v is not None else float("inf")
@@ -168,6 +185,78 @@ async def list_baskets(
         raise HTTPException(status_code=500, detail=f"Failed to list baskets: {e}")
 
 
+# ---- CURRENT prices for saved baskets ----
+# Enne "/{basket_id}" marsruuti, et "current" ei läheks basket_id'ks.
+@router.get("/current")
+async def current_for_baskets(
+    lat: float = Query(...),
+    lon: float = Query(...),
+    radius_km: float = Query(10.0, ge=0.1, le=50.0),
+    limit: int = Query(10, ge=1, le=20),
+    user=Depends(get_current_user),
+    pool: asyncpg.pool.Pool = Depends(get_db_pool),
+):
+    """Viimased `limit` salvestatud korvi, igaüks võrreldud tänaste
+    hindadega antud asukohas — kõik ühe batch-võrdlusega."""
+    uid = await resolve_user_id(user, pool)
+    if not uid:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        async with pool.acquire() as conn:
+            heads = await conn.fetch(
+                """
+                SELECT id, created_at, winner_store_name,
+                       winner_total::float8 AS winner_total
+                FROM basket_history
+                WHERE user_id = $1::uuid
+                  AND deleted_at IS NULL
+                ORDER BY created_at DESC
+                LIMIT $2
+                """,
+                uid, limit,
+            )
+            ids = [h["id"] for h in heads]
+            items = await conn.fetch(
+                """
+                SELECT basket_id, product, quantity::float8 AS quantity
+                FROM basket_items
+                WHERE basket_id = ANY($1::int[])
+                ORDER BY basket_id, id
+                """,
+                ids,
+            ) if ids else []
+
+        items_by_basket: dict = {}
+        for r in items:
+            items_by_basket.setdefault(r["basket_id"], []).append(
+                {"product": r["product"], "quantity": int(r["quantity"]), "product_id": None}
+            )
+        heads = [h for h in heads if items_by_basket.get(h["id"])]
+        if not heads:
+            return []
+
+        currents = await _call_compare_batch(
+            pool, [items_by_basket[h["id"]] for h in heads], lat, lon, radius_km
+        )
+        return [
+            {
+                "id": h["id"],
+                "created_at": h["created_at"],
+                "winner_store_name": h["winner_store_name"],
+                "winner_total": h["winner_total"],
+                "current": current,
+            }
+            for h, current in zip(heads, currents)
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("CURRENT_BASKETS_ERROR:", type(e).__name__, str(e))
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 # ---- SAVE basket ----
 @router.post("", response_model=BasketSummaryOut)
 async def save_basket(
@@ -1,12 +1,14 @@
 # compare.py
 import json
 import logging
-from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, confloat, conint
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Literal, Tuple, Dict, Any, Optional
 from utils.throttle import throttle
-from services.compare_service import compare_basket_service
+from services.compare_service import compare_basket_service, compare_baskets_service
 from api.analytics_identity import resolve_analytics_identity
+from services.stage_timing import finish_timer, stage, start_timer
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -29,6 +31,14 @@ MAX_ITEMS = 50
 MIN_RADIUS = 0.1
 MAX_RADIUS = 50.0
 MAX_STORES = 50
+MAX_BATCH_BASKETS = 20
+MAX_SPLIT_STORES = 3
+MAX_SPLIT_PENALTY = 50.0
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MATRIX_KEYS = (
+    "format", "lines", "products", "stores", "prices", "choice",
+    "required_lines", "totals", "radius_km", "missing_products", "split",
+)
 
 
 class GroceryItem(BaseModel):
@@ -51,6 +61,31 @@ class CompareRequest(BaseModel):
     offset_stores: conint(ge=0) = 0
     include_lines: bool = True
     require_all_items: bool = True
+    # Lisaks poodide järjestusele odavaim jaotus kuni 2–3 poe vahel;
+    # split_penalty = lisatrahv (€) iga täiendava poe eest.
+    split_stores: Optional[conint(ge=2, le=MAX_SPLIT_STORES)] = None
+    split_penalty: confloat(ge=0, le=MAX_SPLIT_PENALTY) = 0.0
+    # "matrix" = kompaktne tooted × poed hinnamaatriks (klient arvutab
+    # koguste muutumisel summad ise ümber); vt compare_service._matrix_payload.
+    format: Literal["lines", "matrix"] = "lines"
+
+
+class CompareBasket(BaseModel):
+    grocery_list: GroceryList
+    include_lines: bool = True
+    require_all_items: bool = True
+    split_stores: Optional[conint(ge=2, le=MAX_SPLIT_STORES)] = None
+    split_penalty: confloat(ge=0, le=MAX_SPLIT_PENALTY) = 0.0
+    format: Literal["lines", "matrix"] = "lines"
+
+
+class CompareBatchRequest(BaseModel):
+    baskets: List[CompareBasket]
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_km: confloat(ge=MIN_RADIUS, le=MAX_RADIUS) = 2.0
+    limit_stores: conint(ge=1, le=MAX_STORES) = 50
+    offset_stores: conint(ge=0) = 0
 
 
 def _clamp(v: float, lo: float, hi: float) -> float:
@@ -78,6 +113,48 @@ def _normalize_items(gl: GroceryList) -> List[Dict[str, Any]]:
     return out
 
 
+def _client_payload(payload_out: Dict[str, Any], radius_km: float) -> Dict[str, Any]:
+    # Ainult teadaolevad väljad — sisemised "_shadow_*" võtmed ei jõua kliendini.
+    if payload_out.get("format") == "matrix":
+        return {k: payload_out[k] for k in MATRIX_KEYS if k in payload_out}
+    out = {
+        "results": payload_out.get("results", []),
+        "totals": payload_out.get("totals", {}),
+        "stores": payload_out.get("stores", []),
+        "radius_km": payload_out.get("radius_km", radius_km),
+        "missing_products": payload_out.get("missing_products", []),
+    }
+    if "split" in payload_out:
+        out["split"] = payload_out["split"]
+    return out
+
+
+def _wants_ndjson(request: Request) -> bool:
+    accept = request.headers.get("accept") or ""
+    return any(part.split(";")[0].strip().lower() == NDJSON_MEDIA_TYPE for part in accept.split(","))
+
+
+async def _ndjson_lines(payload_out: Dict[str, Any], radius_km: float):
+    """/compare vastus ridadena: esimene rida "summary" (totals, poed,
+    split), siis iga poe tulemus pingerea järjekorras, lõpuks "end".
+    Summary läheb välja kohe pärast skoorimist; poe read (include_lines)
+    koostatakse alles siin, ühe poe kaupa (payload_out["_lines_for"]),
+    nii et klient saab esimesed poed kuvada enne, kui kõik on valmis."""
+    def line(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+    client_payload = _client_payload(payload_out, radius_km)
+    lines_for = payload_out.get("_lines_for")
+    results = client_payload.pop("results")
+    yield line({"type": "summary", "result_count": len(results), **client_payload})
+    for rank, result in enumerate(results, start=1):
+        row = {"type": "result", "rank": rank, **result}
+        if lines_for is not None:
+            row["lines"] = lines_for(result["store_id"])
+        yield line(row)
+    yield line({"type": "end"})
+
+
 def _build_chain_totals(results: List[Dict[str, Any]]) -> Tuple[Dict[str, float], Dict[str, int]]:
     """Reduces the per-store comparison results to one entry per chain:
     the cheapest complete-basket total found in that chain, and which
@@ -138,7 +215,18 @@ async def _log_basket_compare(
     /compare response.
     """
     try:
-        results = payload_out.get("results", [])
+        results = payload_out.get("results")
+        if results is None:  # format="matrix": poe summad on "stores" tabelis
+            results = [
+                {
+                    "store_id": s.get("id"),
+                    "chain": s.get("chain"),
+                    "total_price": s.get("total_price"),
+                    "lines_found": s.get("lines_found"),
+                    "required_lines": payload_out.get("required_lines"),
+                }
+                for s in payload_out.get("stores", [])
+            ]
         chain_totals, chain_store_ids = _build_chain_totals(results)
         if len(chain_totals) < 2:
             return
@@ -188,6 +276,46 @@ async def _log_basket_compare(
         logger.warning("basket_compare analytics logging failed: %s", exc)
 
 
+async def _log_basket_compare_batch(
+    request: Request,
+    basket_sizes: List[int],
+    radius_km: float,
+    user_id: Optional[str],
+    device_key: Optional[str],
+) -> None:
+    """Logs ONE basket_compare_batch event per /compare/batch call.
+
+    Deliberately not one basket_compare event per basket: those feed the
+    partner dashboard's win/loss stats, and a recompare of N saved or
+    family baskets would count as N separate comparisons. This event only
+    records that a batch ran (basket count and sizes), without chain
+    totals, so the dashboard numbers are unaffected.
+
+    Never raises, same as _log_basket_compare.
+    """
+    try:
+        pool = getattr(request.app.state, "db", None)
+        if pool is None:
+            return
+        event_payload = {
+            "radius_km": radius_km,
+            "basket_count": len(basket_sizes),
+            "basket_sizes": basket_sizes,
+        }
+        await pool.execute(
+            """
+            INSERT INTO analytics_events (event_type, chain, payload, user_id, device_key)
+            VALUES ($1, NULL, $2::jsonb, $3, $4)
+            """,
+            "basket_compare_batch",
+            json.dumps(event_payload),
+            user_id,
+            device_key,
+        )
+    except Exception as exc:
+        logger.warning("basket_compare_batch analytics logging failed: %s", exc)
+
+
 async def compute_compare(
     pool,
     items: List[Tuple[str, int]],
@@ -238,10 +366,12 @@ async def compute_compare(
 async def compare_basket(
     body: CompareRequest,
     request: Request,
+    response: Response,
     background_tasks: BackgroundTasks,
     x_device_id: Optional[str] = Header(default=None, alias="X-Device-Id"),
     authorization: Optional[str] = Header(default=None, alias="Authorization"),
 ):
+    timer = start_timer("compare")
     try:
         if not body.grocery_list.items:
             raise HTTPException(status_code=400, detail="Basket is empty")
@@ -282,8 +412,15 @@ async def compare_basket(
             "offset_stores": offset_stores,
             "include_lines": bool(body.include_lines),
             "require_all_items": bool(body.require_all_items),
+            "split_stores": body.split_stores,
+            "split_penalty": float(body.split_penalty),
+            "format": body.format,
             "_shadow_sampled": shadow_sampled,
         }
+        stream = _wants_ndjson(request) and body.format != "matrix"
+        if stream:
+            # Poe read koostab _ndjson_lines() voo ajal.
+            payload_in["_lazy_lines"] = True
 
         payload_out = await compare_basket_service(pool, payload_in)
 
@@ -307,9 +444,12 @@ async def compare_basket(
                 already_sampled=True,
             )
 
-        user_id, device_key = await resolve_analytics_identity(request, authorization, x_device_id)
-
-        await _log_basket_compare(
+        # Analüütika INSERT käib BackgroundTasks'iga pärast vastuse (ka
+        # NDJSON voo) saatmist; _log_basket_compare ei viska kunagi.
+        with stage("analytics"):
+            user_id, device_key = await resolve_analytics_identity(request, authorization, x_device_id)
+        background_tasks.add_task(
+            _log_basket_compare,
             request,
             payload_out,
             basket_size=len(items_payload),
@@ -318,12 +458,94 @@ async def compare_basket(
             device_key=device_key,
         )
 
+        server_timing = finish_timer(timer)
+        if stream:
+            # BackgroundTasks (shadow, analüütika) kinnitab FastAPI ka sellele vastusele.
+            return StreamingResponse(
+                _ndjson_lines(payload_out, radius_km),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers={"Server-Timing": server_timing},
+            )
+        client_payload = _client_payload(payload_out, radius_km)
+        response.headers["Server-Timing"] = server_timing
+        return client_payload
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/compare/batch")
+@throttle(limit=10, window=60)
+async def compare_baskets(
+    body: CompareBatchRequest,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    x_device_id: Optional[str] = Header(default=None, alias="X-Device-Id"),
+    authorization: Optional[str] = Header(default=None, alias="Authorization"),
+):
+    """Mitu korvi ühe asukoha jaoks (pere korvid, retseptikorvid,
+    salvestatud korvide ülevõrdlus). Nimed, grupid, poed ja hinnad
+    laetakse kõigi korvide peale ÜKS kord (compare_baskets_service);
+    vastuses on iga korvi kohta sama kuju mis /compare'il, sisendi
+    järjekorras. Shadow mode'i siin ei käivitata; analüütikasse läheb
+    üks basket_compare_batch sündmus (vt _log_basket_compare_batch)."""
+    timer = start_timer("compare_batch")
+    try:
+        if not body.baskets:
+            raise HTTPException(status_code=400, detail="No baskets")
+        if len(body.baskets) > MAX_BATCH_BASKETS:
+            raise HTTPException(status_code=400, detail=f"Too many baskets (>{MAX_BATCH_BASKETS})")
+
+        baskets_in: List[Dict[str, Any]] = []
+        for i, basket in enumerate(body.baskets):
+            if not basket.grocery_list.items:
+                raise HTTPException(status_code=400, detail=f"Basket {i} is empty")
+            if len(basket.grocery_list.items) > MAX_ITEMS:
+                raise HTTPException(status_code=400, detail=f"Basket {i} too large (>{MAX_ITEMS} items)")
+            items_payload = _normalize_items(basket.grocery_list)
+            if not items_payload:
+                raise HTTPException(status_code=400, detail=f"Basket {i}: all product names are empty")
+            baskets_in.append({
+                "items": items_payload,
+                "include_lines": bool(basket.include_lines),
+                "require_all_items": bool(basket.require_all_items),
+                "split_stores": basket.split_stores,
+                "split_penalty": float(basket.split_penalty),
+                "format": basket.format,
+            })
+
+        pool = getattr(request.app.state, "db", None)
+        if pool is None:
+            raise HTTPException(status_code=500, detail="DB not ready")
+
+        radius_km = float(_clamp(float(body.radius_km), MIN_RADIUS, MAX_RADIUS))
+        payloads_out = await compare_baskets_service(pool, {
+            "baskets": baskets_in,
+            "lat": body.lat,
+            "lon": body.lon,
+            "radius_km": radius_km,
+            "limit_stores": int(_clamp_int(int(body.limit_stores), 1, MAX_STORES)),
+            "offset_stores": max(0, int(body.offset_stores)),
+        })
+
+        # Nagu /compare: INSERT käib BackgroundTasks'iga pärast vastust.
+        with stage("analytics"):
+            user_id, device_key = await resolve_analytics_identity(request, authorization, x_device_id)
+        background_tasks.add_task(
+            _log_basket_compare_batch,
+            request,
+            [len(b["items"]) for b in baskets_in],
+            radius_km=radius_km,
+            user_id=user_id,
+            device_key=device_key,
+        )
+
+        response.headers["Server-Timing"] = finish_timer(timer)
         return {
-            "results": payload_out.get("results", []),
-            "totals": payload_out.get("totals", {}),
-            "stores": payload_out.get("stores", []),
-            "radius_km": payload_out.get("radius_km", radius_km),
-            "missing_products": payload_out.get("missing_products", []),
+            "baskets": [_client_payload(p, radius_km) for p in payloads_out],
+            "radius_km": radius_km,
         }
     except HTTPException:
         raise
@@ -1,9 +1,10 @@
 import os
 import sys
+import asyncio
 import logging
 import asyncpg
 import traceback
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import PlainTextResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
@@ -17,11 +18,25 @@ from settings import (
     ENABLE_DOCS, STATIC_DIR, IMAGES_DIR,
     ALLOW_ORIGINS, DATABASE_URL, DB_CONNECT_TIMEOUT,
     LOG_REQUESTS, RATE_PER_MIN, REDIS_URL, WINDOW,
+    PRICE_MATRIX_ENABLED, CACHE_REFRESH_SECONDS, METRICS_TOKEN,
+    SEARCH_INDEX_ENABLED,
 )
 
 from middlewares.headers import security_and_cache_headers
 from middlewares.rate_limit import RateLimitMiddleware
 from middlewares.docs_guard import SwaggerAuthMiddleware
+from services.price_matrix import get_price_matrix
+from services.store_index import get_store_index
+from services.name_cache import get_name_cache
+from services.group_map import get_group_map
+from services.search_docs import get_search_docs
+from services.search_index import get_search_index
+from services.category_tree import get_category_tree
+from services.catalog_version import get_catalog_version
+from services.ingredient_resolver import close_http_client, get_ingredient_resolver
+from services.compare_cache import get_compare_cache
+from services.stage_timing import render_prometheus
+from utils.metrics_auth import metrics_authorized
 
 # Routers
 from auth import router as auth_router
@@ -86,6 +101,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["Server-Timing"],
 )
 
 # Docs protection
@@ -105,9 +121,38 @@ app.add_middleware(
     redis_url=REDIS_URL,
 )
 
+async def _cache_refresh_loop(pool):
+    """Laeb protsessisisesed vahemälud (poodide geoindeks, nimede LRU,
+    tootegrupid, kategooriapuu, otsinguindeks, hinnamaatriks) ja
+    värskendab neid iga CACHE_REFRESH_SECONDS järel; samas tsüklis tühjendatakse
+    otsingudokumentide (product_search_docs) järjekord. Jookseb taustal,
+    et käivitus ei ootaks täislaadimist — seni kasutavad teenused
+    SQL-rada. Iga vahemälu värskendatakse eraldi, et ühe viga teisi ei
+    peataks."""
+    caches = [
+        get_store_index(), get_name_cache(), get_group_map(), get_category_tree(),
+        get_search_docs(),
+    ]
+    if SEARCH_INDEX_ENABLED:
+        caches.append(get_search_index())   # pärast search_docs'i järjekorra tühjendamist
+    if PRICE_MATRIX_ENABLED:
+        caches.append(get_price_matrix())
+    caches.append(get_catalog_version())   # viimasena: näeb selle tsükli ümberehitusi
+    while True:
+        for cache in caches:
+            try:
+                await cache.refresh(pool)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ Cache refresh failed ({type(cache).__name__}): {e}")
+        await asyncio.sleep(CACHE_REFRESH_SECONDS)
+
+
 # DB pool
 @app.on_event("startup")
 async def startup():
+    app.state.cache_refresher = None
     try:
         app.state.db = await asyncpg.create_pool(
             DATABASE_URL,
@@ -120,9 +165,16 @@ async def startup():
         app.state.db = None
         logger.error(f"⚠️ Failed to connect to DB at startup: {e}")
 
+    if app.state.db is not None:
+        app.state.cache_refresher = asyncio.create_task(_cache_refresh_loop(app.state.db))
+
 
 @app.on_event("shutdown")
 async def shutdown():
+    task = getattr(app.state, "cache_refresher", None)
+    if task is not None:
+        task.cancel()
+    await close_http_client()
     try:
         if getattr(app.state, "db", None):
             await app.state.db.close()
@@ -177,6 +229,7 @@ async def robots():
         "Disallow: /basket-history\n"
         "Disallow: /api/upload-image\n"
         "Disallow: /admin/images\n"
+        "Disallow: /metrics\n"
     )
 
 
@@ -185,6 +238,37 @@ async def healthz():
     return "ok"
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheuse tekstivorming: /compare etappide histogrammid
+    (services/stage_timing.py) ja protsessisiseste vahemälude stats()."""
+    # Ilma METRICS_TOKEN'ita pole otspunkti olemas (avalik API).
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics_authorized(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    lines = render_prometheus()
+    lines.append("# TYPE cache_stat gauge")
+    caches = {
+        "store_index": get_store_index(),
+        "name_cache": get_name_cache(),
+        "group_map": get_group_map(),
+        "price_matrix": get_price_matrix(),
+        "ingredient_resolver": get_ingredient_resolver(),
+        "compare_cache": get_compare_cache(),
+        "search_docs": get_search_docs(),
+        "search_index": get_search_index(),
+        "category_tree": get_category_tree(),
+        "catalog_version": get_catalog_version(),
+    }
+    for cache_name, cache in caches.items():
+        for key, value in cache.stats().items():
+            # Ainult arvulised väärtused (bool -> 0/1); watermark jms jäävad välja.
+            if isinstance(value, (bool, int, float)):
+                lines.append(f'cache_stat{{cache="{cache_name}",stat="{key}"}} {float(value):g}')
+    return "\n".join(lines) + "\n"
+
+
 @app.get("/privacy")
 async def privacy():
     return FileResponse(os.path.join(APP_ROOT, "static", "privacy_policy.html"))
@@ -8,6 +8,7 @@ from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from utils.client_ip import get_client_ip
+from utils.metrics_auth import metrics_authorized
 
 try:
     import aioredis  # type: ignore
@@ -75,6 +76,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             or path.startswith("/openapi.json")
         ):
             return await call_next(request)
+        # Scraper with the right token is not throttled; anyone else is.
+        if path == "/metrics" and metrics_authorized(request):
+            return await call_next(request)
 
         ip = get_client_ip(request)
 
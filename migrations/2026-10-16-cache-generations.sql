@@ -0,0 +1,54 @@
+-- 2026-10-16-cache-generations.sql
+-- Generation counters for the API's in-process caches.
+--
+-- Scrapers and seeding scripts run in GitHub Actions, not in the API
+-- process, so they cannot invalidate its caches directly. Instead every
+-- write to a cached table bumps a named counter here (statement-level
+-- triggers, one bump per statement), and main.py's background refresher
+-- reloads a cache only when its counter has moved.
+--
+--   stores  <- stores, store_price_source   (services/store_index.py)
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.cache_generations (
+  name        TEXT        PRIMARY KEY,
+  generation  BIGINT      NOT NULL DEFAULT 1,
+  bumped_at   TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE OR REPLACE FUNCTION public.bump_cache_generation(p_name TEXT)
+RETURNS BIGINT
+LANGUAGE sql AS $$
+  INSERT INTO public.cache_generations AS g (name)
+  VALUES (p_name)
+  ON CONFLICT (name) DO UPDATE
+     SET generation = g.generation + 1,
+         bumped_at  = clock_timestamp()
+  RETURNING generation;
+$$;
+
+-- Trigger wrapper: the counter name is the first trigger argument.
+CREATE OR REPLACE FUNCTION public.trg_bump_cache_generation()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM public.bump_cache_generation(TG_ARGV[0]);
+  RETURN NULL;
+END
+$$;
+
+INSERT INTO public.cache_generations (name) VALUES ('stores')
+ON CONFLICT (name) DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_stores_cache_gen ON public.stores;
+CREATE TRIGGER trg_stores_cache_gen
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.stores
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation('stores');
+
+DROP TRIGGER IF EXISTS trg_store_price_source_cache_gen ON public.store_price_source;
+CREATE TRIGGER trg_store_price_source_cache_gen
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.store_price_source
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation('stores');
+
+COMMIT;
@@ -0,0 +1,213 @@
+-- 2026-10-16-category-product-counts.sql
+-- Precomputed product counts for the /categories endpoints.
+--
+-- /categories/main, /{main}/sub and /{main}/sub/{sub}/sub each joined
+-- products on every call (COUNT(DISTINCT p.id) per category, plus an
+-- extra subquery to roll the spirits children into drinks_spirits).
+-- The counts now live in category_product_counts:
+--
+--   kind = 'main'  products in any of the main category's subcategories
+--   kind = 'sub'   products with this sub_code plus those of its child
+--                  subcategories (parent_id), for every subcategory
+--
+-- refresh_category_product_counts() recomputes the whole table (one
+-- GROUP BY over products) and bumps the 'category_counts' generation
+-- when a count changed; services/category_tree.py reloads its in-memory
+-- tree on that. Writes that can move a count (new/deleted products, a
+-- sub_code change, category edits) bump 'category_products'; the API's
+-- background loop recomputes when it has moved, at most once per
+-- CATEGORY_COUNTS_MIN_INTERVAL. refresh-views.yml forces a recount
+-- nightly.
+--
+-- categories_main/categories_sub are created by seed-categories.yml,
+-- outside migrations/, so their triggers are only attached if they exist.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.category_product_counts (
+  kind          TEXT NOT NULL CHECK (kind IN ('main', 'sub')),
+  code          TEXT NOT NULL,
+  product_count INT  NOT NULL,
+  PRIMARY KEY (kind, code)
+);
+
+-- Single row: the 'category_products' generation the table was built at.
+CREATE TABLE IF NOT EXISTS public.category_product_counts_state (
+  id                  BOOLEAN     PRIMARY KEY DEFAULT true CHECK (id),
+  products_generation BIGINT,
+  refreshed_at        TIMESTAMPTZ NOT NULL
+);
+
+INSERT INTO public.cache_generations (name)
+VALUES ('category_products'), ('category_counts')
+ON CONFLICT (name) DO NOTHING;
+
+-- Live counts, same shape as the table (the API's fallback before the
+-- first build). plpgsql so that it can be created before the category
+-- tables are seeded.
+CREATE OR REPLACE FUNCTION public.category_product_counts_live()
+RETURNS TABLE (kind TEXT, code TEXT, product_count INT)
+LANGUAGE plpgsql STABLE AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  WITH own AS (
+    SELECT p.sub_code, COUNT(*)::int AS n
+    FROM public.products p
+    WHERE p.sub_code IS NOT NULL
+    GROUP BY p.sub_code
+  ),
+  subs AS (
+    SELECT s.id, s.code, s.main_id, s.parent_id, COALESCE(o.n, 0) AS n
+    FROM public.categories_sub s
+    LEFT JOIN own o ON o.sub_code = s.code
+  )
+  SELECT DISTINCT ON (x.kind, x.code) x.kind, x.code, x.product_count
+  FROM (
+    SELECT 'sub'::text AS kind, s.code,
+           (s.n + COALESCE((SELECT SUM(c.n) FROM subs c WHERE c.parent_id = s.id), 0))::int
+    FROM subs s
+    UNION ALL
+    SELECT 'main'::text, m.code,
+           COALESCE((SELECT SUM(s.n) FROM subs s WHERE s.main_id = m.id), 0)::int
+    FROM public.categories_main m
+  ) x (kind, code, product_count)
+  ORDER BY x.kind, x.code, x.product_count DESC;
+END
+$$;
+
+-- Returns the number of rows that changed (0 when skipped). Skips when
+-- another session is already recounting, and unless p_force when the
+-- 'category_products' generation hasn't moved or the last recount is
+-- younger than p_min_interval.
+CREATE OR REPLACE FUNCTION public.refresh_category_product_counts(
+  p_force        BOOLEAN  DEFAULT false,
+  p_min_interval INTERVAL DEFAULT INTERVAL '0'
+)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_generation BIGINT;
+  v_built_gen  BIGINT;
+  v_built_at   TIMESTAMPTZ;
+  v_changed    INT;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('refresh_category_product_counts')) THEN
+    RETURN 0;
+  END IF;
+
+  SELECT generation INTO v_generation
+  FROM public.cache_generations WHERE name = 'category_products';
+
+  SELECT products_generation, refreshed_at INTO v_built_gen, v_built_at
+  FROM public.category_product_counts_state;
+
+  IF NOT p_force AND v_built_at IS NOT NULL
+     AND (v_built_gen IS NOT DISTINCT FROM v_generation
+          OR v_built_at > now() - p_min_interval) THEN
+    RETURN 0;
+  END IF;
+
+  WITH fresh AS (
+    SELECT * FROM public.category_product_counts_live()
+  ),
+  upserted AS (
+    INSERT INTO public.category_product_counts AS c (kind, code, product_count)
+    SELECT kind, code, product_count FROM fresh
+    ON CONFLICT (kind, code) DO UPDATE
+       SET product_count = EXCLUDED.product_count
+     WHERE c.product_count IS DISTINCT FROM EXCLUDED.product_count
+    RETURNING 1
+  ),
+  removed AS (
+    DELETE FROM public.category_product_counts c
+    WHERE NOT EXISTS (SELECT 1 FROM fresh f WHERE f.kind = c.kind AND f.code = c.code)
+    RETURNING 1
+  )
+  SELECT (SELECT COUNT(*) FROM upserted) + (SELECT COUNT(*) FROM removed)
+  INTO v_changed;
+
+  INSERT INTO public.category_product_counts_state (id, products_generation, refreshed_at)
+  VALUES (true, v_generation, now())
+  ON CONFLICT (id) DO UPDATE
+     SET products_generation = EXCLUDED.products_generation,
+         refreshed_at        = EXCLUDED.refreshed_at;
+
+  IF v_changed > 0 THEN
+    PERFORM public.bump_cache_generation('category_counts');
+  END IF;
+  RETURN v_changed;
+END
+$$;
+
+-- products: statement-level with transition tables, so scraper upserts
+-- that neither add products nor move a sub_code don't bump anything.
+CREATE OR REPLACE FUNCTION public.trg_products_category_dirty()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    IF EXISTS (
+      SELECT 1 FROM old_rows o JOIN new_rows n ON n.id = o.id
+      WHERE n.sub_code IS DISTINCT FROM o.sub_code
+    ) THEN
+      PERFORM public.bump_cache_generation('category_products');
+    END IF;
+  ELSIF TG_OP = 'INSERT' THEN
+    IF EXISTS (SELECT 1 FROM new_rows) THEN
+      PERFORM public.bump_cache_generation('category_products');
+    END IF;
+  ELSIF TG_OP = 'DELETE' THEN
+    IF EXISTS (SELECT 1 FROM old_rows) THEN
+      PERFORM public.bump_cache_generation('category_products');
+    END IF;
+  END IF;
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_products_category_dirty_ins ON public.products;
+CREATE TRIGGER trg_products_category_dirty_ins
+  AFTER INSERT ON public.products
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_category_dirty();
+
+DROP TRIGGER IF EXISTS trg_products_category_dirty_upd ON public.products;
+CREATE TRIGGER trg_products_category_dirty_upd
+  AFTER UPDATE ON public.products
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_category_dirty();
+
+DROP TRIGGER IF EXISTS trg_products_category_dirty_del ON public.products;
+CREATE TRIGGER trg_products_category_dirty_del
+  AFTER DELETE ON public.products
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_category_dirty();
+
+DROP TRIGGER IF EXISTS trg_products_category_dirty_trunc ON public.products;
+CREATE TRIGGER trg_products_category_dirty_trunc
+  AFTER TRUNCATE ON public.products
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation('category_products');
+
+-- Category edits move counts (main_id/parent_id) and labels: recount and
+-- reload the tree.
+DO $$
+DECLARE
+  t TEXT;
+  g TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['categories_main', 'categories_sub'] LOOP
+    IF to_regclass('public.' || t) IS NOT NULL THEN
+      FOREACH g IN ARRAY ARRAY['category_products', 'category_counts'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', 'trg_' || t || '_' || g || '_gen', t);
+        EXECUTE format(
+          'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.%I '
+          'FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation(%L)',
+          'trg_' || t || '_' || g || '_gen', t, g
+        );
+      END LOOP;
+    END IF;
+  END LOOP;
+END$$;
+
+COMMIT;
@@ -0,0 +1,127 @@
+-- 2026-10-16-current-prices.sql
+-- One row per (product_id, store_id) holding the LATEST price, so hot
+-- reads (/compare, /products/alternatives, recipe ingredient search,
+-- v_latest_store_prices) no longer run DISTINCT ON over the full
+-- append-only prices history.
+--
+-- Kept up to date by statement-level triggers on prices (transition
+-- tables, one upsert per statement), so every ingest path is covered:
+-- the upsert_product_and_price() DB function used by all scrapers,
+-- services/ingest_service.py, utils/prices_writer.py, workflow SQL, and
+-- the separate promo_price UPDATE some scrapers run after the upsert.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.current_prices (
+  product_id      INT         NOT NULL,
+  store_id        INT         NOT NULL,
+  price           NUMERIC,
+  promo_price     NUMERIC,
+  effective_price NUMERIC GENERATED ALWAYS AS (COALESCE(NULLIF(promo_price, 0), price)) STORED,
+  currency        TEXT,
+  collected_at    TIMESTAMPTZ,
+  updated_at      TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+  PRIMARY KEY (product_id, store_id)
+);
+
+-- "all products of one (source) store" — alternatives, recipe search
+CREATE INDEX IF NOT EXISTS ix_current_prices_store
+  ON public.current_prices (store_id, product_id);
+
+-- incremental readers (services/price_matrix.py) poll by updated_at
+CREATE INDEX IF NOT EXISTS ix_current_prices_updated_at
+  ON public.current_prices (updated_at);
+
+CREATE OR REPLACE FUNCTION public.sync_current_prices()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.current_prices AS cp
+         (product_id, store_id, price, promo_price, currency, collected_at, updated_at)
+  SELECT DISTINCT ON (n.product_id, n.store_id)
+         n.product_id, n.store_id, n.price, n.promo_price, n.currency, n.collected_at,
+         clock_timestamp()
+  FROM changed_prices n
+  WHERE n.product_id IS NOT NULL
+    AND n.store_id IS NOT NULL
+  ORDER BY n.product_id, n.store_id, n.collected_at DESC NULLS LAST
+  ON CONFLICT (product_id, store_id) DO UPDATE
+     SET price        = EXCLUDED.price,
+         promo_price  = EXCLUDED.promo_price,
+         currency     = EXCLUDED.currency,
+         collected_at = EXCLUDED.collected_at,
+         updated_at   = EXCLUDED.updated_at
+   -- older snapshots (backfills, re-imports) never overwrite a newer price;
+   -- ">=" lets a promo_price UPDATE on the current row through
+   WHERE cp.collected_at IS NULL
+      OR EXCLUDED.collected_at >= cp.collected_at;
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_prices_current_ins ON public.prices;
+CREATE TRIGGER trg_prices_current_ins
+  AFTER INSERT ON public.prices
+  REFERENCING NEW TABLE AS changed_prices
+  FOR EACH STATEMENT EXECUTE FUNCTION public.sync_current_prices();
+
+DROP TRIGGER IF EXISTS trg_prices_current_upd ON public.prices;
+CREATE TRIGGER trg_prices_current_upd
+  AFTER UPDATE ON public.prices
+  REFERENCING NEW TABLE AS changed_prices
+  FOR EACH STATEMENT EXECUTE FUNCTION public.sync_current_prices();
+
+-- One-time backfill. This file is re-applied on every push (see
+-- db-views-migration.yml), so only run it while the table is empty.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM public.current_prices LIMIT 1) THEN
+    INSERT INTO public.current_prices
+           (product_id, store_id, price, promo_price, currency, collected_at)
+    SELECT DISTINCT ON (pr.product_id, pr.store_id)
+           pr.product_id, pr.store_id, pr.price, pr.promo_price, pr.currency, pr.collected_at
+    FROM public.prices pr
+    WHERE pr.product_id IS NOT NULL
+      AND pr.store_id IS NOT NULL
+    ORDER BY pr.product_id, pr.store_id, pr.collected_at DESC NULLS LAST;
+  END IF;
+END$$;
+
+ANALYZE public.current_prices;
+
+-- Views: same columns as 2025-08-26-stop-fanout-use-fallback.sql, now read
+-- from current_prices. Own physical price wins, otherwise the mapped
+-- source store's price (store_price_source).
+DROP VIEW IF EXISTS public.v_cheapest_offer;
+DROP VIEW IF EXISTS public.v_latest_store_prices;
+
+CREATE VIEW public.v_latest_store_prices AS
+WITH map AS (
+  SELECT DISTINCT ON (store_id) store_id, source_store_id
+  FROM public.store_price_source
+  ORDER BY store_id, source_store_id
+)
+SELECT cp.product_id, cp.store_id, cp.price, cp.currency, cp.collected_at,
+       'physical'::text AS source
+FROM public.current_prices cp
+UNION ALL
+SELECT src.product_id, m.store_id, src.price, src.currency, src.collected_at,
+       'mirror:online'::text AS source
+FROM map m
+JOIN public.current_prices src ON src.store_id = m.source_store_id
+WHERE NOT EXISTS (
+  SELECT 1 FROM public.current_prices own
+  WHERE own.store_id = m.store_id AND own.product_id = src.product_id
+);
+
+CREATE VIEW public.v_cheapest_offer AS
+SELECT
+  ep.product_id,
+  (ARRAY_AGG(ep.store_id     ORDER BY ep.price ASC, ep.collected_at DESC))[1] AS store_id,
+  MIN(ep.price)  AS price,
+  (ARRAY_AGG(ep.currency     ORDER BY ep.price ASC, ep.collected_at DESC))[1] AS currency,
+  (ARRAY_AGG(ep.collected_at ORDER BY ep.price ASC, ep.collected_at DESC))[1] AS collected_at
+FROM public.v_latest_store_prices ep
+GROUP BY ep.product_id;
+
+COMMIT;
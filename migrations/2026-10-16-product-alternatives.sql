@@ -0,0 +1,48 @@
+-- 2026-10-16-product-alternatives.sql
+-- Precomputed nearest neighbours for /products/alternatives.
+--
+-- The endpoint used to score word_similarity() against every product in
+-- the missing product's sub_code on each call. product_alternatives
+-- holds the top-K most similar dedup groups (product_search_docs keys)
+-- per group within its category; at request time only the store's
+-- prices for those K neighbours are looked up.
+--
+--   rank / similarity  word_similarity(origin name, neighbour name), or
+--                      against the produce family keyword (tomat, kartul,
+--                      ...) when the family filter applies
+--   family             family the row was built with (NULL = none); the
+--                      API falls back to the live query if the request's
+--                      family differs
+--   alt_group_id /     neighbour group, or the product for ungrouped
+--   alt_product_id     ('u_<id>') neighbours
+--
+-- Built per category by scripts/build_product_alternatives.py (nightly
+-- after the search document rebuild). product_alternatives_state keeps a
+-- signature of each category's documents (keys, names, search text) so
+-- categories whose inputs did not change are skipped — the nightly full
+-- document rebuild rewrites every row, so refreshed_at can't tell.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.product_alternatives (
+  dedup_key      TEXT     NOT NULL,
+  rank           SMALLINT NOT NULL,
+  sub_code       TEXT     NOT NULL,
+  family         TEXT,
+  alt_group_id   INT,
+  alt_product_id INT,
+  similarity     REAL     NOT NULL,
+  PRIMARY KEY (dedup_key, rank)
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_alternatives_sub_code
+  ON public.product_alternatives (sub_code);
+
+CREATE TABLE IF NOT EXISTS public.product_alternatives_state (
+  sub_code  TEXT        PRIMARY KEY,
+  signature TEXT        NOT NULL,
+  docs      INT         NOT NULL,
+  built_at  TIMESTAMPTZ NOT NULL
+);
+
+COMMIT;
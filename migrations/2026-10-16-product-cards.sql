@@ -0,0 +1,110 @@
+-- 2026-10-16-product-cards.sql
+-- Denormalized product card per product for /products/{id},
+-- /products/batch and /favourites (services/product_cards.py).
+--
+-- Each of those rebuilt the same card per request from
+-- products ⋈ product_group_members ⋈ product_groups ⋈ mv_group_chains.
+-- product_cards stores it once per product id:
+--
+--   dedup_key / group_id   smallest group the product belongs to, or
+--                          'u_<product_id>' / NULL when ungrouped
+--   canonical_name         product_groups.canonical_name
+--   group_brand            NULLIF(TRIM(product_groups.brand), '')
+--   product_brand          products.brand (favourites' fallback)
+--   chains / min_price     mv_group_chains row of dedup_key
+--
+-- Cards are rebuilt together with the search documents:
+-- refresh_product_search_docs() (2026-10-16-product-search-docs.sql,
+-- which sorts after this file) calls refresh_product_cards() for every
+-- member of the dedup keys it rebuilds, so the same dirty queue and the
+-- same nightly full rebuild keep both current. Products with no card yet
+-- (e.g. inserted but never priced) are read live by the API.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.product_cards (
+  product_id     INT         PRIMARY KEY,
+  dedup_key      TEXT        NOT NULL,
+  group_id       INT,
+  name           TEXT,
+  canonical_name TEXT,
+  group_brand    TEXT,
+  product_brand  TEXT,
+  image_url      TEXT,
+  manufacturer   TEXT,
+  size_text      TEXT,
+  amount         TEXT,
+  food_group     TEXT,
+  sub_code       TEXT,
+  chains         TEXT[],
+  min_price      NUMERIC,
+  refreshed_at   TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_cards_dedup_key
+  ON public.product_cards (dedup_key);
+
+-- Rebuild the cards of the given products (all products when NULL).
+-- Deleted products lose their card. Returns the number of cards written.
+CREATE OR REPLACE FUNCTION public.refresh_product_cards(p_product_ids INT[] DEFAULT NULL)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  IF p_product_ids IS NOT NULL AND cardinality(p_product_ids) = 0 THEN
+    RETURN 0;
+  END IF;
+
+  DELETE FROM public.product_cards c
+  WHERE p_product_ids IS NULL OR c.product_id = ANY(p_product_ids);
+
+  INSERT INTO public.product_cards (
+    product_id, dedup_key, group_id, name, canonical_name, group_brand,
+    product_brand, image_url, manufacturer, size_text, amount, food_group,
+    sub_code, chains, min_price
+  )
+  SELECT DISTINCT ON (p.id)
+         p.id,
+         COALESCE(pgm.group_id::text, 'u_' || p.id::text),
+         pgm.group_id,
+         p.name,
+         pg.canonical_name,
+         NULLIF(TRIM(pg.brand), ''),
+         p.brand,
+         p.image_url,
+         p.manufacturer,
+         p.size_text,
+         p.amount,
+         p.food_group,
+         p.sub_code,
+         gc.chains,
+         gc.min_price
+  FROM public.products p
+  LEFT JOIN public.product_group_members pgm ON pgm.product_id = p.id
+  LEFT JOIN public.product_groups pg ON pg.id = pgm.group_id
+  LEFT JOIN public.mv_group_chains gc
+    ON gc.dedup_key = COALESCE(pgm.group_id::text, 'u_' || p.id::text)
+  WHERE p_product_ids IS NULL OR p.id = ANY(p_product_ids)
+  ORDER BY p.id, pgm.group_id;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END
+$$;
+
+-- One-time build, only while the table is empty (this file is re-applied
+-- on every push).
+DO $$
+BEGIN
+  IF to_regclass('public.product_group_members') IS NOT NULL
+     AND to_regclass('public.product_groups') IS NOT NULL
+     AND to_regclass('public.mv_group_chains') IS NOT NULL
+     AND NOT EXISTS (SELECT 1 FROM public.product_cards LIMIT 1) THEN
+    PERFORM public.refresh_product_cards(NULL);
+  END IF;
+END$$;
+
+ANALYZE public.product_cards;
+
+COMMIT;
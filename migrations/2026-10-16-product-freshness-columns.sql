@@ -0,0 +1,105 @@
+-- 2026-10-16-product-freshness-columns.sql
+-- Precomputed source priority and price freshness on products.
+--
+-- Picking a group's representative product classified every member with
+-- up to nine ILIKE '%...%' tests on source_url and looked up its newest
+-- price with a correlated subquery over current_prices. Both are now
+-- columns on products:
+--
+--   source_priority  product_source_priority(source_url), set by a BEFORE
+--                    trigger on insert / source_url change
+--   last_price_at    newest current_prices.collected_at, raised by a
+--                    statement trigger on current_prices (hour
+--                    granularity — the consumers use a 14-day window)
+--
+-- Existing rows are filled by scripts/backfill_product_freshness.py
+-- (batched, manual workflow), not here: this file is re-applied on every
+-- push and a full products UPDATE does not fit the CI window. Until then
+-- readers fall back to the old expressions for NULL columns.
+--
+-- Sorts before 2026-10-16-product-search-docs.sql, whose refresh
+-- function reads these columns.
+
+BEGIN;
+
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS source_priority SMALLINT;
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS last_price_at TIMESTAMPTZ;
+
+-- 1 = Prisma ... 6 = Wolt, 7 = no source URL, 8 = anything else.
+CREATE OR REPLACE FUNCTION public.product_source_priority(p_url TEXT)
+RETURNS SMALLINT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT (CASE
+    WHEN p_url ILIKE '%prisma%'                    THEN 1
+    WHEN p_url ILIKE '%selver%'                    THEN 2
+    WHEN p_url ILIKE '%rimi%'                      THEN 3
+    WHEN p_url ILIKE '%barbora%'
+      OR p_url ILIKE '%maxima%'                    THEN 4
+    WHEN p_url ILIKE '%ecoop%'
+      OR (p_url ILIKE '%coop%'
+          AND p_url NOT ILIKE '%wolt%')            THEN 5
+    WHEN p_url ILIKE '%wolt%'                      THEN 6
+    WHEN p_url IS NULL OR p_url = ''               THEN 7
+    ELSE 8
+  END)::smallint;
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_products_source_priority()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.source_priority := public.product_source_priority(NEW.source_url);
+  RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_products_source_priority ON public.products;
+CREATE TRIGGER trg_products_source_priority
+  BEFORE INSERT OR UPDATE OF source_url ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.trg_products_source_priority();
+
+-- Only move last_price_at forward, and only when it gains more than an
+-- hour: repeated scraper batches then leave products untouched.
+CREATE OR REPLACE FUNCTION public.trg_products_last_price_at()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  UPDATE public.products p
+     SET last_price_at = n.collected_at
+  FROM (
+    SELECT product_id, max(collected_at) AS collected_at
+    FROM changed_rows
+    WHERE collected_at IS NOT NULL
+    GROUP BY product_id
+  ) n
+  WHERE p.id = n.product_id
+    AND (p.last_price_at IS NULL OR p.last_price_at < n.collected_at - INTERVAL '1 hour');
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_current_prices_last_price_at_ins ON public.current_prices;
+CREATE TRIGGER trg_current_prices_last_price_at_ins
+  AFTER INSERT ON public.current_prices
+  REFERENCING NEW TABLE AS changed_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_last_price_at();
+
+DROP TRIGGER IF EXISTS trg_current_prices_last_price_at_upd ON public.current_prices;
+CREATE TRIGGER trg_current_prices_last_price_at_upd
+  AFTER UPDATE ON public.current_prices
+  REFERENCING NEW TABLE AS changed_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_last_price_at();
+
+-- "Fresh" is relative to now(), which a partial index predicate cannot
+-- use; index priced products by recency instead (never-priced rows are
+-- left out) — "last_price_at > now() - 14 days" is a range scan.
+CREATE INDEX IF NOT EXISTS ix_products_last_price_at
+  ON public.products (last_price_at DESC)
+  WHERE last_price_at IS NOT NULL;
+
+-- Backfill script's work queue.
+CREATE INDEX IF NOT EXISTS ix_products_source_priority_missing
+  ON public.products (id)
+  WHERE source_priority IS NULL;
+
+COMMIT;
@@ -0,0 +1,31 @@
+-- 2026-10-16-product-groups-cache-gen.sql
+-- 'product_groups' generation for the API's in-memory group map
+-- (services/group_map.py). Bumped by any write to product_groups or
+-- product_group_members: build_product_groups.py/.sql and the match
+-- import workflows.
+--
+-- Both tables are created outside migrations/, so only attach the
+-- triggers where they exist.
+
+BEGIN;
+
+INSERT INTO public.cache_generations (name) VALUES ('product_groups')
+ON CONFLICT (name) DO NOTHING;
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['product_groups', 'product_group_members'] LOOP
+    IF to_regclass('public.' || t) IS NOT NULL THEN
+      EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', 'trg_' || t || '_cache_gen', t);
+      EXECUTE format(
+        'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.%I '
+        'FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation(%L)',
+        'trg_' || t || '_cache_gen', t, 'product_groups'
+      );
+    END IF;
+  END LOOP;
+END$$;
+
+COMMIT;
@@ -0,0 +1,55 @@
+-- 2026-10-16-product-names-cache-gen.sql
+-- 'product_names' generation for the API's name -> product LRU
+-- (services/name_cache.py). Bumped only when an existing name -> id
+-- mapping can change: a product is renamed or deleted, or aliases
+-- change. New products do not bump it (the LRU expires "not found"
+-- entries on its own), so scraper upserts don't invalidate it.
+
+BEGIN;
+
+INSERT INTO public.cache_generations (name) VALUES ('product_names')
+ON CONFLICT (name) DO NOTHING;
+
+-- products: statement-level with transition tables. The function joins
+-- old_rows to new_rows on id and bumps the counter once per statement,
+-- only if some name actually changed, so scraper upserts that rewrite
+-- the same names don't bump it. UPDATE OF name can't be used here:
+-- transition tables are not allowed on triggers with column lists.
+CREATE OR REPLACE FUNCTION public.trg_products_names_cache_gen()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    IF EXISTS (
+      SELECT 1 FROM old_rows o JOIN new_rows n ON n.id = o.id
+      WHERE n.name IS DISTINCT FROM o.name
+    ) THEN
+      PERFORM public.bump_cache_generation('product_names');
+    END IF;
+  ELSIF TG_OP = 'DELETE' THEN
+    IF EXISTS (SELECT 1 FROM old_rows) THEN
+      PERFORM public.bump_cache_generation('product_names');
+    END IF;
+  END IF;
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_products_rename_cache_gen ON public.products;
+CREATE TRIGGER trg_products_rename_cache_gen
+  AFTER UPDATE ON public.products
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_names_cache_gen();
+
+DROP TRIGGER IF EXISTS trg_products_delete_cache_gen ON public.products;
+CREATE TRIGGER trg_products_delete_cache_gen
+  AFTER DELETE ON public.products
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_products_names_cache_gen();
+
+DROP TRIGGER IF EXISTS trg_product_aliases_cache_gen ON public.product_aliases;
+CREATE TRIGGER trg_product_aliases_cache_gen
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.product_aliases
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation('product_names');
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- 2026-10-16-product-search-docs-cache-gen.sql
+-- 'product_search_docs' generation for the API's in-process typeahead
+-- index (services/search_index.py). Every statement that rewrites search
+-- documents — the incremental refresh_product_search_docs() runs and the
+-- nightly full rebuild — bumps it once, and the background refresher
+-- reloads the index only when it moved.
+
+BEGIN;
+
+INSERT INTO public.cache_generations (name) VALUES ('product_search_docs')
+ON CONFLICT (name) DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_product_search_docs_cache_gen ON public.product_search_docs;
+CREATE TRIGGER trg_product_search_docs_cache_gen
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.product_search_docs
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_bump_cache_generation('product_search_docs');
+
+COMMIT;
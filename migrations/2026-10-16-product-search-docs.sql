@@ -0,0 +1,386 @@
+-- 2026-10-16-product-search-docs.sql
+-- Denormalized search document per dedup group for /products,
+-- /products/search and /products/brands (api/products.py).
+--
+-- Those endpoints used to run, per request, DISTINCT ON over
+-- products ⋈ product_group_members ⋈ product_groups ordered by a
+-- nine-branch ILIKE CASE on source_url, a correlated EXISTS over
+-- current_prices for freshness, and a text-keyed join to mv_group_chains.
+-- product_search_docs holds that result once per dedup key
+-- (group id, or 'u_<product_id>' for ungrouped products):
+--
+--   product_id      representative product (fresh first, then
+--                   products.source_priority, image, EAN, id — same order
+--                   as before)
+--   last_price_at   newest collected_at over the members; the 14-day
+--                   freshness window is applied at query time
+--   display_name    COALESCE(NULLIF(canonical_name, ''), name)
+--   category_code   COALESCE(NULLIF(TRIM(pg.sub_code), ''), p.sub_code)
+--   chains/min_price copied from mv_group_chains
+--   search_text     lower(unaccent()) of every member's search_text plus
+--                   the group's; trigram-indexed for token ILIKE matching
+--
+-- Maintenance is incremental: triggers on current_prices, products,
+-- product_group_members and product_groups queue affected product ids in
+-- product_search_dirty, and refresh_product_search_docs() rebuilds only
+-- the dedup keys those products touch. The API's background refresher
+-- (services/search_docs.py) drains the queue; refresh-views.yml runs a
+-- full rebuild after the nightly mv_group_chains refresh. The same runs
+-- rebuild product_cards for the members of the rebuilt keys
+-- (2026-10-16-product-cards.sql).
+--
+-- product_groups / product_group_members / mv_group_chains are created
+-- outside migrations/, hence plpgsql (bodies resolved at call time) and
+-- guarded trigger attachment.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.product_search_docs (
+  dedup_key      TEXT        PRIMARY KEY,
+  group_id       INT,
+  product_id     INT         NOT NULL,
+  source_priority SMALLINT   NOT NULL,
+  last_price_at  TIMESTAMPTZ,
+  display_name   TEXT        NOT NULL,
+  canonical_name TEXT,
+  group_brand    TEXT,
+  category_code  TEXT,
+  group_sub_code TEXT,
+  food_group     TEXT,
+  chains         TEXT[],
+  min_price      NUMERIC,
+  search_text    TEXT        NOT NULL DEFAULT '',
+  refreshed_at   TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS ix_psd_search_trgm
+  ON public.product_search_docs USING gin (search_text gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_psd_display_name
+  ON public.product_search_docs (display_name, product_id);
+CREATE INDEX IF NOT EXISTS ix_psd_category
+  ON public.product_search_docs (category_code, display_name);
+CREATE INDEX IF NOT EXISTS ix_psd_food_group
+  ON public.product_search_docs (food_group, display_name);
+CREATE INDEX IF NOT EXISTS ix_psd_group_sub_code
+  ON public.product_search_docs (group_sub_code) WHERE group_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_psd_product
+  ON public.product_search_docs (product_id);
+
+CREATE TABLE IF NOT EXISTS public.product_search_dirty (
+  product_id INT PRIMARY KEY
+);
+
+-- Rebuild the documents touched by queued products (or all of them when
+-- p_full). Concurrent callers skip instead of queueing behind each other.
+CREATE OR REPLACE FUNCTION public.refresh_product_search_docs(p_full BOOLEAN DEFAULT false)
+RETURNS INT
+LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('product_search_docs')) THEN
+    RETURN 0;
+  END IF;
+
+  CREATE TEMP TABLE IF NOT EXISTS _psd_keys (
+    dedup_key  TEXT PRIMARY KEY,
+    group_id   INT,
+    product_id INT
+  ) ON COMMIT DROP;
+  TRUNCATE _psd_keys;
+
+  IF p_full THEN
+    DELETE FROM public.product_search_dirty;
+    INSERT INTO _psd_keys (dedup_key, group_id, product_id)
+    SELECT COALESCE(pgm.group_id::text, 'u_' || p.id::text), pgm.group_id,
+           CASE WHEN pgm.group_id IS NULL THEN p.id END
+    FROM public.products p
+    LEFT JOIN public.product_group_members pgm ON pgm.product_id = p.id
+    ON CONFLICT DO NOTHING;
+    INSERT INTO _psd_keys (dedup_key, group_id, product_id)
+    SELECT d.dedup_key, d.group_id, CASE WHEN d.group_id IS NULL THEN d.product_id END
+    FROM public.product_search_docs d
+    ON CONFLICT DO NOTHING;
+  ELSE
+    WITH taken AS (
+      DELETE FROM public.product_search_dirty RETURNING product_id
+    )
+    INSERT INTO _psd_keys (dedup_key, group_id, product_id)
+    SELECT 'u_' || t.product_id::text, NULL::int, t.product_id FROM taken t
+    UNION
+    SELECT pgm.group_id::text, pgm.group_id, NULL::int
+    FROM taken t JOIN public.product_group_members pgm ON pgm.product_id = t.product_id
+    UNION
+    SELECT d.dedup_key, d.group_id, CASE WHEN d.group_id IS NULL THEN d.product_id END
+    FROM taken t JOIN public.product_search_docs d ON d.product_id = t.product_id
+    UNION
+    -- The key the product's card points at: moved or deleted products
+    -- must leave it.
+    SELECT c.dedup_key, c.group_id, CASE WHEN c.group_id IS NULL THEN c.product_id END
+    FROM taken t JOIN public.product_cards c ON c.product_id = t.product_id
+    ON CONFLICT DO NOTHING;
+  END IF;
+
+  -- Empty queue: leave the table untouched (statement triggers on it,
+  -- e.g. the cache generation bump, must not fire on no-op runs).
+  IF NOT EXISTS (SELECT 1 FROM _psd_keys) THEN
+    RETURN 0;
+  END IF;
+
+  DELETE FROM public.product_search_docs d
+  USING _psd_keys k
+  WHERE d.dedup_key = k.dedup_key;
+
+  INSERT INTO public.product_search_docs AS psd (
+    dedup_key, group_id, product_id, source_priority, last_price_at,
+    display_name, canonical_name, group_brand, category_code, group_sub_code,
+    food_group, chains, min_price, search_text
+  )
+  WITH members AS (
+    SELECT p.id AS product_id, k.group_id, k.dedup_key
+    FROM _psd_keys k JOIN public.products p ON p.id = k.product_id
+    WHERE k.group_id IS NULL
+      AND NOT EXISTS (SELECT 1 FROM public.product_group_members g WHERE g.product_id = p.id)
+    UNION ALL
+    SELECT pgm.product_id, k.group_id, k.dedup_key
+    FROM _psd_keys k JOIN public.product_group_members pgm ON pgm.group_id = k.group_id
+    WHERE k.group_id IS NOT NULL
+  ),
+  scored AS (
+    SELECT m.dedup_key, m.group_id, p.*,
+           -- products.last_price_at / source_priority (see
+           -- 2026-10-16-product-freshness-columns.sql); rows the backfill
+           -- has not reached yet fall back to computing them here.
+           COALESCE(p.last_price_at,
+                    (SELECT max(cp.collected_at) FROM public.current_prices cp
+                      WHERE cp.product_id = p.id)) AS product_last_price_at,
+           COALESCE(p.source_priority,
+                    public.product_source_priority(p.source_url)) AS rep_priority
+    FROM members m JOIN public.products p ON p.id = m.product_id
+  ),
+  agg AS (
+    SELECT dedup_key,
+           max(product_last_price_at) AS last_price_at,
+           string_agg(DISTINCT COALESCE(search_text, ''), ' ') AS member_text
+    FROM scored
+    GROUP BY dedup_key
+  ),
+  rep AS (
+    SELECT DISTINCT ON (s.dedup_key) s.*
+    FROM scored s
+    ORDER BY s.dedup_key,
+             (s.product_last_price_at > NOW() - INTERVAL '14 days') DESC NULLS LAST,
+             s.rep_priority,
+             CASE WHEN s.image_url IS NOT NULL AND s.image_url != '' THEN 0 ELSE 1 END,
+             CASE WHEN s.ean      IS NOT NULL AND s.ean      != '' THEN 0 ELSE 1 END,
+             s.id
+  )
+  SELECT r.dedup_key, r.group_id, r.id, r.rep_priority, a.last_price_at,
+         COALESCE(NULLIF(pg.canonical_name, ''), r.name, ''),
+         pg.canonical_name,
+         NULLIF(TRIM(pg.brand), ''),
+         COALESCE(NULLIF(TRIM(pg.sub_code), ''), r.sub_code),
+         pg.sub_code,
+         r.food_group,
+         gc.chains,
+         gc.min_price,
+         lower(unaccent(concat_ws(' ', a.member_text, pg.search_text)))
+  FROM rep r
+  JOIN agg a ON a.dedup_key = r.dedup_key
+  LEFT JOIN public.product_groups pg ON pg.id = r.group_id
+  LEFT JOIN public.mv_group_chains gc ON gc.dedup_key = r.dedup_key
+  ON CONFLICT (dedup_key) DO NOTHING;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+
+  -- Cards of the current members of every rebuilt key and of products
+  -- whose card still points at one of them.
+  IF p_full THEN
+    PERFORM public.refresh_product_cards(NULL);
+  ELSE
+    PERFORM public.refresh_product_cards(ARRAY(
+      SELECT k.product_id FROM _psd_keys k
+      WHERE k.group_id IS NULL AND k.product_id IS NOT NULL
+      UNION
+      SELECT pgm.product_id
+      FROM _psd_keys k JOIN public.product_group_members pgm ON pgm.group_id = k.group_id
+      WHERE k.group_id IS NOT NULL
+      UNION
+      SELECT c.product_id
+      FROM _psd_keys k JOIN public.product_cards c ON c.dedup_key = k.dedup_key
+    ));
+  END IF;
+
+  RETURN n;
+END
+$$;
+
+-- ---------------- dirty queue triggers ----------------
+
+-- New prices: only queue products whose document is missing or has not
+-- seen a price for a day — enough for the 14-day freshness window, and
+-- keeps repeated scraper runs from re-queueing the whole catalog.
+CREATE OR REPLACE FUNCTION public.trg_psd_queue_prices()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.product_search_dirty (product_id)
+  SELECT DISTINCT n.product_id
+  FROM changed_rows n
+  LEFT JOIN public.product_group_members pgm ON pgm.product_id = n.product_id
+  WHERE NOT EXISTS (
+    SELECT 1 FROM public.product_search_docs d
+    WHERE d.dedup_key = COALESCE(pgm.group_id::text, 'u_' || n.product_id::text)
+      AND d.last_price_at >= NOW() - INTERVAL '1 day'
+  )
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_psd_queue_rows()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.product_search_dirty (product_id)
+  SELECT DISTINCT product_id FROM changed_rows
+  WHERE product_id IS NOT NULL
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_psd_queue_product()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.product_search_dirty (product_id)
+  VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END)
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END
+$$;
+
+-- Group rename/re-brand/re-categorise/delete: queue the products whose
+-- documents carry the group.
+CREATE OR REPLACE FUNCTION public.trg_psd_queue_groups()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.product_search_dirty (product_id)
+  SELECT d.product_id
+  FROM public.product_search_docs d
+  WHERE d.group_id IN (SELECT id FROM changed_rows)
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_psd_queue_all()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.product_search_dirty (product_id)
+  SELECT product_id FROM public.product_search_docs
+  ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_products_search_docs ON public.products;
+CREATE TRIGGER trg_products_search_docs
+  AFTER UPDATE ON public.products
+  FOR EACH ROW
+  WHEN (OLD.name       IS DISTINCT FROM NEW.name
+     OR OLD.image_url  IS DISTINCT FROM NEW.image_url
+     OR OLD.ean        IS DISTINCT FROM NEW.ean
+     OR OLD.source_url IS DISTINCT FROM NEW.source_url
+     OR OLD.sub_code   IS DISTINCT FROM NEW.sub_code
+     OR OLD.food_group IS DISTINCT FROM NEW.food_group
+     OR OLD.search_text IS DISTINCT FROM NEW.search_text
+     -- product_cards-only columns
+     OR OLD.brand        IS DISTINCT FROM NEW.brand
+     OR OLD.manufacturer IS DISTINCT FROM NEW.manufacturer
+     OR OLD.size_text    IS DISTINCT FROM NEW.size_text
+     OR OLD.amount       IS DISTINCT FROM NEW.amount)
+  EXECUTE FUNCTION public.trg_psd_queue_product();
+
+DROP TRIGGER IF EXISTS trg_products_search_docs_del ON public.products;
+CREATE TRIGGER trg_products_search_docs_del
+  AFTER DELETE ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.trg_psd_queue_product();
+
+DO $$
+BEGIN
+  IF to_regclass('public.product_group_members') IS NOT NULL THEN
+    DROP TRIGGER IF EXISTS trg_current_prices_search_docs_ins ON public.current_prices;
+    CREATE TRIGGER trg_current_prices_search_docs_ins
+      AFTER INSERT ON public.current_prices
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_prices();
+
+    DROP TRIGGER IF EXISTS trg_current_prices_search_docs_upd ON public.current_prices;
+    CREATE TRIGGER trg_current_prices_search_docs_upd
+      AFTER UPDATE ON public.current_prices
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_prices();
+
+    DROP TRIGGER IF EXISTS trg_pgm_search_docs_ins ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_search_docs_ins
+      AFTER INSERT ON public.product_group_members
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_rows();
+
+    DROP TRIGGER IF EXISTS trg_pgm_search_docs_upd ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_search_docs_upd
+      AFTER UPDATE ON public.product_group_members
+      REFERENCING OLD TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_rows();
+
+    DROP TRIGGER IF EXISTS trg_pgm_search_docs_upd_new ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_search_docs_upd_new
+      AFTER UPDATE ON public.product_group_members
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_rows();
+
+    DROP TRIGGER IF EXISTS trg_pgm_search_docs_del ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_search_docs_del
+      AFTER DELETE ON public.product_group_members
+      REFERENCING OLD TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_rows();
+
+    DROP TRIGGER IF EXISTS trg_pgm_search_docs_trunc ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_search_docs_trunc
+      AFTER TRUNCATE ON public.product_group_members
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_all();
+  END IF;
+
+  IF to_regclass('public.product_groups') IS NOT NULL THEN
+    DROP TRIGGER IF EXISTS trg_product_groups_search_docs_upd ON public.product_groups;
+    CREATE TRIGGER trg_product_groups_search_docs_upd
+      AFTER UPDATE ON public.product_groups
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_groups();
+
+    DROP TRIGGER IF EXISTS trg_product_groups_search_docs_del ON public.product_groups;
+    CREATE TRIGGER trg_product_groups_search_docs_del
+      AFTER DELETE ON public.product_groups
+      REFERENCING OLD TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_psd_queue_groups();
+  END IF;
+END$$;
+
+-- One-time build. This file is re-applied on every push, so only run it
+-- while the table is empty (and the group tables exist).
+DO $$
+BEGIN
+  IF to_regclass('public.product_group_members') IS NOT NULL
+     AND to_regclass('public.mv_group_chains') IS NOT NULL
+     AND NOT EXISTS (SELECT 1 FROM public.product_search_docs LIMIT 1) THEN
+    PERFORM public.refresh_product_search_docs(true);
+  END IF;
+END$$;
+
+ANALYZE public.product_search_docs;
+
+COMMIT;
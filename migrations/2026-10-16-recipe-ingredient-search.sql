@@ -0,0 +1,57 @@
+-- 2026-10-16-recipe-ingredient-search.sql
+-- Support for the set-based recipe ingredient search
+-- (services/ingredient_search.py): one query for all (ingredient, term)
+-- pairs of a request instead of one ILIKE scan per term.
+--
+-- recipe_excluded: ready meals / protected-origin labels that must never
+-- be picked as a raw recipe ingredient. Precomputed once per row instead
+-- of six NOT ILIKE checks per matched (product, term) pair.
+--
+-- A plain nullable column set by a BEFORE trigger on insert / name change,
+-- not a STORED generated column: adding one rewrites all of products
+-- under an ACCESS EXCLUSIVE lock, and this file is re-applied on every
+-- push. Existing rows are filled by scripts/backfill_recipe_excluded.py
+-- (batched, manual workflow); until then services/ingredient_search.py
+-- evaluates product_recipe_excluded(name) for NULL rows.
+--
+-- Term matching itself uses lower(name) LIKE '%term%', which the existing
+-- trigram index idx_products_name_trgm (lower(name) gin_trgm_ops) serves.
+
+BEGIN;
+
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS recipe_excluded BOOLEAN;
+
+CREATE OR REPLACE FUNCTION public.product_recipe_excluded(p_name TEXT)
+RETURNS BOOLEAN
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT COALESCE(
+    p_name ILIKE '%kaitstud%'
+    OR p_name ILIKE '%geograafilise%'
+    OR p_name ILIKE '%strooganov%'
+    OR p_name ILIKE '%valmistoit%'
+    OR p_name ILIKE '%praad%'
+    OR p_name ILIKE '%kotlet%',
+    false
+  );
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_products_recipe_excluded()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.recipe_excluded := public.product_recipe_excluded(NEW.name);
+  RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_products_recipe_excluded ON public.products;
+CREATE TRIGGER trg_products_recipe_excluded
+  BEFORE INSERT OR UPDATE OF name ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.trg_products_recipe_excluded();
+
+-- Backfill script's work queue.
+CREATE INDEX IF NOT EXISTS ix_products_recipe_excluded_missing
+  ON public.products (id)
+  WHERE recipe_excluded IS NULL;
+
+COMMIT;
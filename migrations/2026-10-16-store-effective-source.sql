@@ -0,0 +1,63 @@
+-- 2026-10-16-store-effective-source.sql
+-- Materialized "effective price source" per store.
+--
+-- Every price query used to rebuild the mapping inline:
+--   COALESCE((SELECT DISTINCT ON (store_id) source_store_id
+--             FROM store_price_source ORDER BY store_id, source_store_id), s.id)
+-- This table holds the result for every store (stores without a mapping
+-- point at themselves) and is kept in sync by statement-level triggers on
+-- stores and store_price_source, so seeding scripts (scrape_*_stores.py,
+-- seed_selver_stores.py) and the fallback-mapping migrations maintain it
+-- without any changes on their side.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.store_effective_source (
+  store_id        INT PRIMARY KEY REFERENCES public.stores(id) ON DELETE CASCADE,
+  source_store_id INT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_ses_source ON public.store_effective_source (source_store_id);
+
+CREATE OR REPLACE FUNCTION public.refresh_store_effective_source()
+RETURNS void
+LANGUAGE sql AS $$
+  INSERT INTO public.store_effective_source AS ses (store_id, source_store_id)
+  SELECT s.id, COALESCE(m.source_store_id, s.id)
+  FROM public.stores s
+  LEFT JOIN (
+    SELECT DISTINCT ON (store_id) store_id, source_store_id
+    FROM public.store_price_source
+    ORDER BY store_id, source_store_id
+  ) m ON m.store_id = s.id
+  ON CONFLICT (store_id) DO UPDATE
+     SET source_store_id = EXCLUDED.source_store_id
+   WHERE ses.source_store_id IS DISTINCT FROM EXCLUDED.source_store_id;
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_refresh_store_effective_source()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM public.refresh_store_effective_source();
+  RETURN NULL;
+END
+$$;
+
+-- Deleted stores drop out via ON DELETE CASCADE; inserts, updates and
+-- mapping changes go through the refresh (a few hundred rows).
+DROP TRIGGER IF EXISTS trg_stores_effective_source ON public.stores;
+CREATE TRIGGER trg_stores_effective_source
+  AFTER INSERT OR UPDATE OF id ON public.stores
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_refresh_store_effective_source();
+
+DROP TRIGGER IF EXISTS trg_store_price_source_effective_source ON public.store_price_source;
+CREATE TRIGGER trg_store_price_source_effective_source
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.store_price_source
+  FOR EACH STATEMENT EXECUTE FUNCTION public.trg_refresh_store_effective_source();
+
+SELECT public.refresh_store_effective_source();
+
+ANALYZE public.store_effective_source;
+
+COMMIT;
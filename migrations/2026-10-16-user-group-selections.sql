@@ -0,0 +1,114 @@
+-- 2026-10-16-user-group-selections.sql
+-- Per-user selection counts per dedup group for personalized /products.
+--
+-- Personalized listings used to aggregate the user's whole
+-- user_product_selections history joined with product_group_members on
+-- every request (selection_totals CTE). user_group_selections holds that
+-- result, keyed like product_search_docs (group id or 'u_<product_id>'):
+--
+--   * api/selections.py record_selection increments the row(s) of the
+--     selected product's group(s) in the same statement as the
+--     user_product_selections upsert;
+--   * group membership changes (build_product_groups.sql, match imports)
+--     re-aggregate the users who selected an affected product;
+--   * account deletion (auth.py) deletes the user's rows.
+--
+-- user_product_selections / product_group_members are created outside
+-- migrations/, hence plpgsql and guarded trigger attachment.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.user_group_selections (
+  user_id    INT         NOT NULL,
+  dedup_key  TEXT        NOT NULL,
+  count      BIGINT      NOT NULL DEFAULT 0,
+  last_used  TIMESTAMPTZ,
+  PRIMARY KEY (user_id, dedup_key)
+);
+
+-- Re-aggregate the given users (NULL = everyone) from user_product_selections.
+CREATE OR REPLACE FUNCTION public.refresh_user_group_selections(p_user_ids INT[] DEFAULT NULL)
+RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM public.user_group_selections
+  WHERE p_user_ids IS NULL OR user_id = ANY(p_user_ids);
+
+  INSERT INTO public.user_group_selections (user_id, dedup_key, count, last_used)
+  SELECT ups.user_id,
+         COALESCE(pgm.group_id::text, 'u_' || ups.product_id::text),
+         SUM(ups.count),
+         MAX(ups.last_used)
+  FROM public.user_product_selections ups
+  LEFT JOIN public.product_group_members pgm ON pgm.product_id = ups.product_id
+  WHERE p_user_ids IS NULL OR ups.user_id = ANY(p_user_ids)
+  GROUP BY 1, 2;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_ugs_regroup()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM public.refresh_user_group_selections(ARRAY(
+    SELECT DISTINCT ups.user_id
+    FROM public.user_product_selections ups
+    WHERE ups.product_id IN (SELECT product_id FROM changed_rows)
+  ));
+  RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_ugs_regroup_all()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM public.refresh_user_group_selections(NULL);
+  RETURN NULL;
+END
+$$;
+
+DO $$
+BEGIN
+  IF to_regclass('public.product_group_members') IS NOT NULL
+     AND to_regclass('public.user_product_selections') IS NOT NULL THEN
+    DROP TRIGGER IF EXISTS trg_pgm_user_selections_ins ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_user_selections_ins
+      AFTER INSERT ON public.product_group_members
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_ugs_regroup();
+
+    -- UPDATE: a moved product affects both its old and new group.
+    DROP TRIGGER IF EXISTS trg_pgm_user_selections_upd_old ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_user_selections_upd_old
+      AFTER UPDATE ON public.product_group_members
+      REFERENCING OLD TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_ugs_regroup();
+
+    DROP TRIGGER IF EXISTS trg_pgm_user_selections_upd_new ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_user_selections_upd_new
+      AFTER UPDATE ON public.product_group_members
+      REFERENCING NEW TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_ugs_regroup();
+
+    DROP TRIGGER IF EXISTS trg_pgm_user_selections_del ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_user_selections_del
+      AFTER DELETE ON public.product_group_members
+      REFERENCING OLD TABLE AS changed_rows
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_ugs_regroup();
+
+    DROP TRIGGER IF EXISTS trg_pgm_user_selections_trunc ON public.product_group_members;
+    CREATE TRIGGER trg_pgm_user_selections_trunc
+      AFTER TRUNCATE ON public.product_group_members
+      FOR EACH STATEMENT EXECUTE FUNCTION public.trg_ugs_regroup_all();
+
+    -- One-time fill; this file is re-applied on every push.
+    IF NOT EXISTS (SELECT 1 FROM public.user_group_selections LIMIT 1) THEN
+      PERFORM public.refresh_user_group_selections(NULL);
+    END IF;
+  END IF;
+END$$;
+
+ANALYZE public.user_group_selections;
+
+COMMIT;
@@ -1,10 +1,12 @@
-import json
 import os
 import httpx
 from fastapi import APIRouter, HTTPException, Request, Query
 from typing import Optional
 
 from utils.throttle import throttle
+from services.store_index import get_store_index
+from services.ingredient_search import cheapest_per_chain
+from services.ingredient_resolver import SKIP_INGREDIENTS, get_ingredient_resolver
 
 router = APIRouter()
 
@@ -25,11 +27,6 @@ FEATURED_MEALS = [
     ("52959", "Ahjulõhe apteegitilliga"),
 ]
 
-SKIP_INGREDIENTS = {
-    "water", "salt", "black pepper", "pepper", "white pepper",
-    "mixed herbs", "seasoning", "oil spray", "to taste",
-}
-
 CHAIN_DISPLAY_NAMES = {
     "rimi": "Rimi",
     "selver": "Selver",
@@ -39,27 +36,6 @@ CHAIN_DISPLAY_NAMES = {
     "barbora": "Maxima",
 }
 
-VALID_SUB_CODES = [
-    "dry_pasta_rice", "dairy_eggs", "dairy_milk", "dairy_butter_margarine",
-    "dairy_cream_sourcream", "dairy_yogurt_kefir", "cheese_regular",
-    "cheese_delicatessen", "dairy_cheese_slices", "meat_poultry", "meat_beef_lamb_game",
-    "meat_minced", "meat_pork", "meat_hams", "meat_sausages",
-    "fish_fresh", "fish_salted_smoked", "fish_other", "fish_processed",
-    "produce_root_veg", "produce_mushrooms", "produce_tropical",
-    "produce_herbs_salads_sprouts", "produce_smoothies_fresh_juices",
-    "dry_flour_sugar_baking", "dry_canned_veg", "dry_other", "dry_ready_meals_jars",
-    "frozen_bakery", "frozen_veg", "frozen_berries_fruit", "frozen_ready_meals",
-    "frozen_meat", "frozen_other", "frozen_desserts_icecream",
-    "oils_olive", "oils_other", "oils_vinegar",
-    "sauces_ketchup_mayo", "sauces_pasta_cooking", "sauces_soy_worcester",
-    "sauces_other", "sauces_marinades",
-    "spices_herbs_spice_mix", "spices_broth_stock",
-    "drinks_wine", "drinks_beer_cider", "drinks_soft_soda",
-    "sweets_chocolate_bars", "sweets_nuts_driedfruit",
-    "bakery_other", "bakery_bread_loaves",
-    "dry_canned_fruit",
-]
-
 INGREDIENT_TRANSLATIONS = {
     "chicken": "kana", "chicken breast": "kanafileed", "chicken breasts": "kanafileed",
     "chicken thighs": "kanareis", "chicken wings": "kanatiivad", "whole chicken": "terve kana",
@@ -284,199 +260,48 @@ async def get_or_create_translation(db, meal_id: str, meal: dict, recipe_name: s
     }
 
 
-async def get_cached_ingredient(db, ingredient_en: str):
-    row = await db.fetchrow(
-        "SELECT search_terms, sub_codes FROM recipe_ingredient_cache WHERE ingredient_en = $1",
-        ingredient_en.lower().strip()
-    )
-    if row:
-        return {"search_terms": list(row["search_terms"]), "sub_codes": list(row["sub_codes"])}
-    return None
-
-
-async def save_ingredient_cache(db, ingredient_en: str, search_terms: list, sub_codes: list):
-    await db.execute(
-        """INSERT INTO recipe_ingredient_cache (ingredient_en, search_terms, sub_codes)
-           VALUES ($1, $2, $3)
-           ON CONFLICT (ingredient_en) DO UPDATE
-           SET search_terms = EXCLUDED.search_terms,
-               sub_codes = EXCLUDED.sub_codes,
-               created_at = NOW()""",
-        ingredient_en.lower().strip(), search_terms, sub_codes
-    )
-
-
-async def ask_claude_for_ingredient(ingredient_en: str) -> dict:
-    if not ANTHROPIC_API_KEY:
-        return {"search_terms": [ingredient_en.lower()], "sub_codes": []}
-
-    prompt = f"""You help match recipe ingredients to Estonian grocery store product names.
-
-Ingredient: "{ingredient_en}"
-
-CRITICAL: search_terms MUST be Estonian words used in store databases. sub_codes MUST come from the list.
-
-Estonian translations:
-- bacon, pancetta → "peekon"
-- egg, eggs, egg yolks → "muna"
-- spaghetti → "spaghetti"
-- parmesan, pecorino, hard cheese → "parmesan", "parmigiano", "grana padano", "dziugas"
-- butter → "või"
-- milk → "piim"
-- cream, double cream, heavy cream → "koor", "vahukoor"
-- chicken breast → "kanafileed"
-- chicken wings → "kanatiivad"
-- ground beef, minced beef → "veisehakkliha"
-- beef → "veiseliha"
-- pork → "sealiha"
-- salmon → "lõhe"
-- onion → "sibul"
-- garlic → "küüslauk"
-- tomato, tomatoes → "tomat"
-- cherry tomatoes → "kirsstomat"
-- carrot → "porgand"
-- potato → "kartul"
-- mushrooms → "seened"
-- olive oil → "oliiviõli"
-- flour, plain flour → "jahu"
-- sugar → "suhkur"
-- rice → "riis"
-- pasta → "pasta"
-- lemon → "sidrun"
-- cheese → "juust"
-- mozzarella → "mozzarella"
-- honey → "mesi"
-- mustard → "sinep"
-- soy sauce → "sojakaste"
-- white wine → "valge vein"
-- red wine → "punane vein", "merlot", "cabernet", "shiraz", "malbec", "pinot noir", "tempranillo", "syrah"
-
-Valid sub_codes: {json.dumps(VALID_SUB_CODES)}
-
-Examples:
-- "bacon" → {{"search_terms": ["peekon"], "sub_codes": ["meat_hams"]}}
-- "egg yolks" → {{"search_terms": ["muna"], "sub_codes": ["dairy_eggs"]}}
-- "parmesan" → {{"search_terms": ["parmesan", "parmigiano", "grana padano", "dziugas"], "sub_codes": ["cheese_regular", "cheese_delicatessen"]}}
-- "spaghetti" → {{"search_terms": ["spaghetti"], "sub_codes": ["dry_pasta_rice"]}}
-- "red wine" → {{"search_terms": ["punane vein", "merlot", "cabernet", "shiraz", "malbec", "pinot noir", "tempranillo", "syrah"], "sub_codes": ["drinks_wine"]}}
-- "white wine" → {{"search_terms": ["valge vein", "chardonnay", "sauvignon", "riesling", "pinot grigio"], "sub_codes": ["drinks_wine"]}}
-- "water" → {{"search_terms": [], "sub_codes": []}}
-- "salt" → {{"search_terms": [], "sub_codes": []}}
-
-Return ONLY valid JSON for "{ingredient_en}":"""
+async def resolve_ingredient(db, ingredient_en: str) -> dict:
+    resolved = await get_ingredient_resolver().resolve(db, ingredient_en)
+    if resolved is None:
+        # Claude ei vastanud (negatiivne vahemälu) — otsime ingliskeelse
+        # nimega, aga seda tabelisse ei salvestata.
+        return {"search_terms": [ingredient_en.lower().strip()], "sub_codes": []}
+    return resolved
+
+
+async def find_products_per_store_for_ingredients(db, ingredients_en: list) -> dict:
+    """{ingredient_en: {kett: toode}} kõigi koostisosade jaoks — otsingusõnad
+    lahendatakse paralleelselt, tooted leitakse ÜHE päringuga
+    (services/ingredient_search.py)."""
+    import asyncio
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(
-            ANTHROPIC_API_URL,
-            headers={
-                "x-api-key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json",
-            },
-            json={
-                "model": "claude-haiku-4-5-20251001",
-                "max_tokens": 200,
-                "messages": [{"role": "user", "content": prompt}],
+    unique = list(dict.fromkeys(ingredients_en))
+    resolved_list = await asyncio.gather(*[resolve_ingredient(db, ing) for ing in unique])
+    resolved = {ing: r for ing, r in zip(unique, resolved_list) if r.get("search_terms")}
+    rows_by_ingredient = await cheapest_per_chain(db, resolved, price_column="price")
+
+    results = {}
+    for ing in unique:
+        results_by_chain = {}
+        for chain, r in rows_by_ingredient.get(ing, {}).items():
+            results_by_chain[chain] = {
+                "product_id": r["id"],
+                "name": r["name"],
+                "chain": chain,
+                "image_url": r["image_url"] or "",
+                "brand": r["brand"] or "",
+                "size_text": r["size_text"] or "",
+                "is_per_kg": (r["size_text"] or "").lower() == "kg",
+                "price": float(r["min_price"]),
+                "quantity": 1,
             }
-        )
-        data = resp.json()
-        if "error" in data:
-            raise ValueError(f"API error: {data['error']}")
-        if "content" not in data:
-            raise ValueError(f"Unexpected response: {data}")
-        text = data["content"][0]["text"].strip()
-        text = text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
-
-
-async def resolve_ingredient(db, ingredient_en: str) -> dict:
-    name_lower = ingredient_en.lower().strip()
-    if name_lower in SKIP_INGREDIENTS:
-        return {"search_terms": [], "sub_codes": []}
-    cached = await get_cached_ingredient(db, name_lower)
-    if cached:
-        return cached
-    try:
-        result = await ask_claude_for_ingredient(ingredient_en)
-    except Exception as e:
-        print(f"[recipes] Claude API error for '{ingredient_en}': {e}")
-        import traceback; traceback.print_exc()
-        result = {"search_terms": [name_lower], "sub_codes": []}
-    await save_ingredient_cache(db, name_lower, result["search_terms"], result["sub_codes"])
-    return result
+        results[ing] = results_by_chain
+    return results
 
 
 async def find_products_per_store_for_ingredient(db, ingredient_en: str) -> dict:
-    resolved = await resolve_ingredient(db, ingredient_en)
-    search_terms = resolved.get("search_terms", [])
-    sub_codes = resolved.get("sub_codes", [])
-
-    if not search_terms:
-        return {}
-
-    results_by_chain = {}
-
-    for term in search_terms:
-        if sub_codes:
-            rows = await db.fetch("""
-                SELECT p.id, p.name, p.chain, p.image_url, p.brand, p.size_text,
-                    MIN(pr.price) as min_price
-                FROM products p
-                JOIN prices pr ON pr.product_id = p.id
-                WHERE p.name ILIKE $1
-                  AND p.sub_code = ANY($2::text[])
-                  AND pr.price > 0
-                  AND pr.collected_at > NOW() - INTERVAL '14 days'
-                  AND p.name NOT ILIKE '%kaitstud%'
-                  AND p.name NOT ILIKE '%geograafilise%'
-                  AND p.name NOT ILIKE '%strooganov%'
-                  AND p.name NOT ILIKE '%valmistoit%'
-                  AND p.name NOT ILIKE '%praad%'
-                  AND p.name NOT ILIKE '%kotlet%'
-                GROUP BY p.id, p.name, p.chain, p.image_url, p.brand, p.size_text
-                ORDER BY p.chain, min_price ASC
-            """, f"%{term}%", sub_codes)
-        else:
-            rows = await db.fetch("""
-                SELECT p.id, p.name, p.chain, p.image_url, p.brand, p.size_text,
-                    MIN(pr.price) as min_price
-                FROM products p
-                JOIN prices pr ON pr.product_id = p.id
-                WHERE p.name ILIKE $1
-                  AND p.sub_code NOT IN (
-                    'hh_other','hh_cleaners','hh_laundry','hh_dishwashing',
-                    'pcare_oral_care','pcare_other','pcare_feminine_hygiene',
-                    'baby_diapers','pet_cat_wet','pet_dog_wet','pet_cat_dry','pet_dog_dry'
-                  )
-                  AND pr.price > 0
-                  AND pr.collected_at > NOW() - INTERVAL '14 days'
-                  AND p.name NOT ILIKE '%kaitstud%'
-                  AND p.name NOT ILIKE '%geograafilise%'
-                  AND p.name NOT ILIKE '%strooganov%'
-                  AND p.name NOT ILIKE '%valmistoit%'
-                  AND p.name NOT ILIKE '%praad%'
-                  AND p.name NOT ILIKE '%kotlet%'
-                GROUP BY p.id, p.name, p.chain, p.image_url, p.brand, p.size_text
-                ORDER BY p.chain, min_price ASC
-            """, f"%{term}%")
-
-        for r in rows:
-            chain = (r["chain"] or "").lower()
-            price = float(r["min_price"])
-            if chain not in results_by_chain or price < results_by_chain[chain]["price"]:
-                results_by_chain[chain] = {
-                    "product_id": r["id"],
-                    "name": r["name"],
-                    "chain": chain,
-                    "image_url": r["image_url"] or "",
-                    "brand": r["brand"] or "",
-                    "size_text": r["size_text"] or "",
-                    "is_per_kg": (r["size_text"] or "").lower() == "kg",
-                    "price": price,
-                    "quantity": 1,
-                }
-
-    return results_by_chain
+    by_ingredient = await find_products_per_store_for_ingredients(db, [ingredient_en])
+    return by_ingredient.get(ingredient_en, {})
 
 
 async def find_product_for_ingredient(db, ingredient_en: str):
@@ -486,7 +311,21 @@ async def find_product_for_ingredient(db, ingredient_en: str):
     return min(per_store.values(), key=lambda x: x["price"])
 
 
+def _chain_key(chain: str) -> str:
+    chain = chain.lower()
+    return "barbora" if chain == "maxima" else chain
+
+
 async def _get_nearby_chains(db, lat: float, lon: float, radius_km: float) -> dict:
+    index = get_store_index()
+    if index.ready:
+        # within() on kauguse järgi sorditud — esimene tabamus on keti lähim pood.
+        nearest: dict = {}
+        for store, distance_km in index.within(lat, lon, radius_km):
+            if store.chain:
+                nearest.setdefault(_chain_key(store.chain), round(distance_km, 2))
+        return nearest
+
     rows = await db.fetch("""
         WITH with_dist AS (
             SELECT
@@ -574,23 +413,17 @@ async def get_recipe_compare(
     if lat is not None and lon is not None:
         nearby_chains = await _get_nearby_chains(db, lat, lon, radius_km)
 
-    import asyncio
-
-    async def _resolve_one(ing):
-        name_lower = ing["name_en"].lower().strip()
-        if name_lower in SKIP_INGREDIENTS:
-            return None
-        per_store = await find_products_per_store_for_ingredient(db, ing["name_en"])
-        return {
+    wanted = [ing for ing in ingredients if ing["name_en"].lower().strip() not in SKIP_INGREDIENTS]
+    per_store_by_en = await find_products_per_store_for_ingredients(db, [ing["name_en"] for ing in wanted])
+    ingredient_results = [
+        {
             "ingredient_name": ing["name_et"],
             "ingredient_name_en": ing["name_en"],
             "measure": ing["measure_et"],
-            "by_chain": per_store,
+            "by_chain": per_store_by_en.get(ing["name_en"], {}),
         }
-
-    tasks = [_resolve_one(ing) for ing in ingredients]
-    results = await asyncio.gather(*tasks)
-    ingredient_results = [r for r in results if r is not None]
+        for ing in wanted
+    ]
 
     all_chains = set()
     for ir in ingredient_results:
@@ -674,24 +507,23 @@ async def get_recipe_basket(meal_id: str, request: Request):
         meal["strMeal"]
     )
 
-    import asyncio
+    per_store_by_en = await find_products_per_store_for_ingredients(db, [ing["name_en"] for ing in ingredients])
 
-    async def _resolve_basket_ing(ing):
-        product = await find_product_for_ingredient(db, ing["name_en"])
-        if product:
+    matched = []
+    not_found = []
+    for ing in ingredients:
+        per_store = per_store_by_en.get(ing["name_en"])
+        if per_store:
+            product = dict(min(per_store.values(), key=lambda x: x["price"]))
             product["ingredient_name"] = ing["name_et"]
             product["measure"] = ing["measure_et"]
-            return ("matched", product)
-        return ("not_found", {
-            "name_en": ing["name_en"],
-            "name_et": ing["name_et"],
-            "measure": ing["measure_et"],
-        })
-
-    tasks = [_resolve_basket_ing(ing) for ing in ingredients]
-    results = await asyncio.gather(*tasks)
-    matched = [r[1] for r in results if r[0] == "matched"]
-    not_found = [r[1] for r in results if r[0] == "not_found"]
+            matched.append(product)
+        else:
+            not_found.append({
+                "name_en": ing["name_en"],
+                "name_et": ing["name_et"],
+                "measure": ing["measure_et"],
+            })
 
     return {
         "meal_id": meal_id,
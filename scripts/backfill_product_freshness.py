@@ -0,0 +1,87 @@
+# scripts/backfill_product_freshness.py
+"""
+Fills products.source_priority and products.last_price_at for rows that
+existed before migrations/2026-10-16-product-freshness-columns.sql.
+
+New and changed rows are maintained by triggers; this walks the
+"source_priority IS NULL" partial index in id batches, one short
+transaction per batch, so it can run next to the scrapers and be
+stopped/restarted at any point. Then queues a full product_search_docs
+rebuild so the documents pick up the new columns.
+
+Usage:
+  DATABASE_URL=postgresql://... python scripts/backfill_product_freshness.py [--batch 5000]
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import time
+from urllib.parse import urlparse, parse_qs
+
+import asyncpg
+
+BATCH_SQL = """
+WITH batch AS (
+  SELECT id FROM public.products
+  WHERE source_priority IS NULL
+  ORDER BY id
+  LIMIT $1
+)
+UPDATE public.products p
+   SET source_priority = public.product_source_priority(p.source_url),
+       last_price_at   = COALESCE(
+         p.last_price_at,
+         (SELECT max(cp.collected_at) FROM public.current_prices cp WHERE cp.product_id = p.id)
+       )
+FROM batch b
+WHERE p.id = b.id
+"""
+
+
+def ssl_context_for(url: str) -> ssl.SSLContext | None:
+    """libpq sslmode semantics for asyncpg (same as scripts/backfill_qty.py)."""
+    q = parse_qs(urlparse(url).query)
+    mode = (q.get('sslmode', ['require'])[0] or 'require').lower()
+    if mode in ('disable',):
+        return None
+    ctx = ssl.create_default_context()
+    if mode in ('require', 'prefer', 'allow'):
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+async def main(batch: int) -> None:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+
+    conn = await asyncpg.connect(dsn=url, ssl=ssl_context_for(url), timeout=30)
+    try:
+        started = time.perf_counter()
+        total = 0
+        while True:
+            status = await conn.execute(BATCH_SQL, batch)
+            updated = int(status.split()[-1])
+            total += updated
+            print(f"  {total} products updated ({time.perf_counter() - started:.0f}s)")
+            if updated < batch:
+                break
+
+        await conn.execute("ANALYZE public.products")
+        if await conn.fetchval("SELECT to_regproc('public.refresh_product_search_docs') IS NOT NULL"):
+            rebuilt = await conn.fetchval("SELECT public.refresh_product_search_docs(true)")
+            print(f"Rebuilt {rebuilt} search documents")
+        print(f"Done: {total} products in {time.perf_counter() - started:.0f}s")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", type=int, default=5000)
+    args = ap.parse_args()
+    asyncio.run(main(args.batch))
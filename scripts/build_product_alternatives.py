@@ -0,0 +1,178 @@
+# scripts/build_product_alternatives.py
+"""
+Builds product_alternatives: for every product_search_docs group, the
+top-K most similar groups in the same category
+(migrations/2026-10-16-product-alternatives.sql).
+
+Similarity is the same as the live /products/alternatives query —
+word_similarity(unaccent(lower(origin)), unaccent(lower(neighbour))) —
+and in the produce family categories (services/produce_family.py) the
+origin's family keyword is the query and neighbours must belong to the
+family. Only categories whose documents changed since their last build
+(signature over keys, names and search text) are rebuilt (--full
+rebuilds all); each category is one transaction, so
+the endpoint never sees a half-built category.
+
+Usage:
+  DATABASE_URL=postgresql://... python scripts/build_product_alternatives.py [--full] [--k 40]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import ssl
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import asyncpg
+
+from services.produce_family import (
+    ALTERNATIVE_FAMILY_FILTER_SUB_CODES,
+    FAMILY_KEYWORDS_BY_NAME,
+    detect_produce_family,
+    family_ilike_patterns,
+)
+
+# Signature of everything the neighbours depend on; family and query text
+# derive from display_name, candidates' family match from search_text.
+CATEGORIES_SQL = """
+SELECT d.category_code AS sub_code,
+       COUNT(*) AS docs,
+       md5(string_agg(d.dedup_key || '|' || d.display_name || '|' || d.search_text,
+                      E'\\n' ORDER BY d.dedup_key)) AS signature,
+       s.signature AS built_signature
+FROM product_search_docs d
+LEFT JOIN product_alternatives_state s ON s.sub_code = d.category_code
+WHERE d.category_code IS NOT NULL
+GROUP BY d.category_code, s.signature
+ORDER BY d.category_code
+"""
+
+INSERT_SQL = """
+INSERT INTO product_alternatives
+       (dedup_key, rank, sub_code, family, alt_group_id, alt_product_id, similarity)
+SELECT o.dedup_key, n.rank, $1, o.family, n.group_id, n.product_id, n.similarity
+FROM _alt_origins o
+CROSS JOIN LATERAL (
+    SELECT ranked.*, row_number() OVER (
+               ORDER BY ranked.similarity DESC, ranked.display_name, ranked.dedup_key
+           ) AS rank
+    FROM (
+        SELECT d.dedup_key, d.display_name, d.group_id,
+               CASE WHEN d.group_id IS NULL THEN d.product_id END AS product_id,
+               word_similarity(unaccent(lower(o.query_text)),
+                               unaccent(lower(d.display_name))) AS similarity
+        FROM product_search_docs d
+        WHERE d.category_code = $1
+          AND (o.patterns IS NULL OR d.search_text ILIKE ANY(o.patterns))
+        ORDER BY similarity DESC, d.display_name, d.dedup_key
+        LIMIT $2
+    ) ranked
+) n
+"""
+
+
+def ssl_context_for(url: str) -> ssl.SSLContext | None:
+    """libpq sslmode semantics for asyncpg (same as scripts/backfill_qty.py)."""
+    q = parse_qs(urlparse(url).query)
+    mode = (q.get('sslmode', ['require'])[0] or 'require').lower()
+    if mode in ('disable',):
+        return None
+    ctx = ssl.create_default_context()
+    if mode in ('require', 'prefer', 'allow'):
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+def origins_for(sub_code: str, docs) -> list:
+    """(dedup_key, family, query_text, patterns) rows, same rules as the
+    live endpoint: family filter only in ALTERNATIVE_FAMILY_FILTER_SUB_CODES."""
+    apply_family = sub_code in ALTERNATIVE_FAMILY_FILTER_SUB_CODES
+    out = []
+    for d in docs:
+        family = detect_produce_family(d["display_name"]) if apply_family else None
+        if family is not None:
+            out.append((d["dedup_key"], family, FAMILY_KEYWORDS_BY_NAME[family][0],
+                        family_ilike_patterns(family)))
+        else:
+            out.append((d["dedup_key"], None, d["display_name"], None))
+    return out
+
+
+async def build_category(conn, sub_code: str, signature: str, k: int) -> int:
+    async with conn.transaction():
+        docs = await conn.fetch(
+            "SELECT dedup_key, display_name FROM product_search_docs WHERE category_code = $1",
+            sub_code,
+        )
+        await conn.execute(
+            "CREATE TEMP TABLE _alt_origins "
+            "(dedup_key TEXT, family TEXT, query_text TEXT, patterns TEXT[]) ON COMMIT DROP"
+        )
+        await conn.copy_records_to_table("_alt_origins", records=origins_for(sub_code, docs))
+        await conn.execute("DELETE FROM product_alternatives WHERE sub_code = $1", sub_code)
+        status = await conn.execute(INSERT_SQL, sub_code, k)
+        await conn.execute(
+            """
+            INSERT INTO product_alternatives_state (sub_code, signature, docs, built_at)
+            VALUES ($1, $2, $3, now())
+            ON CONFLICT (sub_code) DO UPDATE
+               SET signature = EXCLUDED.signature,
+                   docs      = EXCLUDED.docs,
+                   built_at  = EXCLUDED.built_at
+            """,
+            sub_code, signature, len(docs),
+        )
+    return int(status.split()[-1])
+
+
+async def main(full: bool, k: int) -> None:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+
+    conn = await asyncpg.connect(dsn=url, ssl=ssl_context_for(url), timeout=30)
+    try:
+        started = time.perf_counter()
+        categories = await conn.fetch(CATEGORIES_SQL)
+        stale = [c for c in categories if full or c["signature"] != c["built_signature"]]
+        print(f"{len(stale)}/{len(categories)} categories to rebuild")
+
+        total = 0
+        for c in stale:
+            t0 = time.perf_counter()
+            rows = await build_category(conn, c["sub_code"], c["signature"], k)
+            total += rows
+            print(f"  {c['sub_code']}: {c['docs']} groups -> {rows} rows "
+                  f"({time.perf_counter() - t0:.1f}s)")
+
+        # Categories that no longer exist (all their groups moved elsewhere).
+        live = [c["sub_code"] for c in categories]
+        await conn.execute(
+            "DELETE FROM product_alternatives WHERE NOT (sub_code = ANY($1::text[]))", live
+        )
+        await conn.execute(
+            "DELETE FROM product_alternatives_state WHERE NOT (sub_code = ANY($1::text[]))", live
+        )
+        await conn.execute("ANALYZE product_alternatives")
+        print(f"Done: {total} rows in {time.perf_counter() - started:.0f}s")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true", help="rebuild every category")
+    ap.add_argument("--k", type=int, default=40, help="neighbours stored per group")
+    args = ap.parse_args()
+    asyncio.run(main(args.full, args.k))
@@ -12,10 +12,24 @@ def build_basket(all_products, n_items):
     picks = random.sample(all_products, k=min(n_items, len(all_products)))
     return [{"product": p, "quantity": random.randint(1, 2)} for p in picks]
 
+def parse_server_timing(value):
+    # "names;dur=3.1, stores;dur=0.4, total;dur=12.0" -> {"names": 3.1, ...}
+    out = {}
+    for part in (value or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, dur = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    out[name] = float(dur)
+                except ValueError:
+                    pass
+    return out
+
 async def one_request(
     client, url, lat, lon, radius, items_per_req, all_products,
     headers, results, status_counts, exc_types, exc_samples,
-    http_err_counts, http_err_samples, timeout_s
+    http_err_counts, http_err_samples, timeout_s, stage_ms
 ):
     payload = {
         "grocery_list": {"items": build_basket(all_products, items_per_req)},
@@ -28,6 +42,9 @@ async def one_request(
         code = r.status_code
         results.append((code, dt))
         status_counts[code] = status_counts.get(code, 0) + 1
+        if code == 200:
+            for name, ms in parse_server_timing(r.headers.get("server-timing")).items():
+                stage_ms.setdefault(name, []).append(ms)
 
         if code != 200:
             http_err_counts[code] += 1
@@ -75,6 +92,7 @@ async def main():
     exc_samples: dict[str, str] = {}
     http_err_counts: Counter = Counter()
     http_err_samples: dict[int, str] = {}
+    stage_ms: dict[str, list[float]] = {}
 
     headers = {}
     if args.auth_bearer:
@@ -99,7 +117,7 @@ async def main():
                 await one_request(
                     client, url, args.lat, args.lon, args.radius, args.items, all_products,
                     headers, results, status_counts, exc_types, exc_samples,
-                    http_err_counts, http_err_samples, args.timeout
+                    http_err_counts, http_err_samples, args.timeout, stage_ms
                 )
 
         await asyncio.gather(*[asyncio.create_task(scheduled(i)) for i in range(args.requests)])
@@ -140,6 +158,16 @@ async def main():
         print(f"P50: {p50:.1f} ms; P90: {p90:.1f} ms; P95: {p95:.1f} ms; P99: {p99:.1f} ms; "
               f"Avg: {sum(oks)/len(oks):.1f} ms; Max: {max(oks):.1f} ms")
 
+    # Server-Timing etapid (compare.py / services/stage_timing.py)
+    stage_summary = {
+        name: {"n": len(v), "p50": percentile(v, 50), "p95": percentile(v, 95), "avg": sum(v) / len(v)}
+        for name, v in stage_ms.items()
+    }
+    if stage_summary:
+        print("Server-Timing stages (ms):")
+        for name, st in sorted(stage_summary.items(), key=lambda kv: -kv[1]["avg"]):
+            print(f"  {name:<10} n={st['n']:<5} P50: {st['p50']:.1f}; P95: {st['p95']:.1f}; Avg: {st['avg']:.1f}")
+
     if args.out:
         summary = {
             "total": total,
@@ -157,6 +185,7 @@ async def main():
                 "avg": (sum(oks)/len(oks) if oks else None),
                 "max": (max(oks) if oks else None),
             },
+            "stages_ms": stage_summary,
             "config": vars(args),
         }
         with open(args.out, "w", encoding="utf-8") as f:
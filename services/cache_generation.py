@@ -0,0 +1,26 @@
+# services/cache_generation.py
+"""
+cache_generations tabeli lugemine (vt migrations/2026-10-16-cache-generations.sql).
+
+Scraperid ja seemneskriptid jooksevad GitHub Actionsis, mitte API
+protsessis — nad ei saa protsessisiseseid vahemälusid otse tühjendada.
+Selle asemel tõstavad DB trigerid nimelise loenduri ja main.py
+taustavärskendaja laeb vahemälu uuesti ainult siis, kui loendur muutus.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from asyncpg import exceptions as pgerr
+
+
+async def current_generation(conn, name: str) -> Optional[int]:
+    """Loenduri väärtus; None, kui migratsioon pole veel rakendatud
+    (siis peab kutsuja iga tsükli järel uuesti laadima)."""
+    try:
+        value = await conn.fetchval(
+            "SELECT generation FROM cache_generations WHERE name = $1", name
+        )
+    except pgerr.UndefinedTableError:
+        return None
+    return int(value) if value is not None else None
@@ -0,0 +1,67 @@
+# services/catalog_version.py
+"""
+Kataloogi andmeversioon HTTP ETag'ide jaoks (utils/http_cache.py).
+
+Kataloogi lugemisotspunktide (/categories/*, /products, /products/brands,
+/products/{id}, /products/batch) vastused muutuvad ainult siis, kui scraperid, grupiimport
+või öine refresh-views andmeid muudavad. Need kirjutused tõstavad juba
+cache_generations loendureid:
+
+  product_search_docs  <- toote-, hinna- ja grupimuutuste järel ümber
+                          ehitatud dokumendid, öine täisümberehitus
+  product_groups       <- product_groups / product_group_members
+  category_counts      <- kategooriate arvud ja sildid
+
+See objekt hoiab loendurite viimast seisu mälus (main.py taustatsükkel),
+nii et ETag'i arvutamine ja 304 vastus ei puuduta Postgresit. Kuni
+esimene lugemine pole tehtud, on `ready` False ja ETag'e ei panda.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from asyncpg import exceptions as pgerr
+
+CATALOG_GENERATIONS = ("product_search_docs", "product_groups", "category_counts")
+
+
+class CatalogVersion:
+    def __init__(self) -> None:
+        self._generations: Dict[str, int] = {}
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"ready": self.ready}
+        for name, generation in self._generations.items():
+            stats[f"generation_{name}"] = generation
+        return stats
+
+    def version(self, names: Iterable[str]) -> Optional[str]:
+        """Nimetatud loendurite seis ("12.3"); None, kui pole veel laetud."""
+        if not self.ready:
+            return None
+        return ".".join(str(self._generations.get(name, 0)) for name in names)
+
+    async def refresh(self, pool) -> None:
+        async with pool.acquire() as conn:
+            try:
+                rows = await conn.fetch(
+                    "SELECT name, generation FROM cache_generations WHERE name = ANY($1::text[])",
+                    list(CATALOG_GENERATIONS),
+                )
+            except pgerr.UndefinedTableError:
+                return
+        self._generations = {r["name"]: int(r["generation"]) for r in rows}
+        self.loaded_at = time.time()
+
+
+_version = CatalogVersion()
+
+
+def get_catalog_version() -> CatalogVersion:
+    return _version
@@ -0,0 +1,144 @@
+# services/category_tree.py
+"""
+Protsessisisene kategooriapuu koos tootearvudega /categories jaoks.
+
+/categories/main, /{main}/sub ja /{main}/sub/{sub}/sub tegid igal
+kutsel products'i üle COUNT(DISTINCT p.id) join'i. Arvud on nüüd
+category_product_counts tabelis (migrations/2026-10-16-category-product-counts.sql);
+see objekt:
+
+  * kutsub main.py taustatsüklis refresh_category_product_counts(),
+    mis loeb arvud uuesti ainult siis, kui 'category_products' loendur
+    on liikunud (uued/kustutatud tooted, sub_code muutus), ja mitte
+    tihemini kui CATEGORY_COUNTS_MIN_INTERVAL;
+  * laeb categories_main/categories_sub + arvud mällu, kui
+    'category_counts' loendur muutub.
+
+Kuni esimene laadimine pole valmis, on `ready` False ja api/categories.py
+loeb sama kuju hetktõmmise category_product_counts_live() kaudu.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from asyncpg import exceptions as pgerr
+
+from services.cache_generation import current_generation
+from settings import CATEGORY_COUNTS_MIN_INTERVAL
+
+logger = logging.getLogger("uvicorn.error")
+
+_MAINS_SQL = """
+    SELECT m.id, m.code, m.label_et,
+           COALESCE(m.label_en, m.label_et) AS label_en,
+           COALESCE(c.product_count, 0) AS product_count
+    FROM categories_main m
+    LEFT JOIN {counts} c ON c.kind = 'main' AND c.code = m.code
+    ORDER BY m.sort_order, m.id
+"""
+
+_SUBS_SQL = """
+    SELECT s.id, s.code, s.main_id, s.parent_id, s.label_et,
+           COALESCE(s.label_en, s.label_et) AS label_en,
+           COALESCE(c.product_count, 0) AS product_count
+    FROM categories_sub s
+    LEFT JOIN {counts} c ON c.kind = 'sub' AND c.code = s.code
+    ORDER BY s.sort_order, s.id
+"""
+
+
+class CategorySnapshot:
+    """Kategooriapuu ühe laadimise seisuga; read on dict'id (code,
+    label_et, label_en, product_count), järjestus sort_order, id."""
+
+    def __init__(self, mains: List[Any], subs: List[Any]) -> None:
+        self.mains: List[Dict[str, Any]] = []
+        self.main_codes: Dict[str, Dict[str, Any]] = {}
+        self.subs_by_main: Dict[str, List[Dict[str, Any]]] = {}     # main code -> ülemtaseme alamkategooriad
+        self.children_by_sub: Dict[str, List[Dict[str, Any]]] = {}  # sub code -> alam-alamkategooriad
+        self.sub_codes: Dict[str, Dict[str, Any]] = {}
+
+        main_code_by_id: Dict[int, str] = {}
+        for r in mains:
+            row = {k: r[k] for k in ("code", "label_et", "label_en", "product_count")}
+            self.mains.append(row)
+            self.main_codes.setdefault(r["code"], row)
+            main_code_by_id[r["id"]] = r["code"]
+
+        sub_code_by_id = {r["id"]: r["code"] for r in subs}
+        for r in subs:
+            row = {k: r[k] for k in ("code", "label_et", "label_en", "product_count")}
+            self.sub_codes.setdefault(r["code"], row)
+            if r["parent_id"] is not None:
+                parent = sub_code_by_id.get(r["parent_id"])
+                if parent is not None:
+                    self.children_by_sub.setdefault(parent, []).append(row)
+            elif r["main_id"] in main_code_by_id:
+                self.subs_by_main.setdefault(main_code_by_id[r["main_id"]], []).append(row)
+
+
+async def load_snapshot(conn, live: bool = False) -> CategorySnapshot:
+    """live=True loeb arvud otse products'ist (category_product_counts_live())."""
+    counts = "category_product_counts_live()" if live else "category_product_counts"
+    mains = await conn.fetch(_MAINS_SQL.format(counts=counts))
+    subs = await conn.fetch(_SUBS_SQL.format(counts=counts))
+    return CategorySnapshot(mains, subs)
+
+
+class CategoryTree:
+    def __init__(self) -> None:
+        self.snapshot: Optional[CategorySnapshot] = None
+        self.generation: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+        self.recounts = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "ready": self.ready,
+            "main_categories": len(snapshot.mains) if snapshot else 0,
+            "subcategories": len(snapshot.sub_codes) if snapshot else 0,
+            "recounts": self.recounts,
+            "generation": self.generation,
+        }
+
+    async def refresh(self, pool) -> None:
+        """Loeb arvud vajadusel uuesti ja laeb puu, kui 'category_counts'
+        loendur on muutunud. Ilma cache_generations tabelita iga kord."""
+        async with pool.acquire() as conn:
+            try:
+                changed = await conn.fetchval(
+                    "SELECT refresh_category_product_counts(false, make_interval(secs => $1))",
+                    CATEGORY_COUNTS_MIN_INTERVAL,
+                )
+            except (pgerr.UndefinedFunctionError, pgerr.UndefinedTableError):
+                return
+            if changed:
+                self.recounts += 1
+            generation = await current_generation(conn, "category_counts")
+            if self.ready and generation is not None and generation == self.generation:
+                return
+            started = time.perf_counter()
+            snapshot = await load_snapshot(conn)
+
+        self.snapshot = snapshot
+        self.generation = generation
+        self.loaded_at = time.time()
+        logger.info(
+            "🗂️ Category tree loaded: %d main, %d sub (generation %s) in %.0fms",
+            len(snapshot.mains), len(snapshot.sub_codes), generation,
+            (time.perf_counter() - started) * 1000,
+        )
+
+
+_tree = CategoryTree()
+
+
+def get_category_tree() -> CategoryTree:
+    return _tree
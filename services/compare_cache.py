@@ -0,0 +1,229 @@
+# services/compare_cache.py
+"""
+/compare tulemuste vahemälu.
+
+Võti = (normaliseeritud korv, geo-lahter, raadius, lipud, andmete versioon):
+  * korv: nimed lower(trim), kogused ümardatud, product_id/ingredient;
+    ridade JÄRJEKORD jääb võtmesse, sest see määrab vastuse `lines`
+    järjekorra;
+  * poed: kandidaatpoodide id'd kauguse järjekorras, leitud
+    protsessisisesest geoindeksist päringu TEGELIKU lat/lon'i järgi.
+    Sama poodide loend => sama tulemus (hinnad, järjestus, split);
+    erinevad on ainult kaugused, mis tabamusel kirjutatakse üle selle
+    päringu kaugustega (with_distances). Kuni geoindeks pole laetud,
+    ei vahemällutata;
+  * andmete versioon: hinnamaatriksi vesimärk (suurim current_prices.
+    updated_at, mida ingest-triger iga hinnakirjutusega edasi lükkab) +
+    poodide, gruppide ja nimede cache_generations loendurid. Uued hinnad
+    => uus võti, vana tulemus ei ela üle oma hinnaandmeid.
+Kuni hinnamaatriks pole laetud või mõni loendur puudub, ei vahemällutata.
+PRICE_MATRIX_ENABLED=false lülitab vahemälu välja (hinnaandmete versiooni
+pole) — see logitakse käivitusel.
+
+Kaks tasandit: protsessisisene LRU ja valikuline Redis (REDIS_URL).
+Redis'e vead ei mõjuta /compare'i — siis töötab ainult mälutasand.
+COMPARE_CACHE_TTL piirab ka seda, kui kaua hilinenud commit'iga
+scraper'i read (vt price_matrix.REFRESH_OVERLAP) võivad vahele jääda.
+"""
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import logging
+import time
+from collections import OrderedDict
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import (
+    COMPARE_CACHE_ENABLED, COMPARE_CACHE_SIZE, COMPARE_CACHE_TTL,
+    PRICE_MATRIX_ENABLED, REDIS_URL,
+)
+from services.group_map import get_group_map
+from services.name_cache import get_name_cache
+from services.price_matrix import get_price_matrix
+from services.store_index import get_store_index
+
+try:
+    import aioredis  # type: ignore
+except Exception:
+    aioredis = None  # graceful fallback
+
+logger = logging.getLogger("uvicorn.error")
+
+_REDIS_PREFIX = "compare:v1:"
+
+
+# Andmete versioon tuleb hinnamaatriksist — ilma selleta pole vahemälu.
+ENABLED = COMPARE_CACHE_ENABLED and PRICE_MATRIX_ENABLED
+if COMPARE_CACHE_ENABLED and not PRICE_MATRIX_ENABLED:
+    logger.warning("compare cache disabled: PRICE_MATRIX_ENABLED=false (no price data version)")
+
+
+def candidate_distances(body: Dict[str, Any]) -> Optional[List[Tuple[int, Optional[float]]]]:
+    """(store_id, distance_km) nagu compare_service._candidate_stores()
+    need geoindeksist leiaks; None = geoindeks pole laetud."""
+    index = get_store_index()
+    if not index.ready:
+        return None
+    limit = int(body.get("limit_stores") or 50)
+    offset = int(body.get("offset_stores") or 0)
+    lat, lon = body.get("lat"), body.get("lon")
+    if lat is None or lon is None:
+        return [(e.id, None) for e in index.physical_stores()[offset: offset + limit]]
+    radius_km = float(body.get("radius_km") or 5.0)
+    hits = index.within(lat, lon, radius_km)[offset: offset + limit]
+    return [(e.id, d) for e, d in hits]
+
+
+def with_distances(response: Any, distances: Dict[int, Optional[float]]) -> Any:
+    """Vahemälust tulnud vastus selle päringu kaugustega: iga poe kirje
+    (store_id või id + distance_km) saab kauguse `distances`'ist."""
+    if isinstance(response, list):
+        return [with_distances(v, distances) for v in response]
+    if not isinstance(response, dict):
+        return response
+    out = {k: with_distances(v, distances) for k, v in response.items()}
+    if "distance_km" in out:
+        sid = out.get("store_id", out.get("id"))
+        if sid in distances:
+            d = distances[sid]
+            # Sama ümardus mis compare_service._round2.
+            out["distance_km"] = (
+                float(Decimal(d).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+                if d is not None else None
+            )
+    return out
+
+
+def data_version() -> Optional[str]:
+    """None = andmete seis pole instantside vahel võrreldav, ära vahemällu."""
+    matrix = get_price_matrix()
+    generations = (
+        get_store_index().generation,
+        get_group_map().generation,
+        get_name_cache().generation,
+    )
+    if not matrix.ready or matrix.version is None or None in generations:
+        return None
+    return "|".join([matrix.version, *map(str, generations)])
+
+
+def _canonical_items(body: Dict[str, Any]) -> list:
+    raw_items = body.get("items") or []
+    if not raw_items and "grocery_list" in body:
+        raw_items = (body.get("grocery_list") or {}).get("items") or []
+    items = []
+    for it in raw_items:
+        if not isinstance(it, dict):
+            continue
+        name = str(it.get("product", "") or "").strip().lower()
+        if not name:
+            continue
+        items.append([
+            name,
+            round(float(it.get("quantity") or 1), 3),
+            it.get("product_id"),
+            str(it.get("ingredient_name_en", "") or "").strip().lower(),
+        ])
+    return items
+
+
+class CompareCache:
+    def __init__(self, max_size: int, ttl: int, redis_url: Optional[str]) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_url = redis_url if aioredis is not None else None
+        self.redis = None
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis": bool(self.redis_url),
+            "enabled": ENABLED,
+        }
+
+    def key_for(
+        self, body: Dict[str, Any], stores: Optional[List[Tuple[int, Optional[float]]]]
+    ) -> Optional[str]:
+        """Võti; stores = candidate_distances(body). None = ära vahemällu."""
+        if not ENABLED or body.get("_shadow_sampled") or stores is None:
+            return None
+        version = data_version()
+        if version is None:
+            return None
+        canonical = {
+            "v": version,
+            "items": _canonical_items(body),
+            "stores": [sid for sid, _ in stores],
+            "radius_km": round(float(body.get("radius_km") or 5.0), 2),
+            "limit": int(body.get("limit_stores") or 50),
+            "offset": int(body.get("offset_stores") or 0),
+            "lines": bool(body.get("include_lines") or False),
+            "all": bool(body.get("require_all_items") or False),
+            "split": body.get("split_stores"),
+            "penalty": round(float(body.get("split_penalty") or 0.0), 2),
+            "format": body.get("format") or "lines",
+        }
+        raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def _get_redis(self):
+        if self.redis is None:
+            client = aioredis.from_url(self.redis_url, encoding="utf-8", decode_responses=True)
+            if inspect.isawaitable(client):
+                client = await client
+            self.redis = client
+        return self.redis
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            payload, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+            del self._entries[key]
+
+        if self.redis_url:
+            try:
+                payload = await (await self._get_redis()).get(_REDIS_PREFIX + key)
+            except Exception as e:
+                logger.warning("compare cache redis get failed: %s", e)
+                payload = None
+            if payload:
+                self._put_local(key, payload)
+                self.hits += 1
+                return json.loads(payload)
+
+        self.misses += 1
+        return None
+
+    def _put_local(self, key: str, payload: str) -> None:
+        self._entries[key] = (payload, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        payload = json.dumps(value, default=str)
+        self._put_local(key, payload)
+        if self.redis_url:
+            try:
+                await (await self._get_redis()).set(_REDIS_PREFIX + key, payload, ex=self.ttl)
+            except Exception as e:
+                logger.warning("compare cache redis set failed: %s", e)
+
+
+_cache = CompareCache(COMPARE_CACHE_SIZE, COMPARE_CACHE_TTL, REDIS_URL)
+
+
+def get_compare_cache() -> CompareCache:
+    return _cache
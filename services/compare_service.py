@@ -1,15 +1,23 @@
 # services/compare_service.py
 from __future__ import annotations
 
-import os
-import json
-import httpx
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Any, Dict, List, Optional, Tuple, Iterable
 
 import asyncpg
+import numpy as np
 from asyncpg import exceptions as pgerr
 
+from services.price_matrix import PriceMatrix, get_price_matrix
+from services.store_index import get_store_index
+from services.name_cache import get_name_cache
+from services.group_map import get_group_map
+from services.ingredient_search import cheapest_per_chain
+from services.ingredient_resolver import get_ingredient_resolver
+from services.compare_cache import candidate_distances, get_compare_cache, with_distances
+from services.stage_timing import stage
+from services.split_optimizer import best_split
+
 
 # v4.6.9 UUS — Etapp 5B shadow mode (vt substitution_shadow.py docstring
 # turvapõhimõtete kohta). v2 fix (ChatGPT leid #8): püüdmine oli liiga
@@ -25,35 +33,6 @@ except ModuleNotFoundError as _exc:
         raise
     substitution_shadow = None
 
-ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
-
-SKIP_INGREDIENTS = {
-    "water", "salt", "black pepper", "pepper", "white pepper",
-    "mixed herbs", "seasoning", "oil spray", "to taste",
-}
-
-VALID_SUB_CODES = [
-    "dry_pasta_rice", "dairy_eggs", "dairy_milk", "dairy_butter_margarine",
-    "dairy_cream_sourcream", "dairy_yogurt_kefir", "cheese_regular",
-    "cheese_delicatessen", "dairy_cheese_slices", "meat_poultry", "meat_beef_lamb_game",
-    "meat_minced", "meat_pork", "meat_hams", "meat_sausages",
-    "fish_fresh", "fish_salted_smoked", "fish_other", "fish_processed",
-    "produce_root_veg", "produce_mushrooms", "produce_tropical",
-    "produce_herbs_salads_sprouts", "produce_smoothies_fresh_juices",
-    "dry_flour_sugar_baking", "dry_canned_veg", "dry_other", "dry_ready_meals_jars",
-    "frozen_bakery", "frozen_veg", "frozen_berries_fruit", "frozen_ready_meals",
-    "frozen_meat", "frozen_other", "frozen_desserts_icecream",
-    "oils_olive", "oils_other", "oils_vinegar",
-    "sauces_ketchup_mayo", "sauces_pasta_cooking", "sauces_soy_worcester",
-    "sauces_other", "sauces_marinades",
-    "spices_herbs_spice_mix", "spices_broth_stock",
-    "drinks_wine", "drinks_beer_cider", "drinks_soft_soda",
-    "sweets_chocolate_bars", "sweets_nuts_driedfruit",
-    "bakery_other", "bakery_bread_loaves",
-    "dry_canned_fruit",
-]
-
 # Barbora tooted on DB-s chain='barbora', aga stores tabelis chain='Maxima'
 CHAIN_ALIASES: Dict[str, str] = {
     "barbora": "maxima",
@@ -89,134 +68,35 @@ async def _acquire(conn_or_pool: Any) -> Tuple[asyncpg.Connection, bool]:
 
 # ---------------- recipe ingredient resolution ----------------
 
-async def _get_cached_ingredient(conn, ingredient_en: str):
-    row = await conn.fetchrow(
-        "SELECT search_terms, sub_codes FROM recipe_ingredient_cache WHERE ingredient_en = $1",
-        ingredient_en.lower().strip()
-    )
-    if row:
-        return {"search_terms": list(row["search_terms"]), "sub_codes": list(row["sub_codes"])}
-    return None
-
-
-async def _ask_claude_for_ingredient(ingredient_en: str) -> dict:
-    if not ANTHROPIC_API_KEY:
-        return {"search_terms": [ingredient_en.lower()], "sub_codes": []}
-
-    prompt = f"""You help match recipe ingredients to Estonian grocery store product names.
-
-Ingredient: "{ingredient_en}"
-
-CRITICAL: search_terms MUST be Estonian words used in store databases. sub_codes MUST come from the list.
-
-Valid sub_codes: {json.dumps(VALID_SUB_CODES)}
-
-Return ONLY valid JSON:
-{{"search_terms": ["estonian_word"], "sub_codes": ["sub_code"]}}"""
-
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(
-            ANTHROPIC_API_URL,
-            headers={
-                "x-api-key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json",
-            },
-            json={
-                "model": "claude-haiku-4-5-20251001",
-                "max_tokens": 200,
-                "messages": [{"role": "user", "content": prompt}],
+async def _find_cheapest_per_chain(db, ingredients_en: List[str]) -> Dict[str, Dict[str, Dict]]:
+    """Leiab iga koostisosa iga keti odavaima toote: {ingredient_en:
+    {kett: toode}}. Otsingusõnad tulevad services/ingredient_resolver.py
+    kaudu (LRU + single-flight), tooted leitakse ÜHE hulgapõhise
+    päringuga (services/ingredient_search.py)."""
+    import asyncio
+
+    resolver = get_ingredient_resolver()
+    terms_list = await asyncio.gather(*[resolver.resolve(db, i) for i in ingredients_en])
+    resolved = {ing_en: terms for ing_en, terms in zip(ingredients_en, terms_list) if terms}
+    rows_by_ingredient = await cheapest_per_chain(db, resolved, price_column="effective_price")
+
+    results: Dict[str, Dict[str, Dict]] = {}
+    for ing_en, rows in rows_by_ingredient.items():
+        # Alias barbora -> maxima
+        results_by_chain: Dict[str, Dict] = {}
+        for chain_key, r in rows.items():
+            product = {
+                "product_id": r["id"],
+                "name": r["name"],
+                "chain": chain_key,
+                "image_url": r["image_url"] or "",
+                "price": float(r["min_price"]),
             }
-        )
-        data = resp.json()
-        text = data["content"][0]["text"].strip()
-        text = text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
-
-
-async def _find_cheapest_per_chain(conn, ingredient_en: str) -> Dict[str, Dict]:
-    """Leiab iga keti odavaima toote retsepti koostisosa jaoks."""
-    name_lower = ingredient_en.lower().strip()
-    if name_lower in SKIP_INGREDIENTS:
-        return {}
-
-    cached = await _get_cached_ingredient(conn, name_lower)
-    if not cached:
-        try:
-            cached = await _ask_claude_for_ingredient(ingredient_en)
-            await conn.execute(
-                """INSERT INTO recipe_ingredient_cache (ingredient_en, search_terms, sub_codes)
-                   VALUES ($1, $2, $3) ON CONFLICT (ingredient_en) DO NOTHING""",
-                name_lower, cached["search_terms"], cached["sub_codes"]
-            )
-        except Exception:
-            return {}
-
-    search_terms = cached.get("search_terms", [])
-    sub_codes = cached.get("sub_codes", [])
-    if not search_terms:
-        return {}
-
-    raw_by_chain: Dict[str, Dict] = {}
-
-    for term in search_terms:
-        if sub_codes:
-            rows = await conn.fetch("""
-                SELECT p.id, p.name, p.chain, p.image_url, p.brand, p.size_text,
-                    MIN(COALESCE(NULLIF(pr.promo_price, 0), pr.price)) as min_price
-                FROM products p
-                JOIN prices pr ON pr.product_id = p.id
-                WHERE p.name ILIKE $1
-                  AND p.sub_code = ANY($2::text[])
-                  AND pr.price > 0
-                  AND pr.collected_at > NOW() - INTERVAL '14 days'
-                  AND p.name NOT ILIKE '%kaitstud%'
-                  AND p.name NOT ILIKE '%strooganov%'
-                  AND p.name NOT ILIKE '%valmistoit%'
-                GROUP BY p.id, p.name, p.chain, p.image_url, p.brand, p.size_text
-                ORDER BY p.chain, min_price ASC
-            """, f"%{term}%", sub_codes)
-        else:
-            rows = await conn.fetch("""
-                SELECT p.id, p.name, p.chain, p.image_url, p.brand, p.size_text,
-                    MIN(COALESCE(NULLIF(pr.promo_price, 0), pr.price)) as min_price
-                FROM products p
-                JOIN prices pr ON pr.product_id = p.id
-                WHERE p.name ILIKE $1
-                  AND p.sub_code NOT IN (
-                    'hh_other','hh_cleaners','hh_laundry','hh_dishwashing',
-                    'pcare_oral_care','pcare_other','pcare_feminine_hygiene',
-                    'baby_diapers','pet_cat_wet','pet_dog_wet','pet_cat_dry','pet_dog_dry'
-                  )
-                  AND pr.price > 0
-                  AND pr.collected_at > NOW() - INTERVAL '14 days'
-                  AND p.name NOT ILIKE '%kaitstud%'
-                  AND p.name NOT ILIKE '%strooganov%'
-                  AND p.name NOT ILIKE '%valmistoit%'
-                GROUP BY p.id, p.name, p.chain, p.image_url, p.brand, p.size_text
-                ORDER BY p.chain, min_price ASC
-            """, f"%{term}%")
-
-        for r in rows:
-            chain = (r["chain"] or "").lower()
-            price = float(r["min_price"])
-            if chain not in raw_by_chain or price < raw_by_chain[chain]["price"]:
-                raw_by_chain[chain] = {
-                    "product_id": r["id"],
-                    "name": r["name"],
-                    "chain": chain,
-                    "image_url": r["image_url"] or "",
-                    "price": price,
-                }
-
-    # Alias barbora -> maxima
-    results_by_chain: Dict[str, Dict] = {}
-    for chain_key, product in raw_by_chain.items():
-        canonical = CHAIN_ALIASES.get(chain_key, chain_key)
-        if canonical not in results_by_chain or product["price"] < results_by_chain[canonical]["price"]:
-            results_by_chain[canonical] = product
-
-    return results_by_chain
+            canonical = CHAIN_ALIASES.get(chain_key, chain_key)
+            if canonical not in results_by_chain or product["price"] < results_by_chain[canonical]["price"]:
+                results_by_chain[canonical] = product
+        results[ing_en] = results_by_chain
+    return results
 
 
 # ---------------- product resolution ----------------
@@ -231,32 +111,37 @@ async def _resolve_products_by_name(
     if not keys:
         return {}
 
-    sql_with_aliases = """
-    WITH keys AS (SELECT unnest($1::text[]) AS k)
-    SELECT DISTINCT ON (keys.k)
-      keys.k AS match_key,
-      p.id, p.ean, p.name, p.size_text, p.net_qty, p.net_unit, p.pack_count
-    FROM products p
-    LEFT JOIN product_aliases a ON a.product_id = p.id
-    JOIN keys ON keys.k = lower(p.name) OR keys.k = lower(a.alias)
-    ORDER BY keys.k, p.id
-    """
-    sql_products_only = """
-    WITH keys AS (SELECT unnest($1::text[]) AS k)
-    SELECT DISTINCT ON (keys.k)
-      keys.k AS match_key,
-      p.id, p.ean, p.name, p.size_text, p.net_qty, p.net_unit, p.pack_count
-    FROM products p
-    JOIN keys ON keys.k = lower(p.name)
-    ORDER BY keys.k, p.id
-    """
+    # Korduvad nimed tulevad protsessisisesest LRU-st (services/name_cache.py).
+    cache = get_name_cache()
+    by_norm, missing = cache.get_many(keys)
+    if not missing:
+        return by_norm
 
-    try:
-        rows = await conn.fetch(sql_with_aliases, keys)
-    except (pgerr.UndefinedTableError, pgerr.UndefinedColumnError):
-        rows = await conn.fetch(sql_products_only, keys)
+    # Nimi ja alias eraldi harudes — kumbki kasutab oma lower() indeksit
+    # (idx_products_name_lower, uq_product_alias_lower); OR-join ei saanud.
+    rows = await conn.fetch(
+        """
+        WITH keys AS (SELECT unnest($1::text[]) AS k),
+        matches AS (
+          SELECT keys.k, p.id AS product_id
+          FROM keys JOIN products p ON lower(p.name) = keys.k
+          UNION ALL
+          SELECT keys.k, a.product_id
+          FROM keys JOIN product_aliases a ON lower(a.alias) = keys.k
+        )
+        SELECT DISTINCT ON (m.k)
+          m.k AS match_key,
+          p.id, p.ean, p.name, p.size_text, p.net_qty, p.net_unit, p.pack_count
+        FROM matches m
+        JOIN products p ON p.id = m.product_id
+        ORDER BY m.k, p.id
+        """,
+        missing,
+    )
 
-    by_norm: Dict[str, asyncpg.Record] = {_rv(r, "match_key"): r for r in rows}
+    fetched: Dict[str, asyncpg.Record] = {_rv(r, "match_key"): r for r in rows}
+    cache.put_many(missing, fetched)
+    by_norm.update(fetched)
     return by_norm
 
 
@@ -283,6 +168,9 @@ async def _expand_groups(
 ) -> Dict[int, List[int]]:
     if not basket_pids:
         return {}
+    groups = get_group_map()
+    if groups.ready:
+        return groups.expand(basket_pids)
     try:
         rows = await conn.fetch(
             """
@@ -317,6 +205,9 @@ async def _fetch_group_info_for_pids(
     kutsuja peab seda kontrollima enne shadow'i käivitamist."""
     if not basket_pids:
         return {}
+    groups = get_group_map()
+    if groups.ready:
+        return groups.group_info(basket_pids)
     try:
         rows = await conn.fetch(
             """
@@ -343,7 +234,16 @@ async def _fetch_group_info_for_pids(
 
 async def _candidate_stores(
     conn, lat, lon, radius_km, limit, offset
-) -> List[asyncpg.Record]:
+) -> List[Any]:
+    # Protsessisisene geoindeks (services/store_index.py), kui laetud.
+    index = get_store_index()
+    if index.ready:
+        if lat is None or lon is None:
+            page = index.physical_stores()[int(offset): int(offset) + int(limit)]
+            return [e.as_row(None) for e in page]
+        hits = index.within(lat, lon, radius_km)[int(offset): int(offset) + int(limit)]
+        return [e.as_row(d) for e, d in hits]
+
     physical_filter = "AND COALESCE(s.is_online, false) = false"
 
     if lat is None or lon is None:
@@ -378,49 +278,31 @@ async def _candidate_stores(
 
 # ---------------- prices ----------------
 
-async def _latest_prices(conn, product_ids, store_ids):
-    if not product_ids or not store_ids:
-        return []
+async def _effective_sources(conn, store_ids: List[int]) -> Dict[int, int]:
+    """Füüsiline pood -> efektiivne hinnaallikas (store_effective_source)."""
+    index = get_store_index()
+    if index.ready:
+        return {sid: index.source_store_id(sid) for sid in store_ids}
+    rows = await conn.fetch(
+        "SELECT store_id, source_store_id FROM store_effective_source WHERE store_id = ANY($1::int[])",
+        store_ids,
+    )
+    source_of = {sid: sid for sid in store_ids}
+    source_of.update({int(r["store_id"]): int(r["source_store_id"]) for r in rows})
+    return source_of
+
 
-    sql = """
-    WITH effective_source AS (
-      SELECT s.id AS physical_store_id,
-             COALESCE(sps.source_store_id, s.id) AS source_store_id
-      FROM stores s
-      LEFT JOIN (
-        SELECT DISTINCT ON (store_id) store_id, source_store_id
-        FROM store_price_source
-        ORDER BY store_id, source_store_id
-      ) sps ON sps.store_id = s.id
-      WHERE s.id = ANY($2::int[])
-    ),
-    latest AS (
-      SELECT DISTINCT ON (p.product_id, p.store_id)
-             p.product_id, p.store_id,
-             COALESCE(NULLIF(p.promo_price, 0), p.price) AS price,
-             p.collected_at
-      FROM prices p
-      WHERE p.product_id = ANY($1::int[])
-        AND p.store_id IN (SELECT source_store_id FROM effective_source)
-      ORDER BY p.product_id, p.store_id, p.collected_at DESC
+async def _latest_prices(conn, product_ids, source_store_ids):
+    """Hinnad hinnaallikate kaupa — iga allika read tulevad üks kord,
+    mitte iga selle allika füüsilise poe kohta."""
+    if not product_ids or not source_store_ids:
+        return []
+    return await conn.fetch(
+        """SELECT cp.product_id, cp.store_id, cp.effective_price AS price, cp.collected_at
+           FROM current_prices cp
+           WHERE cp.product_id = ANY($1::int[]) AND cp.store_id = ANY($2::int[])""",
+        product_ids, source_store_ids,
     )
-    SELECT l.product_id, es.physical_store_id AS store_id, l.price, l.collected_at
-    FROM latest l
-    JOIN effective_source es ON es.source_store_id = l.store_id;
-    """
-    try:
-        return await conn.fetch(sql, product_ids, store_ids)
-    except Exception:
-        return await conn.fetch(
-            """SELECT DISTINCT ON (p.product_id, p.store_id)
-               p.product_id, p.store_id,
-               COALESCE(NULLIF(p.promo_price, 0), p.price) AS price,
-               p.collected_at
-               FROM prices p
-               WHERE p.product_id = ANY($1::int[]) AND p.store_id = ANY($2::int[])
-               ORDER BY p.product_id, p.store_id, p.collected_at DESC""",
-            product_ids, store_ids
-        )
 
 
 def _as_int_or_none(v):
@@ -433,7 +315,575 @@ def _as_int_or_none(v):
 
 # ---------------- main service ----------------
 
-async def compare_basket_service(db: Any, body: Dict[str, Any]) -> Dict[str, Any]:
+def _split_items(raw_items: Iterable[Any]) -> Tuple[List[Dict], List[Dict]]:
+    """Normaliseeri — eralda retsepti koostisosad tavalistest toodetest."""
+    recipe_items: List[Dict] = []
+    normal_items: List[Dict] = []
+
+    for it in raw_items:
+        if not isinstance(it, dict):
+            continue
+        name = str(it.get("product", "") or "").strip()
+        if not name:
+            continue
+        qty = float(it.get("quantity") or 1)
+        if qty <= 0:
+            continue
+
+        ingredient_en = str(it.get("ingredient_name_en", "") or "").strip()
+        if ingredient_en:
+            recipe_items.append({
+                "product": name,
+                "ingredient_name_en": ingredient_en,
+                "quantity": qty,
+            })
+        else:
+            normal_items.append({
+                "product": name,
+                "quantity": qty,
+                "product_id": _as_int_or_none(it.get("product_id")),
+            })
+    return recipe_items, normal_items
+
+
+def _parse_basket(basket: Dict[str, Any]) -> Dict[str, Any]:
+    raw_items = basket.get("items") or []
+    if not raw_items and "grocery_list" in basket:
+        raw_items = (basket.get("grocery_list") or {}).get("items") or []
+    recipe_items, normal_items = _split_items(raw_items)
+
+    qty_by_pid: Dict[int, float] = {}
+    qty_by_name: Dict[str, float] = {}
+    for it in normal_items:
+        pid = _as_int_or_none(it.get("product_id"))
+        qty = max(float(it.get("quantity") or 1), 0.1)
+        if pid is not None:
+            qty_by_pid[pid] = qty_by_pid.get(pid, 0.0) + qty
+        else:
+            nm = _norm(str(it.get("product") or ""))
+            if nm:
+                qty_by_name[nm] = qty_by_name.get(nm, 0.0) + qty
+
+    return {
+        "recipe_items": recipe_items,
+        "qty_by_pid": qty_by_pid,
+        "qty_by_name": qty_by_name,
+        "include_lines": bool(basket.get("include_lines") or False),
+        "lazy_lines": bool(basket.get("lazy_lines") or False),
+        "require_all": bool(basket.get("require_all_items") or False),
+        "split_stores": _split_stores_arg(basket.get("split_stores")),
+        "split_penalty": max(float(basket.get("split_penalty") or 0.0), 0.0),
+        "format": "matrix" if basket.get("format") == "matrix" else "lines",
+        "missing_products": [],
+    }
+
+
+def _split_stores_arg(v: Any) -> Optional[int]:
+    k = _as_int_or_none(v)
+    return min(k, 3) if k is not None and k >= 2 else None
+
+
+def _empty_response(radius_km: float, missing_products: List[Dict], fmt: str = "lines") -> Dict[str, Any]:
+    if fmt == "matrix":
+        return {
+            "format": "matrix", "lines": [], "products": [], "stores": [], "prices": [], "choice": [],
+            "required_lines": 0, "totals": {}, "radius_km": radius_km, "missing_products": missing_products,
+        }
+    return {"results": [], "totals": {}, "stores": [], "radius_km": radius_km, "missing_products": missing_products}
+
+
+def _basket_at_store(
+    k: int,
+    chain: str,
+    scores: Any,
+    line_pids: List[int],
+    line_qtys: List[float],
+    metadata: Dict[int, asyncpg.Record],
+    recipe_items: List[Dict],
+    recipe_by_chain: Dict[str, Dict[str, Dict]],
+    include_lines: bool,
+) -> Dict[str, Any]:
+    """Korvi read, summa ja puuduvad tooted poe k (= tema hinnaallika)
+    hindadega."""
+    lines: List[Dict] = []
+    not_found: List[str] = []
+    missing_pids: List[int] = []
+    total = float(scores.totals[k])
+    lines_found = int(scores.lines_found[k])
+    normal_found = lines_found
+    available = scores.available[:, k]
+    priced = scores.found[:, k]
+
+    # Tavalised tooted
+    for i, pid in enumerate(line_pids):
+        if not available[i]:
+            meta = metadata.get(pid)
+            not_found.append(_rv(meta, "name") if meta else f"#{pid}")
+            missing_pids.append(pid)
+            continue
+        # require_all_items korral pole mittetäielikele poodidele hindu
+        # arvutatud (PriceMatrix.score(complete_only=True)) — ridu ei koostata.
+        if include_lines and priced[i]:
+            qty = line_qtys[i]
+            best_price = float(scores.best_price[i, k])
+            best_pid = int(scores.best_pid[i, k])
+            meta = metadata.get(best_pid) or metadata.get(pid)
+            is_per_kg = (_rv(meta, "size_text") or "").lower() == "kg" if meta else False
+            lines.append({
+                "product_id": best_pid,
+                "product_name": _rv(meta, "name") if meta else f"#{best_pid}",
+                "qty": qty,
+                "unit_price": _round2(best_price),
+                "line_total": _round2(best_price * qty),
+                "is_per_kg": is_per_kg,
+            })
+
+    # Retsepti koostisosad
+    chain_recipe = recipe_by_chain.get(chain, {})
+    for item in recipe_items:
+        ing_et = item["product"]
+        product = chain_recipe.get(ing_et)
+        if product is None:
+            not_found.append(ing_et)
+            continue
+        lines_found += 1
+        total += product["price"] * item["quantity"]
+        if include_lines:
+            lines.append({
+                "product_id": product["product_id"],
+                "product_name": product["name"],
+                "qty": item["quantity"],
+                "unit_price": _round2(product["price"]),
+                "line_total": _round2(product["price"] * item["quantity"]),
+                "ingredient": ing_et,
+                "is_per_kg": False,
+            })
+
+    return {
+        "lines": lines,
+        "not_found": not_found,
+        "missing_pids": missing_pids,
+        "total": total,
+        "lines_found": lines_found,
+        "normal_found": normal_found,
+    }
+
+
+def _lines_builder(
+    stores: List[Any],
+    scores: Any,
+    line_pids: List[int],
+    line_qtys: List[float],
+    metadata: Dict[int, asyncpg.Record],
+    recipe_items: List[Dict],
+    recipe_by_chain: Dict[str, Dict[str, Dict]],
+):
+    """store_id -> selle poe korvi read, koostatakse esimesel küsimisel.
+    Sama hinnaallika ja ketiga poodidel on read samad (vt _score_basket)."""
+    store_pos = {int(_rv(s, "id")): k for k, s in enumerate(stores)}
+    per_source: Dict[Tuple[int, str], List[Dict]] = {}
+
+    def lines_for(store_id: int) -> List[Dict]:
+        k = store_pos[store_id]
+        chain = (_rv(stores[k], "chain") or "").lower()
+        source_key = (int(scores.source_group[k]), chain)
+        lines = per_source.get(source_key)
+        if lines is None:
+            lines = per_source[source_key] = _basket_at_store(
+                k, chain, scores, line_pids, line_qtys, metadata,
+                recipe_items, recipe_by_chain, True,
+            )["lines"]
+        return lines
+
+    return lines_for
+
+
+def _score_basket(
+    basket: Dict[str, Any],
+    stores: List[Any],
+    matrix: PriceMatrix,
+    metadata: Dict[int, asyncpg.Record],
+    group_members: Dict[int, List[int]],
+    group_info_by_pid: Dict[int, Tuple[int, str]],
+    recipe_by_en: Dict[str, Dict[str, Dict]],
+    radius_km: float,
+) -> Tuple[Dict[str, Any], List[Tuple[int, str, str, Optional[int]]]]:
+    """Ühe korvi tulemus juba laetud poodide/hindade/metaandmete pealt.
+    Tagastab (vastus, shadow kandidaadid)."""
+    qty_by_pid: Dict[int, float] = basket["qty_by_pid"]
+    recipe_items: List[Dict] = basket["recipe_items"]
+    # Maatriksvormingus on hinnad "prices" massiivis — ridu poe kaupa ei koostata.
+    include_lines: bool = basket["include_lines"] and basket["format"] != "matrix"
+    # NDJSON voog (compare.py): read koostab voo generaator poehaaval
+    # pingerea järjekorras (response["_lines_for"]) — siin ainult summad.
+    lazy_lines: bool = include_lines and basket["lazy_lines"]
+    require_all: bool = basket["require_all"]
+    store_ids = [int(_rv(s, "id")) for s in stores]
+
+    recipe_by_chain: Dict[str, Dict[str, Dict]] = {}
+    for item in recipe_items:
+        for chain_key, product in recipe_by_en.get(item["ingredient_name_en"], {}).items():
+            recipe_by_chain.setdefault(chain_key, {})[item["product"]] = product
+
+    # Hinnad — protsessisisesest hinnamaatriksist (vt services/price_matrix.py),
+    # kui see on laetud; muidu ühekordne maatriks _latest_prices() ridadest.
+    # Mõlemal juhul skoorib sama vektoriseeritud score().
+    line_pids: List[int] = list(qty_by_pid.keys())
+    line_qtys: List[float] = [qty_by_pid[pid] for pid in line_pids]
+    line_members: List[List[int]] = [group_members.get(pid, [pid]) for pid in line_pids]
+    # require_all_items: mittetäielikul poel pole summat (total_price=None),
+    # seega hinnad ja read arvutatakse ainult täielikele poodidele.
+    # split ja maatriksvorming vajavad kõigi poodide hindu.
+    complete_only = bool(
+        require_all and line_pids and not basket["split_stores"] and basket["format"] != "matrix"
+    )
+    scores = matrix.score(line_members, line_qtys, store_ids, complete_only=complete_only)
+
+    required_normal = len(qty_by_pid)
+    required_recipe = len(recipe_items)
+    required_total = required_normal + required_recipe
+
+    results: List[Dict] = []
+    # v4.6.9 UUS — kogub kokku kõik (group_id, sub_code, chain,
+    # store_id) kombinatsioonid, kus täpne toode jäi poest leidmata.
+    # Shadow mode kasutab neid PÄRAST kogu vastuse valmimist —
+    # see nimekiri ise EI MÕJUTA tulemust kuidagi, ainult kogutakse.
+    shadow_missing_items: List[Tuple[int, str, str, Optional[int]]] = []
+
+    # Sama hinnaallika ja ketiga poodidel on identne korv — see
+    # arvutatakse üks kord (esimese ehk lähima poe juures) ja jagatakse.
+    per_source: Dict[Tuple[int, str], Dict[str, Any]] = {}
+
+    for k, s in enumerate(stores):
+        sid = int(_rv(s, "id"))
+        chain = (_rv(s, "chain") or "").lower()
+        source_key = (int(scores.source_group[k]), chain)
+        basket_at = per_source.get(source_key)
+        if basket_at is None:
+            basket_at = per_source[source_key] = _basket_at_store(
+                k, chain, scores, line_pids, line_qtys, metadata,
+                recipe_items, recipe_by_chain, include_lines and not lazy_lines,
+            )
+        lines_found = basket_at["lines_found"]
+
+        # v4.6.9 UUS — shadow kandidaadid (group_id, sub_code, chain,
+        # store_id) iga füüsilise poe kohta. See EI muuda
+        # not_found/total/lines_found — puhtalt kõrvalkanal.
+        for pid in basket_at["missing_pids"]:
+            group_info = group_info_by_pid.get(pid)
+            if group_info is not None:
+                shadow_missing_items.append(
+                    (group_info[0], group_info[1], chain, sid)
+                )
+
+        if lines_found == 0:
+            total_price = None
+        elif require_all and qty_by_pid and basket_at["normal_found"] < required_normal:
+            total_price = None
+        else:
+            total_price = _round2(basket_at["total"])
+
+        result = {
+            "store_id": sid,
+            "chain": _rv(s, "chain"),
+            "store_name": _rv(s, "name"),
+            "distance_km": _round2(float(_rv(s, "distance_km"))) if _rv(s, "distance_km") is not None else None,
+            "lines_found": lines_found,
+            "required_lines": required_total,
+            "total_price": total_price,
+            "not_found": basket_at["not_found"],
+        }
+        if include_lines and not lazy_lines:
+            result["lines"] = basket_at["lines"]
+        results.append(result)
+
+    def sort_key(x):
+        complete = 1 if (x.get("total_price") is not None and x.get("lines_found") == x.get("required_lines")) else 0
+        price = x.get("total_price") if x.get("total_price") is not None else float("inf")
+        dist = x.get("distance_km") if x.get("distance_km") is not None else float("inf")
+        return (-complete, -int(x.get("lines_found", 0)), price, dist)
+
+    results = [r for r in results if r.get("lines_found", 0) > 0]
+    results.sort(key=sort_key)
+
+    # The "winner" shown in totals is always the first sorted result —
+    # sort_key already ranks complete baskets ahead of incomplete ones,
+    # so this can never disagree with what the UI displays as the top
+    # store. Previously this was tracked separately during the store
+    # loop using only total_price, which ignored completeness and
+    # could crown an incomplete (partial-sum) basket as "cheapest".
+    winner = next((r for r in results if r.get("total_price") is not None), None)
+    totals: Dict[str, Any] = {}
+    if winner is not None:
+        totals = {
+            "cheapest_store_id": winner["store_id"],
+            "cheapest_total": winner["total_price"],
+            "cheapest_chain": winner["chain"],
+            "cheapest_store_name": winner["store_name"],
+        }
+
+    response = {
+        "results": results,
+        "totals": totals,
+        "stores": [
+            {
+                "id": int(_rv(s, "id")),
+                "name": _rv(s, "name"),
+                "chain": _rv(s, "chain"),
+                "distance_km": _round2(float(_rv(s, "distance_km"))) if _rv(s, "distance_km") is not None else None,
+                "lat": float(_rv(s, "lat")) if _rv(s, "lat") is not None else None,
+                "lon": float(_rv(s, "lon")) if _rv(s, "lon") is not None else None,
+            }
+            for s in stores
+        ],
+        "radius_km": float(radius_km),
+        "missing_products": basket["missing_products"],
+    }
+    if lazy_lines:
+        response["_lines_for"] = _lines_builder(
+            stores, scores, line_pids, line_qtys, metadata, recipe_items, recipe_by_chain,
+        )
+    if basket["split_stores"]:
+        with stage("split"):
+            response["split"] = _split_basket(
+                basket, stores, scores, line_pids, line_qtys, metadata, recipe_by_chain,
+            )
+    if basket["format"] == "matrix":
+        response = _matrix_payload(
+            response, basket, stores, scores, line_pids, line_qtys,
+            metadata, group_members, recipe_by_chain,
+        )
+    return response, shadow_missing_items
+
+
+def _matrix_payload(
+    response: Dict[str, Any],
+    basket: Dict[str, Any],
+    stores: List[Any],
+    scores: Any,
+    line_pids: List[int],
+    line_qtys: List[float],
+    metadata: Dict[int, asyncpg.Record],
+    group_members: Dict[int, List[int]],
+    recipe_by_chain: Dict[str, Dict[str, Dict]],
+) -> Dict[str, Any]:
+    """Kompaktne vastus kliendipoolseks ümberarvutuseks (format="matrix").
+
+    "lines" = korvi read (tavalised tooted, siis retsepti koostisosad),
+    "products" = kõik viidatud tooted üks kord, "stores" = poed
+    pingerea järjekorras. prices[s][i] on rea i ühikuhind poes s (null =
+    puudub) ja choice[s][i] selle toote indeks "products" tabelis; poe
+    summa = sum(lines[i].qty * prices[s][i]). Grupi read kannavad
+    "members" (kõik grupi tooted), et klient näeks valikut."""
+    recipe_items: List[Dict] = basket["recipe_items"]
+    products: List[Dict[str, Any]] = []
+    product_pos: Dict[int, int] = {}
+
+    def product_ref(pid: int, name: Optional[str] = None) -> int:
+        pos = product_pos.get(pid)
+        if pos is None:
+            meta = metadata.get(pid)
+            pos = product_pos[pid] = len(products)
+            products.append({
+                "id": pid,
+                "name": (_rv(meta, "name") if meta else name) or f"#{pid}",
+                "is_per_kg": (_rv(meta, "size_text") or "").lower() == "kg" if meta else False,
+            })
+        return pos
+
+    lines: List[Dict[str, Any]] = []
+    for pid, qty in zip(line_pids, line_qtys):
+        line: Dict[str, Any] = {"product": product_ref(pid), "qty": qty}
+        members = group_members.get(pid, [pid])
+        if len(members) > 1:
+            line["members"] = [product_ref(m) for m in members]
+        lines.append(line)
+    for item in recipe_items:
+        lines.append({"ingredient": item["product"], "qty": item["quantity"]})
+
+    store_pos = {int(_rv(s, "id")): k for k, s in enumerate(stores)}
+    found = scores.found
+    rows_by_source: Dict[Tuple[int, str], Tuple[List, List]] = {}
+    out_stores: List[Dict[str, Any]] = []
+    prices: List[List[Optional[float]]] = []
+    choice: List[List[int]] = []
+    for result in response["results"]:
+        k = store_pos[result["store_id"]]
+        s = stores[k]
+        chain = (_rv(s, "chain") or "").lower()
+        key = (int(scores.source_group[k]), chain)
+        rows = rows_by_source.get(key)
+        if rows is None:
+            row_prices: List[Optional[float]] = []
+            row_choice: List[int] = []
+            for i in range(len(line_pids)):
+                if found[i, k]:
+                    row_prices.append(_round2(float(scores.best_price[i, k])))
+                    row_choice.append(product_ref(int(scores.best_pid[i, k])))
+                else:
+                    row_prices.append(None)
+                    row_choice.append(-1)
+            chain_recipe = recipe_by_chain.get(chain, {})
+            for item in recipe_items:
+                product = chain_recipe.get(item["product"])
+                if product is None:
+                    row_prices.append(None)
+                    row_choice.append(-1)
+                else:
+                    row_prices.append(_round2(product["price"]))
+                    row_choice.append(product_ref(int(product["product_id"]), product["name"]))
+            rows = rows_by_source[key] = (row_prices, row_choice)
+        prices.append(rows[0])
+        choice.append(rows[1])
+        out_stores.append({
+            "id": result["store_id"],
+            "name": result["store_name"],
+            "chain": result["chain"],
+            "distance_km": result["distance_km"],
+            "lat": float(_rv(s, "lat")) if _rv(s, "lat") is not None else None,
+            "lon": float(_rv(s, "lon")) if _rv(s, "lon") is not None else None,
+            "total_price": result["total_price"],
+            "lines_found": result["lines_found"],
+        })
+
+    out = {
+        "format": "matrix",
+        "lines": lines,
+        "products": products,
+        "stores": out_stores,
+        "prices": prices,
+        "choice": choice,
+        "required_lines": len(lines),
+        "totals": response["totals"],
+        "radius_km": response["radius_km"],
+        "missing_products": response["missing_products"],
+    }
+    if "split" in response:
+        out["split"] = response["split"]
+    return out
+
+
+def _split_basket(
+    basket: Dict[str, Any],
+    stores: List[Any],
+    scores: Any,
+    line_pids: List[int],
+    line_qtys: List[float],
+    metadata: Dict[int, asyncpg.Record],
+    recipe_by_chain: Dict[str, Dict[str, Dict]],
+) -> Optional[Dict[str, Any]]:
+    """Odavaim jaotus kuni basket["split_stores"] poe vahel
+    (services/split_optimizer.py). Read = tavalised tooted, siis retsepti
+    koostisosad; kulu = sama parim hind × kogus, mida poe tulemus kasutab."""
+    recipe_items: List[Dict] = basket["recipe_items"]
+    include_lines: bool = basket["include_lines"]
+    n_normal = len(line_pids)
+    chains = [(_rv(s, "chain") or "").lower() for s in stores]
+
+    cost = np.full((n_normal + len(recipe_items), len(stores)), np.inf)
+    if n_normal:
+        qty = np.asarray(line_qtys, dtype=np.float64).reshape(-1, 1)
+        cost[:n_normal] = np.where(scores.found, scores.best_price * qty, np.inf)
+    for j, item in enumerate(recipe_items):
+        for k, chain in enumerate(chains):
+            product = recipe_by_chain.get(chain, {}).get(item["product"])
+            if product is not None:
+                cost[n_normal + j, k] = product["price"] * item["quantity"]
+
+    # Üks veerg hinnaallika + keti kohta (lähim füüsiline pood, poed on
+    # kauguse järjekorras) — sama allikaga poed on optimeerijale identsed.
+    reps: Dict[Tuple[int, str], int] = {}
+    for k, chain in enumerate(chains):
+        reps.setdefault((int(scores.source_group[k]), chain), k)
+    rep_idx = np.asarray(list(reps.values()), dtype=np.int64)
+    cost = cost[:, rep_idx]
+
+    plan = best_split(cost, basket["split_stores"], basket["split_penalty"])
+    if plan is None:
+        return None
+
+    by_store: Dict[int, Dict[str, Any]] = {}
+    for k in (int(rep_idx[j]) for j in plan.stores):
+        s = stores[k]
+        by_store[k] = {
+            "store_id": int(_rv(s, "id")),
+            "chain": _rv(s, "chain"),
+            "store_name": _rv(s, "name"),
+            "distance_km": _round2(float(_rv(s, "distance_km"))) if _rv(s, "distance_km") is not None else None,
+            "subtotal": 0.0,
+            "lines_found": 0,
+        }
+        if include_lines:
+            by_store[k]["lines"] = []
+
+    not_found: List[str] = []
+    for i, j in enumerate(plan.assignment.tolist()):
+        k = int(rep_idx[j]) if j >= 0 else -1
+        if i < n_normal:
+            pid = line_pids[i]
+            if k < 0:
+                meta = metadata.get(pid)
+                not_found.append(_rv(meta, "name") if meta else f"#{pid}")
+                continue
+            best_price = float(scores.best_price[i, k])
+            best_pid = int(scores.best_pid[i, k])
+            meta = metadata.get(best_pid) or metadata.get(pid)
+            line = {
+                "product_id": best_pid,
+                "product_name": _rv(meta, "name") if meta else f"#{best_pid}",
+                "qty": line_qtys[i],
+                "unit_price": _round2(best_price),
+                "line_total": _round2(best_price * line_qtys[i]),
+                "is_per_kg": (_rv(meta, "size_text") or "").lower() == "kg" if meta else False,
+            }
+        else:
+            item = recipe_items[i - n_normal]
+            if k < 0:
+                not_found.append(item["product"])
+                continue
+            product = recipe_by_chain[chains[k]][item["product"]]
+            line = {
+                "product_id": product["product_id"],
+                "product_name": product["name"],
+                "qty": item["quantity"],
+                "unit_price": _round2(product["price"]),
+                "line_total": _round2(product["price"] * item["quantity"]),
+                "ingredient": item["product"],
+                "is_per_kg": False,
+            }
+        entry = by_store[k]
+        entry["subtotal"] += float(cost[i, j])
+        entry["lines_found"] += 1
+        if include_lines:
+            entry["lines"].append(line)
+
+    split_stores = list(by_store.values())
+    for entry in split_stores:
+        entry["subtotal"] = _round2(entry["subtotal"])
+    total = _round2(plan.total)
+    single = _round2(plan.single_total) if plan.single_total is not None else None
+    return {
+        "max_stores": basket["split_stores"],
+        "extra_store_penalty": basket["split_penalty"],
+        "total_price": total,
+        "best_single_store_total": single,
+        "savings": _round2(single - total) if single is not None else None,
+        "lines_found": sum(e["lines_found"] for e in split_stores),
+        "required_lines": len(cost),
+        "stores": split_stores,
+        "not_found": not_found,
+    }
+
+
+async def compare_baskets_service(db: Any, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Võrdleb mitut korvi ühe asukoha (lat/lon/radius_km) jaoks.
+
+    Kõigi korvide nimed, grupilaiendused, retsepti koostisosad, poed ja
+    hinnad laetakse ÜKS kord korvide ühendi jaoks; iga korv skooritakse
+    seejärel samade andmete pealt (_score_basket). body["baskets"] on
+    loend {"items", "include_lines", "require_all_items"}; tagastab
+    vastused samas järjekorras, igaüks /compare vastuse kujul.
+    """
     conn, should_release = await _acquire(db)
     try:
         lat = body.get("lat")
@@ -441,91 +891,47 @@ async def compare_basket_service(db: Any, body: Dict[str, Any]) -> Dict[str, Any
         radius_km = float(body.get("radius_km") or 5.0)
         limit_stores = int(body.get("limit_stores") or 50)
         offset_stores = int(body.get("offset_stores") or 0)
-        include_lines = bool(body.get("include_lines") or False)
-        require_all = bool(body.get("require_all_items") or False)
 
-        raw_items = body.get("items") or []
-        if not raw_items and "grocery_list" in body:
-            raw_items = (body.get("grocery_list") or {}).get("items") or []
+        baskets = [_parse_basket(b) for b in (body.get("baskets") or []) if isinstance(b, dict)]
+        if not baskets:
+            return []
 
-        # Normaliseeri — eralda retsepti koostisosad tavalistest toodetest
-        recipe_items: List[Dict] = []
-        normal_items: List[Dict] = []
-
-        for it in raw_items:
-            if not isinstance(it, dict):
-                continue
-            name = str(it.get("product", "") or "").strip()
-            if not name:
-                continue
-            qty = float(it.get("quantity") or 1)
-            if qty <= 0:
-                continue
-
-            ingredient_en = str(it.get("ingredient_name_en", "") or "").strip()
-            if ingredient_en:
-                recipe_items.append({
-                    "product": name,
-                    "ingredient_name_en": ingredient_en,
-                    "quantity": qty,
-                })
-            else:
-                normal_items.append({
-                    "product": name,
-                    "quantity": qty,
-                    "product_id": _as_int_or_none(it.get("product_id")),
-                })
-
-        # --- Retsepti koostisosad ---
-        import asyncio
-        recipe_by_chain: Dict[str, Dict[str, Dict]] = {}
-
-        async def _resolve_recipe_item(item):
-            ing_en = item["ingredient_name_en"]
-            ing_et = item["product"]
-            async with db.acquire() as recipe_conn:
-                per_chain = await _find_cheapest_per_chain(recipe_conn, ing_en)
-            return ing_et, per_chain
-
-        if recipe_items:
-            tasks = [_resolve_recipe_item(it) for it in recipe_items]
-            recipe_results = await asyncio.gather(*tasks)
-            for ing_et, per_chain in recipe_results:
-                for chain_key, product in per_chain.items():
-                    recipe_by_chain.setdefault(chain_key, {})[ing_et] = product
+        # --- Retsepti koostisosad (kõik unikaalsed ingredient_name_en ühe päringuga) ---
+        ingredients_en = list(dict.fromkeys(
+            item["ingredient_name_en"] for b in baskets for item in b["recipe_items"]
+        ))
+        recipe_by_en: Dict[str, Dict[str, Dict]] = {}
+        if ingredients_en:
+            with stage("recipes"):
+                recipe_by_en = await _find_cheapest_per_chain(db, ingredients_en)
 
         # --- Tavalised tooted ---
-        qty_by_pid: Dict[int, float] = {}
-        qty_by_name: Dict[str, float] = {}
-
-        for it in normal_items:
-            pid = _as_int_or_none(it.get("product_id"))
-            qty = max(float(it.get("quantity") or 1), 0.1)
-            if pid is not None:
-                qty_by_pid[pid] = qty_by_pid.get(pid, 0.0) + qty
-            else:
-                nm = _norm(str(it.get("product") or ""))
-                if nm:
-                    qty_by_name[nm] = qty_by_name.get(nm, 0.0) + qty
-
-        resolved_by_name = await _resolve_products_by_name(conn, list(qty_by_name.keys()))
-        missing_products = [{"input": k} for k in qty_by_name if k not in resolved_by_name]
-        for nm, rec in resolved_by_name.items():
-            pid = int(_rv(rec, "id"))
-            qty_by_pid[pid] = qty_by_pid.get(pid, 0.0) + qty_by_name.get(nm, 0.0)
+        all_names = sorted({nm for b in baskets for nm in b["qty_by_name"]})
+        with stage("names"):
+            resolved_by_name = await _resolve_products_by_name(conn, all_names)
+        for b in baskets:
+            b["missing_products"] = [{"input": k} for k in b["qty_by_name"] if k not in resolved_by_name]
+            for nm, qty in b["qty_by_name"].items():
+                rec = resolved_by_name.get(nm)
+                if rec is not None:
+                    pid = int(_rv(rec, "id"))
+                    b["qty_by_pid"][pid] = b["qty_by_pid"].get(pid, 0.0) + qty
 
         metadata: Dict[int, asyncpg.Record] = {}
         group_members: Dict[int, List[int]] = {}
+        group_info_by_pid: Dict[int, Tuple[int, str]] = {}
         all_pids_for_prices: List[int] = []
 
-        if qty_by_pid:
-            basket_pids = sorted(qty_by_pid.keys())
-            metadata = await _fetch_products_by_id(conn, basket_pids)
+        basket_pids = sorted({pid for b in baskets for pid in b["qty_by_pid"]})
+        if basket_pids:
+            with stage("products"):
+                metadata = await _fetch_products_by_id(conn, basket_pids)
             for nm, rec in resolved_by_name.items():
                 pid = int(_rv(rec, "id"))
                 if pid not in metadata:
                     metadata[pid] = rec
-            group_members = await _expand_groups(conn, basket_pids)
+            with stage("groups"):
+                group_members = await _expand_groups(conn, basket_pids)
             # v3 fix (ChatGPT leid #1): varem kontrolliti siin ainult
             # "kas shadow on env muutujaga sisse lülitatud", mis
             # tähendas, et see lisapäring tehti 100% request'idest,
@@ -540,201 +946,105 @@ async def compare_basket_service(db: Any, body: Dict[str, Any]) -> Dict[str, Any
             _shadow_active = (
                 substitution_shadow is not None and bool(body.get("_shadow_sampled"))
             )
-            group_info_by_pid: Dict[int, Tuple[int, str]] = (
-                await _fetch_group_info_for_pids(conn, basket_pids)
-                if _shadow_active
-                else {}
-            )
+            if _shadow_active:
+                with stage("groups"):
+                    group_info_by_pid = await _fetch_group_info_for_pids(conn, basket_pids)
             all_pids_for_prices = sorted({
                 mid for pid in basket_pids
                 for mid in group_members.get(pid, [pid])
             })
             extra_pids = [p for p in all_pids_for_prices if p not in metadata]
             if extra_pids:
-                metadata.update(await _fetch_products_by_id(conn, extra_pids))
-
-        if not qty_by_pid and not recipe_items:
-            return {"results": [], "totals": {}, "stores": [], "radius_km": radius_km, "missing_products": missing_products}
-
-        # Candidate stores
-        stores = await _candidate_stores(conn, lat, lon, radius_km, limit_stores, offset_stores)
+                with stage("products"):
+                    metadata.update(await _fetch_products_by_id(conn, extra_pids))
+
+        scorable = [b for b in baskets if b["qty_by_pid"] or b["recipe_items"]]
+        stores = []
+        if scorable:
+            with stage("stores"):
+                stores = await _candidate_stores(conn, lat, lon, radius_km, limit_stores, offset_stores)
         if not stores:
-            return {"results": [], "totals": {}, "stores": [], "radius_km": radius_km, "missing_products": missing_products}
-        store_ids = [int(_rv(s, "id")) for s in stores]
-
-        # Hinnad
-        by_store: Dict[int, Dict[int, float]] = {}
-        if all_pids_for_prices:
-            price_rows = await _latest_prices(conn, all_pids_for_prices, store_ids)
-            for r in price_rows:
-                sid = int(_rv(r, "store_id"))
-                pid = int(_rv(r, "product_id"))
-                by_store.setdefault(sid, {})[pid] = float(_rv(r, "price"))
-
-        required_normal = len(qty_by_pid)
-        required_recipe = len(recipe_items)
-        required_total = required_normal + required_recipe
-
-        results: List[Dict] = []
-        # v4.6.9 UUS — kogub kokku kõik (group_id, sub_code, chain,
-        # store_id) kombinatsioonid, kus täpne toode jäi poest leidmata.
-        # Shadow mode kasutab neid PÄRAST kogu vastuse valmimist —
-        # see nimekiri ise EI MÕJUTA tulemust kuidagi, ainult kogutakse.
-        shadow_missing_items: List[Tuple[int, str, str, Optional[int]]] = []
-
-        for s in stores:
-            sid = int(_rv(s, "id"))
-            chain = (_rv(s, "chain") or "").lower()
-            s_prices = by_store.get(sid, {})
-            lines = []
-            total = 0.0
-            lines_found = 0
-            not_found = []
-
-            # Tavalised tooted
-            for pid, qty in qty_by_pid.items():
-                members = group_members.get(pid, [pid])
-                best_pid = None
-                best_price = None
-                for mid in members:
-                    p = s_prices.get(mid)
-                    if p is not None and (best_price is None or p < best_price):
-                        best_price = p
-                        best_pid = mid
-                if best_price is None:
-                    meta = metadata.get(pid)
-                    not_found.append(_rv(meta, "name") if meta else f"#{pid}")
-                    # v4.6.9 UUS — shadow kandidaat. See EI muuda
-                    # not_found/total/lines_found — puhtalt kõrvalkanal.
-                    group_info = group_info_by_pid.get(pid)
-                    if group_info is not None:
-                        shadow_missing_items.append(
-                            (group_info[0], group_info[1], chain, sid)
-                        )
-                    continue
-                lines_found += 1
-                total += best_price * qty
-                if include_lines:
-                    meta = metadata.get(best_pid) if best_pid else metadata.get(pid)
-                    is_per_kg = (_rv(meta, "size_text") or "").lower() == "kg" if meta else False
-                    lines.append({
-                        "product_id": best_pid,
-                        "product_name": _rv(meta, "name") if meta else f"#{best_pid}",
-                        "qty": qty,
-                        "unit_price": _round2(best_price),
-                        "line_total": _round2(best_price * qty),
-                        "is_per_kg": is_per_kg,
-                    })
-
-            # Retsepti koostisosad
-            chain_recipe = recipe_by_chain.get(chain, {})
-            for item in recipe_items:
-                ing_et = item["product"]
-                product = chain_recipe.get(ing_et)
-                if product is None:
-                    not_found.append(ing_et)
-                    continue
-                lines_found += 1
-                total += product["price"] * item["quantity"]
-                if include_lines:
-                    lines.append({
-                        "product_id": product["product_id"],
-                        "product_name": product["name"],
-                        "qty": item["quantity"],
-                        "unit_price": _round2(product["price"]),
-                        "line_total": _round2(product["price"] * item["quantity"]),
-                        "ingredient": ing_et,
-                        "is_per_kg": False,
-                    })
-
-            normal_found = sum(1 for pid in qty_by_pid if any(
-                by_store.get(sid, {}).get(mid) is not None
-                for mid in group_members.get(pid, [pid])
-            ))
-
-            if lines_found == 0:
-                total_price = None
-            elif require_all and qty_by_pid and normal_found < required_normal:
-                total_price = None
-            else:
-                total_price = _round2(total)
-
-            result = {
-                "store_id": sid,
-                "chain": _rv(s, "chain"),
-                "store_name": _rv(s, "name"),
-                "distance_km": _round2(float(_rv(s, "distance_km"))) if _rv(s, "distance_km") is not None else None,
-                "lines_found": lines_found,
-                "required_lines": required_total,
-                "total_price": total_price,
-                "not_found": not_found,
-            }
-            if include_lines:
-                result["lines"] = lines
-            results.append(result)
-
-        def sort_key(x):
-            complete = 1 if (x.get("total_price") is not None and x.get("lines_found") == x.get("required_lines")) else 0
-            price = x.get("total_price") if x.get("total_price") is not None else float("inf")
-            dist = x.get("distance_km") if x.get("distance_km") is not None else float("inf")
-            return (-complete, -int(x.get("lines_found", 0)), price, dist)
-
-        results = [r for r in results if r.get("lines_found", 0) > 0]
-        results.sort(key=sort_key)
-
-        # The "winner" shown in totals is always the first sorted result —
-        # sort_key already ranks complete baskets ahead of incomplete ones,
-        # so this can never disagree with what the UI displays as the top
-        # store. Previously this was tracked separately during the store
-        # loop using only total_price, which ignored completeness and
-        # could crown an incomplete (partial-sum) basket as "cheapest".
-        winner = next((r for r in results if r.get("total_price") is not None), None)
-        totals: Dict[str, Any] = {}
-        if winner is not None:
-            totals = {
-                "cheapest_store_id": winner["store_id"],
-                "cheapest_total": winner["total_price"],
-                "cheapest_chain": winner["chain"],
-                "cheapest_store_name": winner["store_name"],
-            }
-
-        response = {
-            "results": results,
-            "totals": totals,
-            "stores": [
-                {
-                    "id": int(_rv(s, "id")),
-                    "name": _rv(s, "name"),
-                    "chain": _rv(s, "chain"),
-                    "distance_km": _round2(float(_rv(s, "distance_km"))) if _rv(s, "distance_km") is not None else None,
-                    "lat": float(_rv(s, "lat")) if _rv(s, "lat") is not None else None,
-                    "lon": float(_rv(s, "lon")) if _rv(s, "lon") is not None else None,
-                }
-                for s in stores
-            ],
-            "radius_km": float(radius_km),
-            "missing_products": missing_products,
-        }
-
-        # v4.6.9/v2 UUS — Etapp 5B shadow mode. v2 fix (ChatGPT leid #1
-        # + #3): EI käivitata enam siin otse await'iga (see (a) andis
-        # jagatud conn'i paralleelsetele ülesannetele, mis asyncpg's
-        # pole lubatud, ja (b) lisas /compare vastusele kuni
-        # SUBSTITUTION_SHADOW_TIMEOUT_SECONDS latentsust vaatamata
-        # kommentaarile). Selle asemel lisatakse shadow-kontekst
-        # response'i SISEMISE võtmena "_shadow_missing_items" —
-        # compare.py router (kellel on juba pool, mitte ainult conn)
-        # kasutab seda FastAPI BackgroundTasks kaudu PÄRAST vastuse
-        # kliendile saatmist. See "_shadow_missing_items" võti EI JÕUA
-        # kliendini, kuna compare.py router koostab kliendivastuse
-        # ainult valitud teadaolevatest võtmetest (results/totals/
-        # stores/radius_km/missing_products).
-        if substitution_shadow is not None and shadow_missing_items:
-            response["_shadow_missing_items"] = shadow_missing_items
-            response["_shadow_compare_request_id"] = body.get("request_id")
-
-        return response
+            return [_empty_response(radius_km, b["missing_products"], b["format"]) for b in baskets]
+
+        matrix = get_price_matrix()
+        if not matrix.ready:
+            store_ids = [int(_rv(s, "id")) for s in stores]
+            with stage("prices"):
+                source_of = await _effective_sources(conn, store_ids)
+                price_rows = (
+                    await _latest_prices(conn, all_pids_for_prices, sorted(set(source_of.values())))
+                    if all_pids_for_prices else []
+                )
+                matrix = PriceMatrix.from_rows(price_rows, source_of)
+
+        responses: List[Dict[str, Any]] = []
+        for b in baskets:
+            if not (b["qty_by_pid"] or b["recipe_items"]):
+                responses.append(_empty_response(radius_km, b["missing_products"], b["format"]))
+                continue
+            with stage("score"):
+                response, shadow_missing_items = _score_basket(
+                    b, stores, matrix, metadata, group_members,
+                    group_info_by_pid, recipe_by_en, radius_km,
+                )
+            # v4.6.9/v2 UUS — Etapp 5B shadow mode. v2 fix (ChatGPT leid #1
+            # + #3): EI käivitata enam siin otse await'iga (see (a) andis
+            # jagatud conn'i paralleelsetele ülesannetele, mis asyncpg's
+            # pole lubatud, ja (b) lisas /compare vastusele kuni
+            # SUBSTITUTION_SHADOW_TIMEOUT_SECONDS latentsust vaatamata
+            # kommentaarile). Selle asemel lisatakse shadow-kontekst
+            # response'i SISEMISE võtmena "_shadow_missing_items" —
+            # compare.py router (kellel on juba pool, mitte ainult conn)
+            # kasutab seda FastAPI BackgroundTasks kaudu PÄRAST vastuse
+            # kliendile saatmist. See "_shadow_missing_items" võti EI JÕUA
+            # kliendini, kuna compare.py router koostab kliendivastuse
+            # ainult valitud teadaolevatest võtmetest (results/totals/
+            # stores/radius_km/missing_products).
+            if substitution_shadow is not None and shadow_missing_items:
+                response["_shadow_missing_items"] = shadow_missing_items
+                response["_shadow_compare_request_id"] = body.get("request_id")
+            responses.append(response)
+        return responses
 
     finally:
         if should_release:
             await db.release(conn)
+
+
+async def compare_basket_service(db: Any, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Üks korv — compare_baskets_service() ühe-elemendilise loendiga,
+    tulemuste vahemälu (services/compare_cache.py) taga."""
+    cache = get_compare_cache()
+    stores = candidate_distances(body)
+    cache_key = cache.key_for(body, stores)
+    if cache_key is not None:
+        with stage("cache"):
+            cached = await cache.get(cache_key)
+        if cached is not None:
+            # Sama poodide loend; kaugused selle päringu asukohast.
+            return with_distances(cached, dict(stores))
+
+    response = await _compare_one(db, body)
+    # Voo jaoks ilma ridadeta skooritud vastust (_lines_for) ei salvestata.
+    if cache_key is not None and "_shadow_missing_items" not in response and "_lines_for" not in response:
+        with stage("cache"):
+            await cache.set(cache_key, response)
+    return response
+
+
+async def _compare_one(db: Any, body: Dict[str, Any]) -> Dict[str, Any]:
+    basket = {
+        "items": body.get("items") or [],
+        "grocery_list": body.get("grocery_list"),
+        "include_lines": body.get("include_lines"),
+        "lazy_lines": body.get("_lazy_lines"),
+        "require_all_items": body.get("require_all_items"),
+        "split_stores": body.get("split_stores"),
+        "split_penalty": body.get("split_penalty"),
+        "format": body.get("format"),
+    }
+    shared = {k: v for k, v in body.items() if k not in basket}
+    responses = await compare_baskets_service(db, {**shared, "baskets": [basket]})
+    if not responses:
+        return _empty_response(float(body.get("radius_km") or 5.0), [])
+    return responses[0]
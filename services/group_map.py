@@ -0,0 +1,115 @@
+# services/group_map.py
+"""
+Protsessisisene tootegruppide kaart: pid -> group_id'd, group_id ->
+liikmete pid'd, group_id -> sub_code.
+
+Grupid muutuvad ainult build_product_groups.py / match-importide ajal,
+aga /compare tegi igal päringul product_group_members self-join'i
+(_expand_groups) ja shadow-sample'i korral veel ühe join'i
+(_fetch_group_info_for_pids). Kaart laetakse taustal (main.py) ja
+laetakse uuesti, kui cache_generations 'product_groups' loendur muutub
+(vt migrations/2026-10-16-product-groups-cache-gen.sql). Kuni esimene
+laadimine pole valmis, on `ready` False ja compare_service kasutab SQL-i.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from asyncpg import exceptions as pgerr
+
+from services.cache_generation import current_generation
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class GroupMap:
+    def __init__(self) -> None:
+        self._groups_of: Dict[int, List[int]] = {}    # pid -> group_id'd kasvavas järjekorras
+        self._members: Dict[int, List[int]] = {}      # group_id -> liikmete pid'd
+        self._sub_code: Dict[int, Optional[str]] = {}  # group_id -> sub_code
+        self.generation: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "groups": len(self._members),
+            "grouped_products": len(self._groups_of),
+            "generation": self.generation,
+        }
+
+    # ---------------- päringud ----------------
+
+    def expand(self, basket_pids: List[int]) -> Dict[int, List[int]]:
+        """Sama kuju mis compare_service._expand_groups(): {basket_pid:
+        kõigi tema gruppide liikmed}; grupita pid jääb välja."""
+        result: Dict[int, List[int]] = {}
+        for pid in basket_pids:
+            for gid in self._groups_of.get(int(pid), ()):
+                result.setdefault(int(pid), []).extend(self._members.get(gid, ()))
+        return result
+
+    def group_info(self, basket_pids: List[int]) -> Dict[int, Tuple[int, str]]:
+        """Sama kuju mis compare_service._fetch_group_info_for_pids():
+        {basket_pid: (group_id, sub_code)}, väikseim sub_code'iga grupp."""
+        result: Dict[int, Tuple[int, str]] = {}
+        for pid in basket_pids:
+            for gid in self._groups_of.get(int(pid), ()):
+                sub_code = self._sub_code.get(gid)
+                if sub_code is not None:
+                    result[int(pid)] = (gid, sub_code)
+                    break
+        return result
+
+    # ---------------- laadimine ----------------
+
+    async def refresh(self, pool) -> None:
+        """Laeb kaardi, kui see pole veel laetud või 'product_groups'
+        loendur on muutunud. Ilma cache_generations tabelita iga kord."""
+        async with pool.acquire() as conn:
+            generation = await current_generation(conn, "product_groups")
+            if self.ready and generation is not None and generation == self.generation:
+                return
+            started = time.perf_counter()
+            try:
+                # Ühes snapshot'is, et liikmed ja grupid klapiksid.
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    member_rows = await conn.fetch(
+                        "SELECT group_id, product_id FROM product_group_members "
+                        "ORDER BY group_id, product_id"
+                    )
+                    group_rows = await conn.fetch("SELECT id, sub_code FROM product_groups")
+            except (pgerr.UndefinedTableError, pgerr.UndefinedColumnError):
+                member_rows, group_rows = [], []
+
+        groups_of: Dict[int, List[int]] = {}
+        members: Dict[int, List[int]] = {}
+        for r in member_rows:
+            gid, pid = int(r["group_id"]), int(r["product_id"])
+            members.setdefault(gid, []).append(pid)
+            groups_of.setdefault(pid, []).append(gid)
+        sub_code = {int(r["id"]): r["sub_code"] for r in group_rows}
+
+        self._groups_of, self._members, self._sub_code = groups_of, members, sub_code
+        changed = not self.ready or self.generation != generation
+        self.generation = generation
+        self.loaded_at = time.time()
+        if changed:
+            logger.info(
+                "🧩 Group map loaded: %d groups, %d products (generation %s) in %.0fms",
+                len(members), len(groups_of), generation,
+                (time.perf_counter() - started) * 1000,
+            )
+
+
+_map = GroupMap()
+
+
+def get_group_map() -> GroupMap:
+    return _map
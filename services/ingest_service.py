@@ -89,6 +89,7 @@ async def upsert_product_and_price(
                     raise  # weird edge case: no ean or still not found
 
         # STEP C: insert today's price snapshot for this store+product
+        #   (trg_prices_current_ins keeps current_prices in sync)
         await conn.execute(
             """
             INSERT INTO prices (store_id, product_id, price, collected_at)
@@ -0,0 +1,253 @@
+# services/ingredient_resolver.py
+"""
+Retsepti koostisosa -> (Eesti otsingusõnad, sub_code'id) lahendamine,
+ühine compare_service'ile ja recipes.py-le.
+
+Järjekord: protsessisisene LRU -> recipe_ingredient_cache tabel -> Claude.
+  * LRU: korduv koostisosa ei lähe Postgresi; kirjed aeguvad
+    INGREDIENT_CACHE_TTL järel (tabelit võib muuta ka scripts/fix_recipes.py).
+  * Single-flight: samaaegsed päringud sama koostisosa kohta ootavad
+    ÜHT laadimist — Claude'i kutsutakse üks kord, mitte iga request'i kohta.
+  * Negatiivne vahemälu: ebaõnnestunud Claude'i kutse jäetakse
+    INGREDIENT_NEGATIVE_TTL sekundiks meelde (tabelisse ei kirjutata),
+    et katkestuse ajal iga request ei prooviks uuesti.
+  * Üks jagatud httpx klient (suletakse main.py shutdown'is).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from settings import INGREDIENT_CACHE_SIZE, INGREDIENT_CACHE_TTL, INGREDIENT_NEGATIVE_TTL
+
+logger = logging.getLogger("uvicorn.error")
+
+ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
+ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
+
+SKIP_INGREDIENTS = {
+    "water", "salt", "black pepper", "pepper", "white pepper",
+    "mixed herbs", "seasoning", "oil spray", "to taste",
+}
+
+VALID_SUB_CODES = [
+    "dry_pasta_rice", "dairy_eggs", "dairy_milk", "dairy_butter_margarine",
+    "dairy_cream_sourcream", "dairy_yogurt_kefir", "cheese_regular",
+    "cheese_delicatessen", "dairy_cheese_slices", "meat_poultry", "meat_beef_lamb_game",
+    "meat_minced", "meat_pork", "meat_hams", "meat_sausages",
+    "fish_fresh", "fish_salted_smoked", "fish_other", "fish_processed",
+    "produce_root_veg", "produce_mushrooms", "produce_tropical",
+    "produce_herbs_salads_sprouts", "produce_smoothies_fresh_juices",
+    "dry_flour_sugar_baking", "dry_canned_veg", "dry_other", "dry_ready_meals_jars",
+    "frozen_bakery", "frozen_veg", "frozen_berries_fruit", "frozen_ready_meals",
+    "frozen_meat", "frozen_other", "frozen_desserts_icecream",
+    "oils_olive", "oils_other", "oils_vinegar",
+    "sauces_ketchup_mayo", "sauces_pasta_cooking", "sauces_soy_worcester",
+    "sauces_other", "sauces_marinades",
+    "spices_herbs_spice_mix", "spices_broth_stock",
+    "drinks_wine", "drinks_beer_cider", "drinks_soft_soda",
+    "sweets_chocolate_bars", "sweets_nuts_driedfruit",
+    "bakery_other", "bakery_bread_loaves",
+    "dry_canned_fruit",
+]
+
+async def _ask_claude(ingredient_en: str) -> dict:
+    if not ANTHROPIC_API_KEY:
+        return {"search_terms": [ingredient_en.lower()], "sub_codes": []}
+
+    prompt = f"""You help match recipe ingredients to Estonian grocery store product names.
+
+Ingredient: "{ingredient_en}"
+
+CRITICAL: search_terms MUST be Estonian words used in store databases. sub_codes MUST come from the list.
+
+Estonian translations:
+- bacon, pancetta → "peekon"
+- egg, eggs, egg yolks → "muna"
+- spaghetti → "spaghetti"
+- parmesan, pecorino, hard cheese → "parmesan", "parmigiano", "grana padano", "dziugas"
+- butter → "või"
+- milk → "piim"
+- cream, double cream, heavy cream → "koor", "vahukoor"
+- chicken breast → "kanafileed"
+- chicken wings → "kanatiivad"
+- ground beef, minced beef → "veisehakkliha"
+- beef → "veiseliha"
+- pork → "sealiha"
+- salmon → "lõhe"
+- onion → "sibul"
+- garlic → "küüslauk"
+- tomato, tomatoes → "tomat"
+- cherry tomatoes → "kirsstomat"
+- carrot → "porgand"
+- potato → "kartul"
+- mushrooms → "seened"
+- olive oil → "oliiviõli"
+- flour, plain flour → "jahu"
+- sugar → "suhkur"
+- rice → "riis"
+- pasta → "pasta"
+- lemon → "sidrun"
+- cheese → "juust"
+- mozzarella → "mozzarella"
+- honey → "mesi"
+- mustard → "sinep"
+- soy sauce → "sojakaste"
+- white wine → "valge vein"
+- red wine → "punane vein", "merlot", "cabernet", "shiraz", "malbec", "pinot noir", "tempranillo", "syrah"
+
+Valid sub_codes: {json.dumps(VALID_SUB_CODES)}
+
+Examples:
+- "bacon" → {{"search_terms": ["peekon"], "sub_codes": ["meat_hams"]}}
+- "egg yolks" → {{"search_terms": ["muna"], "sub_codes": ["dairy_eggs"]}}
+- "parmesan" → {{"search_terms": ["parmesan", "parmigiano", "grana padano", "dziugas"], "sub_codes": ["cheese_regular", "cheese_delicatessen"]}}
+- "spaghetti" → {{"search_terms": ["spaghetti"], "sub_codes": ["dry_pasta_rice"]}}
+- "red wine" → {{"search_terms": ["punane vein", "merlot", "cabernet", "shiraz", "malbec", "pinot noir", "tempranillo", "syrah"], "sub_codes": ["drinks_wine"]}}
+- "white wine" → {{"search_terms": ["valge vein", "chardonnay", "sauvignon", "riesling", "pinot grigio"], "sub_codes": ["drinks_wine"]}}
+- "water" → {{"search_terms": [], "sub_codes": []}}
+- "salt" → {{"search_terms": [], "sub_codes": []}}
+
+Return ONLY valid JSON for "{ingredient_en}":"""
+
+    resp = await _get_http_client().post(
+        ANTHROPIC_API_URL,
+        headers={
+            "x-api-key": ANTHROPIC_API_KEY,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+        },
+        json={
+            "model": "claude-haiku-4-5-20251001",
+            "max_tokens": 200,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+    )
+    data = resp.json()
+    if "error" in data:
+        raise ValueError(f"API error: {data['error']}")
+    if "content" not in data:
+        raise ValueError(f"Unexpected response: {data}")
+    text = data["content"][0]["text"].strip()
+    text = text.replace("```json", "").replace("```", "").strip()
+    return json.loads(text)
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=10.0)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class IngredientResolver:
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # võti -> (tulemus või None = lahendamata, aegumise hetk)
+        self._entries: "OrderedDict[str, Tuple[Optional[Dict[str, List[str]]], float]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _put(self, key: str, value: Optional[Dict[str, List[str]]]) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _load(self, pool, key: str, ingredient_en: str) -> Optional[Dict[str, List[str]]]:
+        # Ühendust ei hoita Claude'i kutse (kuni 10 s) ajal kinni — muidu
+        # võiksid paljud lahendamata koostisosad kogu pooli ära võtta.
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT search_terms, sub_codes FROM recipe_ingredient_cache WHERE ingredient_en = $1",
+                key,
+            )
+        if row:
+            value = {"search_terms": list(row["search_terms"]), "sub_codes": list(row["sub_codes"])}
+        else:
+            try:
+                value = await _ask_claude(ingredient_en)
+                value = {
+                    "search_terms": list(value.get("search_terms") or []),
+                    "sub_codes": list(value.get("sub_codes") or []),
+                }
+            except Exception as e:
+                logger.warning("Claude ingredient lookup failed for %r: %s", ingredient_en, e)
+                value = None
+            else:
+                async with pool.acquire() as conn:
+                    await conn.execute(
+                        """INSERT INTO recipe_ingredient_cache (ingredient_en, search_terms, sub_codes)
+                           VALUES ($1, $2, $3) ON CONFLICT (ingredient_en) DO NOTHING""",
+                        key, value["search_terms"], value["sub_codes"],
+                    )
+        self._put(key, value)
+        return value
+
+    async def resolve(self, pool, ingredient_en: str) -> Optional[Dict[str, List[str]]]:
+        """{"search_terms", "sub_codes"}; None, kui Claude'i kutse
+        ebaõnnestus (negatiivne vahemälu). SKIP_INGREDIENTS -> tühjad loendid."""
+        key = ingredient_en.lower().strip()
+        if key in SKIP_INGREDIENTS:
+            return {"search_terms": [], "sub_codes": []}
+
+        found, value = self._get(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(pool, key, ingredient_en))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f, k=key: self._inflight.pop(k, None))
+        # shield: ühe ootaja katkestamine ei katkesta teiste jaoks laadimist
+        return await asyncio.shield(future)
+
+
+_resolver = IngredientResolver(INGREDIENT_CACHE_SIZE, INGREDIENT_CACHE_TTL, INGREDIENT_NEGATIVE_TTL)
+
+
+def get_ingredient_resolver() -> IngredientResolver:
+    return _resolver
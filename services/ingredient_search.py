@@ -0,0 +1,109 @@
+# services/ingredient_search.py
+"""
+Retsepti koostisosade hulgapõhine otsing: üks päring kõigi (koostisosa,
+otsingusõna) paaride jaoks, mis tagastab iga (koostisosa, kett) odavaima
+toote.
+
+Varem tegid compare_service._find_cheapest_per_chain() ja
+recipes.find_products_per_store_for_ingredient() iga otsingusõna kohta
+eraldi `p.name ILIKE '%term%'` agregaadi — 12 koostisosaga retsept oli
+~30 rasket skaneerimist. Nüüd:
+  * sõnad tulevad unnest()-iga, sobitus lower(name) LIKE kaudu kasutab
+    trigrammi indeksit idx_products_name_trgm;
+  * välistused on eelarvutatud products.recipe_excluded veerus
+    (migrations/2026-10-16-recipe-ingredient-search.sql); kuni
+    scripts/backfill_recipe_excluded.py pole vanu ridu täitnud, arvutatakse
+    NULL ridadel sama avaldis product_recipe_excluded(name) kaudu;
+  * sub_code filter on koostisosa-põhine (unnest koostisosa/sub_code
+    paaridest); ilma sub_code'ideta koostisosa välistab kodukeemia jms.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+# Ilma sub_code'ideta koostisosa puhul need kategooriad ei ole toiduained.
+NON_FOOD_SUB_CODES = [
+    "hh_other", "hh_cleaners", "hh_laundry", "hh_dishwashing",
+    "pcare_oral_care", "pcare_other", "pcare_feminine_hygiene",
+    "baby_diapers", "pet_cat_wet", "pet_dog_wet", "pet_cat_dry", "pet_dog_dry",
+]
+
+_PRICE_COLUMNS = {"price", "effective_price"}
+
+_SEARCH_SQL = """
+WITH terms AS (
+  SELECT t.ingredient, lower(t.term) AS term
+  FROM unnest($1::text[], $2::text[]) AS t(ingredient, term)
+),
+subs AS (
+  SELECT s.ingredient, s.sub_code
+  FROM unnest($3::text[], $4::text[]) AS s(ingredient, sub_code)
+),
+matches AS (
+  SELECT DISTINCT t.ingredient, p.id
+  FROM terms t
+  JOIN products p ON lower(p.name) LIKE '%' || t.term || '%'
+  WHERE NOT COALESCE(p.recipe_excluded, product_recipe_excluded(p.name))
+    AND CASE
+          WHEN EXISTS (SELECT 1 FROM subs s WHERE s.ingredient = t.ingredient)
+            THEN EXISTS (SELECT 1 FROM subs s WHERE s.ingredient = t.ingredient AND s.sub_code = p.sub_code)
+          ELSE p.sub_code <> ALL($5::text[])
+        END
+),
+priced AS (
+  SELECT m.ingredient, p.id, p.name, lower(p.chain) AS chain,
+         p.image_url, p.brand, p.size_text,
+         MIN(cp.{price_column}) AS min_price
+  FROM matches m
+  JOIN products p ON p.id = m.id
+  JOIN current_prices cp ON cp.product_id = p.id
+  WHERE cp.price > 0
+    AND cp.collected_at > NOW() - INTERVAL '14 days'
+  GROUP BY m.ingredient, p.id, p.name, p.chain, p.image_url, p.brand, p.size_text
+)
+SELECT DISTINCT ON (ingredient, chain)
+       ingredient, id, name, chain, image_url, brand, size_text, min_price
+FROM priced
+WHERE min_price IS NOT NULL
+ORDER BY ingredient, chain, min_price ASC, id
+"""
+
+
+async def cheapest_per_chain(
+    db,
+    resolved: Dict[str, Dict[str, List[str]]],
+    price_column: str = "effective_price",
+) -> Dict[str, Dict[str, Any]]:
+    """resolved = {koostisosa: {"search_terms": [...], "sub_codes": [...]}}.
+    Tagastab {koostisosa: {kett (lower): rida}}; ridadel on id, name,
+    chain, image_url, brand, size_text, min_price. Koostisosa, millel
+    pole otsingusõnu või vasteid, tulemusse ei tule.
+
+    price_column: "effective_price" (promo arvestatud) või "price"."""
+    if price_column not in _PRICE_COLUMNS:
+        raise ValueError(f"price_column must be one of {sorted(_PRICE_COLUMNS)}")
+
+    term_ings: List[str] = []
+    terms: List[str] = []
+    sub_ings: List[str] = []
+    sub_codes: List[str] = []
+    for ingredient, r in resolved.items():
+        for term in r.get("search_terms") or []:
+            if term and str(term).strip():
+                term_ings.append(ingredient)
+                terms.append(str(term).strip())
+        for code in r.get("sub_codes") or []:
+            if code:
+                sub_ings.append(ingredient)
+                sub_codes.append(str(code))
+    if not terms:
+        return {}
+
+    rows = await db.fetch(
+        _SEARCH_SQL.format(price_column=price_column),
+        term_ings, terms, sub_ings, sub_codes, NON_FOOD_SUB_CODES,
+    )
+    out: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        out.setdefault(r["ingredient"], {})[r["chain"] or ""] = r
+    return out
@@ -0,0 +1,88 @@
+# services/name_cache.py
+"""
+Piiratud LRU vahemälu /compare nimede lahendamiseks: normaliseeritud
+nimi (lower(trim)) -> products rida, kattes nii products.name kui ka
+product_aliases.alias vasteid.
+
+Korduvad korvid ("piim", "leib", "munad") lahenduvad ilma Postgresita.
+Vahemälu tühjendatakse, kui cache_generations 'product_names' loendur
+muutub (toote ümbernimetamine/kustutamine, aliaste muutus — vt
+migrations/2026-10-16-product-names-cache-gen.sql). Uued tooted
+loendurit ei tõsta, seega "ei leitud" kirjed aeguvad NEGATIVE_TTL järel.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.cache_generation import current_generation
+from settings import NAME_CACHE_SIZE, NAME_CACHE_NEGATIVE_TTL
+
+
+class NameCache:
+    def __init__(self, max_size: int, negative_ttl: float) -> None:
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        # võti -> (rida või None = ei leitud, salvestamise aeg)
+        self._entries: "OrderedDict[str, Tuple[Optional[Any], float]]" = OrderedDict()
+        self.generation: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generation": self.generation,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_many(self, keys: Iterable[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """Tagastab (leitud read, vahemälust puuduvad võtmed). Teadaolevalt
+        puuduv nimi ei ole kummaski — seda pole mõtet uuesti küsida."""
+        found: Dict[str, Any] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None:
+                row, stored_at = entry
+                if row is not None or now - stored_at < self.negative_ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if row is not None:
+                        found[key] = row
+                    continue
+                del self._entries[key]
+            self.misses += 1
+            missing.append(key)
+        return found, missing
+
+    def put_many(self, keys: Iterable[str], rows_by_key: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        for key in keys:
+            self._entries[key] = (rows_by_key.get(key), now)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def refresh(self, pool) -> None:
+        """Tühjendab vahemälu, kui 'product_names' loendur on muutunud.
+        Ilma cache_generations tabelita tühjendatakse iga tsükli järel."""
+        async with pool.acquire() as conn:
+            generation = await current_generation(conn, "product_names")
+        if generation is None or generation != self.generation:
+            self.clear()
+        self.generation = generation
+
+
+_cache = NameCache(NAME_CACHE_SIZE, NAME_CACHE_NEGATIVE_TTL)
+
+
+def get_name_cache() -> NameCache:
+    return _cache
@@ -0,0 +1,341 @@
+# services/price_matrix.py
+"""
+Protsessisisene "current price matrix" /compare skoorimiseks.
+
+Hoiab iga (toode, hinnaallika pood) paari VIIMAST hinda (current_prices)
+NumPy maatriksis (rida = toode, veerg = hinnaallika pood, float32, NaN =
+hinda pole) koos eraldi promo-kihiga. Füüsiline pood seotakse veeruga
+store_effective_source tabeli kaudu (store_price_source'ist
+trigeritega tuletatud, vt migrations/2026-10-16-store-effective-source.sql).
+
+Laetakse rakenduse käivitumisel taustal (main.py) ja värskendatakse
+inkrementaalselt: iga tsükkel loeb ainult pärast viimast vesimärki
+(current_prices.updated_at) muutunud read. Kuni esimene laadimine pole valmis,
+on `ready` False ja compare_service kasutab vana SQL-rada.
+
+Skoorimine (score()) on vektoriseeritud: grupi liikmete miinimum on
+argmin üle (read × liikmed × poed) massiivi, korvi summa maskitud
+summa üle leitud ridade.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("uvicorn.error")
+
+# Inkrementaalne värskendus loeb uuesti ka viimase REFRESH_OVERLAP jagu
+# ridu: updated_at pannakse kirjutamise hetkel, aga rida muutub nähtavaks
+# alles scraper'i transaktsiooni commit'il, mis võib olla hiljem.
+REFRESH_OVERLAP = timedelta(minutes=15)
+
+# Mitu rida korraga kursorist loetakse ja maatriksisse kirjutatakse.
+_BATCH_ROWS = 20000
+
+_PRICES_SQL = """
+SELECT cp.product_id, cp.store_id, cp.price, cp.promo_price, cp.updated_at
+FROM current_prices cp
+{where}
+"""
+
+_SOURCE_SQL = """
+SELECT store_id, source_store_id
+FROM store_effective_source
+WHERE source_store_id <> store_id
+"""
+
+
+@dataclass
+class BasketScores:
+    """score() tulemus. Kõik massiivid on (korvi read × poed) kujul,
+    poodide järjekord = score()'le antud store_ids järjekord."""
+    best_price: np.ndarray   # float64, NaN = reale ei leitud hinda
+    best_pid: np.ndarray     # int64, -1 = reale ei leitud hinda
+    totals: np.ndarray       # (poed,) leitud ridade hind × kogus summa
+    lines_found: np.ndarray  # (poed,) leitud ridade arv
+    source_group: np.ndarray  # (poed,) hinnaallika rühm; sama rühm = samad hinnad
+    available: np.ndarray    # (read × poed) bool — rida on poes olemas
+
+    @property
+    def found(self) -> np.ndarray:
+        """Read, millele on hind arvutatud. complete_only=True korral
+        ainult täielikel poodidel; muidu sama mis available."""
+        return ~np.isnan(self.best_price)
+
+
+def _to_float(v: Any) -> float:
+    return float(v) if v is not None else np.nan
+
+
+class PriceMatrix:
+    def __init__(self) -> None:
+        self._rows: Dict[int, int] = {}       # product_id -> rea indeks
+        self._cols: Dict[int, int] = {}       # hinnaallika store_id -> veeru indeks
+        self._price = np.full((0, 0), np.nan, dtype=np.float32)
+        self._promo = np.full((0, 0), np.nan, dtype=np.float32)
+        self._effective = np.full((0, 0), np.nan, dtype=np.float32)
+        # Saadavuse bitikaart: rida = toode, bitid = hinnaallika veerud
+        # (np.packbits järjekord). Bitt on püsti, kui efektiivne hind on olemas.
+        self._avail = np.zeros((0, 0), dtype=np.uint8)
+        self._source_of: Dict[int, int] = {}  # füüsiline store_id -> allika store_id
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self.loaded_at: Optional[float] = None
+
+    # ---------------- olek ----------------
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "products": len(self._rows),
+            "source_stores": len(self._cols),
+            "bytes": int(
+                self._price.nbytes + self._promo.nbytes + self._effective.nbytes + self._avail.nbytes
+            ),
+            "watermark": self.version,
+        }
+
+    @property
+    def version(self) -> Optional[str]:
+        """Andmete versioon = suurim nähtud current_prices.updated_at.
+        Sama andmeseisu juures kõigis instantsides sama (compare_cache võti)."""
+        return self._watermark.isoformat() if self._watermark else None
+
+    def source_store_id(self, store_id: int) -> int:
+        return self._source_of.get(store_id, store_id)
+
+    # ---------------- kirjutamine ----------------
+
+    def _ensure_capacity(self, n_rows: int, n_cols: int) -> None:
+        rows, cols = self._price.shape
+        if n_rows <= rows and n_cols <= cols:
+            return
+        # Kasvatame varuga, et iga uus toode ei tähendaks kogu maatriksi
+        # ümberkopeerimist.
+        new_rows = max(n_rows, rows + rows // 2, 1024) if n_rows > rows else rows
+        new_cols = max(n_cols, cols + 8) if n_cols > cols else cols
+        for attr in ("_price", "_promo", "_effective"):
+            old = getattr(self, attr)
+            grown = np.full((new_rows, new_cols), np.nan, dtype=np.float32)
+            grown[: old.shape[0], : old.shape[1]] = old
+            setattr(self, attr, grown)
+        avail = np.zeros((new_rows, (new_cols + 7) // 8), dtype=np.uint8)
+        avail[: self._avail.shape[0], : self._avail.shape[1]] = self._avail
+        self._avail = avail
+
+    def _index(self, mapping: Dict[int, int], key: int) -> int:
+        idx = mapping.get(key)
+        if idx is None:
+            idx = mapping[key] = len(mapping)
+        return idx
+
+    def _apply(self, records: Iterable[Any]) -> None:
+        """Kirjutab hinnaread (product_id, store_id, price, promo_price,
+        updated_at) maatriksisse; olemasolev lahter kirjutatakse üle."""
+        rows: List[int] = []
+        cols: List[int] = []
+        prices: List[float] = []
+        promos: List[float] = []
+        for r in records:
+            rows.append(self._index(self._rows, int(r["product_id"])))
+            cols.append(self._index(self._cols, int(r["store_id"])))
+            prices.append(_to_float(r["price"]))
+            promos.append(_to_float(r["promo_price"]))
+            seen = r["updated_at"]
+            if seen is not None and (self._watermark is None or seen > self._watermark):
+                self._watermark = seen
+        if not rows:
+            return
+
+        self._ensure_capacity(len(self._rows), len(self._cols))
+        ri = np.asarray(rows, dtype=np.int64)
+        ci = np.asarray(cols, dtype=np.int64)
+        price = np.asarray(prices, dtype=np.float32)
+        promo = np.asarray(promos, dtype=np.float32)
+        self._price[ri, ci] = price
+        self._promo[ri, ci] = promo
+        # Sama reegel mis SQL-is: COALESCE(NULLIF(promo_price, 0), price).
+        use_promo = ~np.isnan(promo) & (promo != 0)
+        self._effective[ri, ci] = np.where(use_promo, promo, price)
+        # Bitikaart samast lõppseisust (sama lahter võib partiis korduda).
+        byte, bit = ci >> 3, (0x80 >> (ci & 7)).astype(np.uint8)
+        np.bitwise_and.at(self._avail, (ri, byte), ~bit)
+        has = ~np.isnan(self._effective[ri, ci])
+        np.bitwise_or.at(self._avail, (ri[has], byte[has]), bit[has])
+
+    @classmethod
+    def from_rows(
+        cls, price_rows: Iterable[Any], source_of: Optional[Dict[int, int]] = None
+    ) -> "PriceMatrix":
+        """Ühekordne maatriks _latest_prices() ridadest (SQL-rada, kui
+        protsessisisene maatriks pole veel laetud). Read on juba
+        efektiivse hinnaga ja hinnaallika store_id'ga; source_of seob
+        füüsilise poe allikaga."""
+        matrix = cls()
+        matrix._source_of = dict(source_of or {})
+        matrix._apply(
+            {
+                "product_id": r["product_id"],
+                "store_id": r["store_id"],
+                "price": r["price"],
+                "promo_price": None,
+                "updated_at": None,
+            }
+            for r in price_rows
+        )
+        return matrix
+
+    # ---------------- laadimine ----------------
+
+    async def _stream_prices(self, conn, where: str = "", *args: Any) -> int:
+        count = 0
+        batch: List[Any] = []
+        async with conn.transaction(readonly=True):
+            async for r in conn.cursor(_PRICES_SQL.format(where=where), *args, prefetch=_BATCH_ROWS):
+                batch.append(r)
+                if len(batch) >= _BATCH_ROWS:
+                    self._apply(batch)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            self._apply(batch)
+            count += len(batch)
+        return count
+
+    async def _load_sources(self, conn) -> None:
+        rows = await conn.fetch(_SOURCE_SQL)
+        self._source_of = {int(r["store_id"]): int(r["source_store_id"]) for r in rows}
+
+    async def load(self, pool) -> None:
+        async with self._lock:
+            started = time.perf_counter()
+            async with pool.acquire() as conn:
+                count = await self._stream_prices(conn)
+                await self._load_sources(conn)
+            self.loaded_at = time.time()
+            logger.info(
+                "💾 Price matrix loaded: %d rows, %d products × %d source stores in %.1fs",
+                count, len(self._rows), len(self._cols), time.perf_counter() - started,
+            )
+
+    async def refresh(self, pool) -> None:
+        """Esimesel korral täislaadimine, edaspidi ainult vesimärgist
+        uuemad read (+ REFRESH_OVERLAP) ja store_price_source uuesti."""
+        if not self.ready:
+            await self.load(pool)
+            return
+        async with self._lock:
+            since = (self._watermark - REFRESH_OVERLAP) if self._watermark else None
+            async with pool.acquire() as conn:
+                if since is None:
+                    count = await self._stream_prices(conn)
+                else:
+                    count = await self._stream_prices(conn, "WHERE cp.updated_at > $1", since)
+                await self._load_sources(conn)
+            if count:
+                logger.info("Price matrix refreshed: %d rows since %s", count, since)
+
+    # ---------------- skoorimine ----------------
+
+    def score(
+        self,
+        line_members: Sequence[Sequence[int]],
+        quantities: Sequence[float],
+        store_ids: Sequence[int],
+        complete_only: bool = False,
+    ) -> BasketScores:
+        """Leiab iga korvi rea (= grupi liikmete loend) odavaima hinna
+        igas poes ja poe korvi summa. Füüsiline pood loeb hindu oma
+        efektiivsest hinnaallikast — iga allikas skooritakse üks kord ja
+        tulemus laotatakse selle allika füüsilistele poodidele.
+
+        complete_only=True (require_all_items): saadavus leitakse enne
+        bitikaardilt ja hinnad arvutatakse ainult allikatele, kus on
+        olemas KÕIK read; mittetäielikel on ainult `available`/lines_found."""
+        n_lines = len(line_members)
+        width = max((len(m) for m in line_members), default=0) or 1
+
+        member_rows = np.full((n_lines, width), -1, dtype=np.int64)
+        member_pids = np.full((n_lines, width), -1, dtype=np.int64)
+        for i, members in enumerate(line_members):
+            for j, pid in enumerate(members):
+                row = self._rows.get(int(pid))
+                if row is not None:
+                    member_rows[i, j] = row
+                    member_pids[i, j] = int(pid)
+        store_cols = np.asarray(
+            [self._cols.get(self.source_store_id(int(sid)), -1) for sid in store_ids],
+            dtype=np.int64,
+        )
+        # Unikaalsed allikaveerud; source_group[k] = poe k veeru indeks neis.
+        cols, source_group = np.unique(store_cols, return_inverse=True)
+        source_group = source_group.reshape(-1)
+        n_stores = len(cols)
+
+        available = None
+        if complete_only:
+            available = self._available(member_rows, cols)
+            cols = np.where(available.all(axis=0), cols, -1)
+
+        # (read × liikmed × poed); puuduv hind = +inf, et argmin seda ei valiks.
+        prices = np.full((n_lines, width, n_stores), np.inf, dtype=np.float64)
+        row_ok = member_rows >= 0
+        col_ok = cols >= 0
+        if row_ok.any() and col_ok.any():
+            sub = self._effective[np.ix_(member_rows[row_ok], cols[col_ok])].astype(np.float64)
+            sub[np.isnan(sub)] = np.inf
+            gathered = np.full((sub.shape[0], n_stores), np.inf, dtype=np.float64)
+            gathered[:, col_ok] = sub
+            prices[row_ok] = gathered
+
+        best_j = prices.argmin(axis=1)
+        best = np.take_along_axis(prices, best_j[:, None, :], axis=1)[:, 0, :]
+        found = np.isfinite(best)
+
+        # float32 -> float64 teisendus toob sisse ~1e-7 müra; sendihinnad
+        # ümardatakse tagasi enne korrutamist, et summad klapiksid SQL-rajaga.
+        best_price = np.where(found, np.round(best, 4), np.nan)
+        best_pid = np.where(found, np.take_along_axis(member_pids, best_j, axis=1), -1)
+        qty = np.asarray(quantities, dtype=np.float64).reshape(-1, 1)
+        totals = np.where(found, best_price * qty, 0.0).sum(axis=0)
+        if available is None:
+            available = found
+        return BasketScores(
+            best_price=best_price[:, source_group],
+            best_pid=best_pid[:, source_group],
+            totals=totals[source_group],
+            lines_found=available.sum(axis=0)[source_group],
+            source_group=source_group,
+            available=available[:, source_group],
+        )
+
+    def _available(self, member_rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """(read × veerud) bool bitikaardilt: mõnel rea liikmel on veerus hind."""
+        n_lines = member_rows.shape[0]
+        out = np.zeros((n_lines, len(cols)), dtype=bool)
+        col_ok = cols >= 0
+        if not n_lines or not col_ok.any() or not self._avail.size:
+            return out
+        bits = self._avail[np.clip(member_rows, 0, None)]          # (read × liikmed × baidid)
+        bits[member_rows < 0] = 0
+        line_bits = np.bitwise_or.reduce(bits, axis=1)               # (read × baidid)
+        unpacked = np.unpackbits(line_bits, axis=1).astype(bool)     # (read × veerud varuga)
+        out[:, col_ok] = unpacked[:, cols[col_ok]]
+        return out
+
+
+_matrix = PriceMatrix()
+
+
+def get_price_matrix() -> PriceMatrix:
+    return _matrix
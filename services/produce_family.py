@@ -0,0 +1,135 @@
+# services/produce_family.py
+"""
+Tooteperekonnad (tomat, kartul, sibul, ...) toote nime jargi.
+
+/products/alternatives kasutab perekonda laias kategoorias (nt
+produce_root_veg) kandidaatide hard filtrina; sama loogikat kasutab
+scripts/build_product_alternatives.py eelarvutatud naabrite ehitamisel,
+seetottu on see eraldi moodulis (varem api/products.py sees).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("uvicorn.error")
+
+# v10 fix (ChatGPT lopplik soovitus): asendatud jarjekorra-pohine
+# sonastik EKSPLITSIITSE prioriteediga reeglite loendiga. Eelmine
+# PRODUCE_FAMILIES dict tootas oigesti, aga tugines VAIKIMISI
+# insertion-order'ile ("chili enne pepper", "cauliflower enne cabbage",
+# "zucchini enne pumpkin") - see on habras: jargmine uus markssona voib
+# vaikselt uuesti mone kollisiooni tekitada, kui keegi ei mainita
+# kommentaare loe. Nyyd on prioriteet OTSE nahtav (100 = spetsiifilisem
+# liitsona/alamliik, mis voidab yldisema 50-prioriteediga vaste ule,
+# soltumata sellest, millises jarjekorras loend on kirjutatud).
+#
+# Eestikeelsed markssonad on TYVED (mitte taisvormid), et katta
+# kaandeid ILIKE '%tyvi%' substring-matchiga. Kaashaalikuuhenduse tottu
+# (nt kurk->kurgi, peet->peedi) on mone perekonna jaoks kaks tyve.
+PRODUCE_FAMILY_RULES: List[tuple] = [
+    # Prioriteet 100: TEADAOLEVALT spetsiifilisemad/liitsona-markssonad,
+    # mis peavad voitma uldisema 50-prioriteediga vaste ule.
+    ("chili", ("tšilli", "tsilli", "chili"), 100),       # voidab "pepper" (paprika)
+    ("cauliflower", ("lillkaps",), 100),                  # voidab "cabbage" (kapsa)
+    ("zucchini", ("suvikõrvits", "suvikorvits"), 100),    # voidab "pumpkin" (kõrvits)
+    # Prioriteet 50: pohiperekonnad.
+    ("tomato", ("tomat",), 50),  # katab tomat/tomatid/kirsstomat/ploomtomat/kobartomat
+    ("potato", ("kartul",), 50),
+    ("onion", ("sibul",), 50),
+    ("garlic", ("küüslauk", "kuuslauk"), 50),
+    ("leek", ("porru",), 50),
+    ("cucumber", ("kurk", "kurgi"), 50),  # kurk (nom) / kurgi (gen, k->g gradatsioon)
+    ("pepper", ("paprika",), 50),
+    ("carrot", ("porgand",), 50),
+    ("broccoli", ("brokoli",), 50),
+    ("cabbage", ("kapsa",), 50),  # katab kapsas/kapsad/kapsaga/punane kapsas
+    ("beet", ("peet", "peedi"), 50),  # peet (nom) / peedi (gen, t->d gradatsioon)
+    ("radish", ("redis",), 50),
+    ("turnip", ("naeris", "naeri"), 50),
+    ("swede", ("kaalikas", "kaalika"), 50),
+    ("celery", ("seller",), 50),
+    ("eggplant", ("baklažaan", "baklazaan"), 50),
+    ("pumpkin", ("kõrvits", "korvits"), 50),
+    ("corn", ("mais",), 50),
+    ("asparagus", ("spargel",), 50),
+]
+
+# v12 fix: assert ei toimi Python -O (optimeeritud) rezhiimis, kus
+# koik assert-laused eemaldatakse taielikult - "kukub deploy'l kohe"
+# poleks siis garanteeritud. Eksplitsiitne RuntimeError kontrollib
+# seda IGAS rezhiimis. Kontroll on ka teadlikult ENNE
+# FAMILY_KEYWORDS_BY_NAME loomist, et duplikaadi korral ei looda
+# isegi ajutiselt juba vaikides yle kirjutatud lookup'i.
+_family_names = [family for family, _keywords, _priority in PRODUCE_FAMILY_RULES]
+_duplicate_family_names = sorted({
+    family for family in _family_names if _family_names.count(family) > 1
+})
+if _duplicate_family_names:
+    raise RuntimeError(
+        f"PRODUCE_FAMILY_RULES sisaldab duplikaat family nimesid: {_duplicate_family_names}"
+    )
+
+# Tuletatud lookup ILIKE mustrite jaoks (sub_code candidate filter).
+FAMILY_KEYWORDS_BY_NAME: Dict[str, tuple] = {
+    family: keywords for family, keywords, _priority in PRODUCE_FAMILY_RULES
+}
+
+# Kategooriad, kus tooteperekonna hard filter rakendub (ChatGPT: ÄRGE
+# kasutage dünaamilist "kui >200 toodet" reeglit - suurus on riskisignaal,
+# mitte piisav otsus. Alustame käsitsi teadaoleva laia kategooriaga,
+# laiendame hiljem, kui automaatne heterogeensuse audit on tehtud).
+ALTERNATIVE_FAMILY_FILTER_SUB_CODES = {"produce_root_veg"}
+
+
+def detect_produce_family(name: str) -> Optional[str]:
+    """Tuvastab tooteperekonna (tomato/potato/onion/...) nime pohjal.
+    Tagastab None, kui yhtegi teadaolevat perekonda ei tuvastata - sel
+    juhul EI rakendata hard filtrit (fail-open, mitte fail-closed),
+    kuna vale negatiiv oleks siin halvem kui filtri puudumine.
+
+    Kasutab EKSPLITSIITSET prioriteeti (vt PRODUCE_FAMILY_RULES), MITTE
+    stringi pikkust ega loendi jarjekorda. "Pikim vaste voidab" katsetati
+    ja lykati tagasi (vt v9 ajalugu) - see lohkus tšillipaprika juhtumi,
+    kuna "paprika" (7 tahte) on stringina pikem kui "tšilli" (6 tahte),
+    kuigi "tšilli" on siin oige/spetsiifilisem valik. Tšillipaprika on
+    liitsona, kus molemad markssonad esinevad SOLTUMATULT (mitte
+    uksteise sees) - stringi pikkus ei korreleeru siin oigsusega,
+    seetottu on vaja eraldi, KASITSI maaratud prioriteeti.
+
+    v11 fix (ChatGPT leid): varasem versioon kasutas max(matches, key=...),
+    mis VORDSE korgeima prioriteedi korral tagastas vaikimisi ESIMESE
+    loendis oleva vaste - see oli endiselt jarjekorra-pohine hapruse
+    jaak, lihtsalt varjatud kujul (praegu 100/50 kahe astmega ei teki
+    kollisiooni, aga tulevane 50-prioriteediga lisandus voiks tekitada).
+    Nyyd TUVASTATAKSE vordsed korgeima prioriteediga vasted eraldi ja
+    tagastatakse fail-open (None) + hoiatuslogi, MITTE ei valita
+    vaikides yht neist juhuslikult/jarjekorra jargi."""
+    if not name:
+        return None
+    name_lower = name.lower()
+    matches = [
+        (priority, family)
+        for family, keywords, priority in PRODUCE_FAMILY_RULES
+        if any(kw in name_lower for kw in keywords)
+    ]
+    if not matches:
+        return None
+
+    highest_priority = max(priority for priority, _family in matches)
+    winners = {family for priority, family in matches if priority == highest_priority}
+
+    if len(winners) > 1:
+        logger.warning(
+            "Ambiguous produce family: name=%r families=%s priority=%s",
+            name, sorted(winners), highest_priority,
+        )
+        return None
+
+    return next(iter(winners))
+
+
+def family_ilike_patterns(family: str) -> List[str]:
+    """Tagastab ILIKE ANY() mustrid antud perekonna jaoks, nt
+    'tomato' -> ['%tomat%']."""
+    return [f"%{kw}%" for kw in FAMILY_KEYWORDS_BY_NAME.get(family, ())]
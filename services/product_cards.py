@@ -0,0 +1,59 @@
+# services/product_cards.py
+"""
+Tootekaardid (nimi, brand, pilt, ketid, min_price, ...) product_cards
+tabelist (migrations/2026-10-16-product-cards.sql).
+
+/products/{id}, /products/batch ja /favourites ehitasid sama kaardi
+igal päringul products ⋈ product_group_members ⋈ product_groups ⋈
+mv_group_chains join'iga; nüüd on see üks PK-päring. Tooted, millel
+kaarti veel pole (lisatud, aga hinda pole tulnud — dokumentide
+järjekord pole neid veel näinud), loetakse sama join'iga otse.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable
+
+from asyncpg import exceptions as pgerr
+
+# Veerud _row_to_safe_product'i (api/products.py) nimedega.
+_CARDS_SQL = """
+    SELECT c.product_id AS id, c.group_id, c.name, c.canonical_name,
+           c.group_brand, c.product_brand, c.image_url, c.manufacturer,
+           c.size_text, c.amount, c.food_group, c.sub_code,
+           c.chains AS available_chains, c.min_price
+    FROM product_cards c
+    WHERE c.product_id = ANY($1::int[])
+"""
+
+# Sama kaart otse (refresh_product_cards()'i SELECT).
+_LIVE_SQL = """
+    SELECT DISTINCT ON (p.id)
+           p.id, pgm.group_id, p.name, pg.canonical_name,
+           NULLIF(TRIM(pg.brand), '') AS group_brand, p.brand AS product_brand,
+           p.image_url, p.manufacturer, p.size_text, p.amount, p.food_group,
+           p.sub_code, gc.chains AS available_chains, gc.min_price
+    FROM products p
+    LEFT JOIN product_group_members pgm ON pgm.product_id = p.id
+    LEFT JOIN product_groups pg ON pg.id = pgm.group_id
+    LEFT JOIN mv_group_chains gc
+        ON gc.dedup_key = COALESCE(pgm.group_id::text, 'u_' || p.id::text)
+    WHERE p.id = ANY($1::int[])
+    ORDER BY p.id, pgm.group_id
+"""
+
+
+async def fetch_product_cards(conn, product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """{product_id: kaart}; olematud id'd puuduvad vastusest."""
+    ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+    if not ids:
+        return {}
+    try:
+        rows = await conn.fetch(_CARDS_SQL, ids)
+    except pgerr.UndefinedTableError:
+        rows = []
+    cards = {r["id"]: dict(r) for r in rows}
+    missing = [pid for pid in ids if pid not in cards]
+    if missing:
+        for r in await conn.fetch(_LIVE_SQL, missing):
+            cards[r["id"]] = dict(r)
+    return cards
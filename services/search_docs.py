@@ -0,0 +1,64 @@
+# services/search_docs.py
+"""
+product_search_docs järjekorra tühjendaja.
+
+/products, /products/search ja /products/brands loevad denormaliseeritud
+otsingudokumente (migrations/2026-10-16-product-search-docs.sql).
+Triggerid hinna-, toote- ja grupimuutustel panevad mõjutatud pid'd
+product_search_dirty järjekorda; see objekt kutsub main.py taustatsüklis
+refresh_product_search_docs(), mis ehitab ümber ainult nende
+dedup-võtmete dokumendid. Täielik ümberehitus jookseb öösel
+refresh-views.yml-is pärast mv_group_chains värskendust.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from asyncpg import exceptions as pgerr
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class SearchDocsRefresher:
+    def __init__(self) -> None:
+        self.available = True          # False, kui migratsioon pole veel jooksnud
+        self.last_rebuilt = 0
+        self.total_rebuilt = 0
+        self.last_ms: Optional[float] = None
+        self.refreshed_at: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "last_rebuilt": self.last_rebuilt,
+            "total_rebuilt": self.total_rebuilt,
+            "last_ms": self.last_ms,
+        }
+
+    async def refresh(self, pool) -> None:
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            try:
+                rebuilt = await conn.fetchval("SELECT refresh_product_search_docs()")
+            except (pgerr.UndefinedFunctionError, pgerr.UndefinedTableError):
+                self.available = False
+                return
+        self.available = True
+        self.last_rebuilt = int(rebuilt or 0)
+        self.total_rebuilt += self.last_rebuilt
+        self.last_ms = (time.perf_counter() - started) * 1000
+        self.refreshed_at = time.time()
+        if self.last_rebuilt:
+            logger.info(
+                "🔎 Search docs refreshed: %d documents in %.0fms",
+                self.last_rebuilt, self.last_ms,
+            )
+
+
+_refresher = SearchDocsRefresher()
+
+
+def get_search_docs() -> SearchDocsRefresher:
+    return _refresher
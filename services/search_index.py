@@ -0,0 +1,247 @@
+# services/search_index.py
+"""
+Protsessisisene typeahead-indeks /products/search jaoks.
+
+/products/search kutsutakse igal klahvivajutusel; SQL-rada teeb iga
+sõna kohta ILIKE'i üle product_search_docs tabeli. Indeks hoiab samu
+dokumente mälus, dokumendi number = positsioon (display_name,
+product_id) järjekorras DB collation'i järgi:
+
+  * n-grammide postitused — iga search_text'i (juba lower(unaccent()),
+    vt migrations/2026-10-16-product-search-docs.sql) sõna 2- ja
+    3-tähelised alamsõned -> sorteeritud dokumendimassiiv. 2–3-täheline
+    otsingusõna on täpselt üks postitus; pikem sõna on kõigi oma
+    trigrammide ühisosa, mis kontrollitakse üle `tok in search_text`.
+    Otsingusõnas tühikuid pole, seega on tulemus sama mis SQL-i
+    `search_text ILIKE '%' || lower(unaccent(tok)) || '%'`;
+  * relevantsuse tunnused (_relevance_order_clause'i järgi) —
+    lower(display_name) sorteeritud loendina prefiksi/täpse vaste
+    leidmiseks ja lower(group_brand) -> dokumendid. Ülejäänud
+    ("muu") tulemused on juba dokumendinumbri ehk nime järjekorras.
+
+Otsingusõnad normaliseeritakse nagu Postgresi unaccent (õ/ä/ö/ü -> o/a/o/u,
+š/ž -> s/z). Indeks laetakse uuesti, kui cache_generations
+'product_search_docs' loendur muutub (vt
+migrations/2026-10-16-product-search-docs-cache-gen.sql). Kuni esimene
+laadimine pole valmis, on `ready` False ja api/products.py kasutab SQL-i.
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from asyncpg import exceptions as pgerr
+
+from services.cache_generation import current_generation
+
+logger = logging.getLogger("uvicorn.error")
+
+# Sama aken mis api/products.py DOC_FRESHNESS_FILTER.
+FRESHNESS = timedelta(days=14)
+
+# Veerud, mida _row_to_safe_product vastuse jaoks loeb.
+_ROW_KEYS = (
+    "id", "group_id", "name", "canonical_name", "group_brand", "image_url",
+    "manufacturer", "size_text", "amount", "food_group", "sub_code",
+    "available_chains", "min_price",
+)
+
+_LOAD_SQL = """
+    SELECT p.*, d.group_id, d.dedup_key,
+           d.chains AS available_chains, d.min_price,
+           d.canonical_name, d.group_brand,
+           d.display_name, d.category_code, d.last_price_at, d.search_text
+    FROM product_search_docs d
+    JOIN products p ON p.id = d.product_id
+    ORDER BY d.display_name, d.product_id
+"""
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def normalize_token(tok: str) -> str:
+    """lower(unaccent(tok)) Pythonis: diakriitikud maha (NFKD)."""
+    decomposed = unicodedata.normalize("NFKD", tok.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _grams(word: str, n: int) -> Set[str]:
+    return {word[i:i + n] for i in range(len(word) - n + 1)}
+
+
+class SearchIndex:
+    def __init__(self) -> None:
+        self._rows: List[Dict[str, Any]] = []          # doc -> vastuse rida
+        self._text: List[str] = []                     # doc -> search_text
+        self._display: List[str] = []                  # doc -> lower(display_name)
+        self._gram_docs: Dict[str, np.ndarray] = {}    # 2/3-gramm -> doc'id (int32, kasvav)
+        self._names: List[Tuple[str, int]] = []        # (lower(display_name), doc) Pythoni järjekorras
+        self._brand_docs: Dict[str, np.ndarray] = {}   # lower(group_brand) -> doc'id
+        self._category_docs: Dict[str, np.ndarray] = {}  # category_code -> doc'id
+        self._last_price = np.empty(0, dtype=np.float64)  # doc -> last_price_at epoch (0 = pole)
+        self.generation: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+        self.queries = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "docs": len(self._rows),
+            "grams": len(self._gram_docs),
+            "queries": self.queries,
+            "generation": self.generation,
+        }
+
+    # ---------------- päringud ----------------
+
+    def _candidates(self, tok: str) -> Tuple[np.ndarray, bool]:
+        """(dokumendid, kas vaja üle kontrollida). 2–3 tähte on täpne."""
+        if len(tok) <= 3:
+            return self._gram_docs.get(tok, _EMPTY), False
+        postings = sorted((self._gram_docs.get(g, _EMPTY) for g in _grams(tok, 3)), key=len)
+        docs = postings[0]
+        for other in postings[1:]:
+            if not len(docs):
+                break
+            docs = np.intersect1d(docs, other, assume_unique=True)
+        return docs, True
+
+    def _name_range(self, prefix: str) -> np.ndarray:
+        lo = bisect.bisect_left(self._names, (prefix,))
+        hi = bisect.bisect_left(self._names, (prefix + "\U0010ffff",))
+        return np.fromiter((doc for _, doc in self._names[lo:hi]), dtype=np.int32, count=hi - lo)
+
+    def search(self, q: str, limit: int, sub_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Sama tulemus mis /products/search SQL-rada: iga >= 2-täheline
+        sõna peab esinema search_text'is, hind alla 14 päeva vana,
+        järjestus _relevance_order_clause'i järgi."""
+        self.queries += 1
+        tokens = {normalize_token(t) for t in q.lower().split() if len(t) >= 2}
+        if not tokens:
+            return []
+
+        matched: Optional[np.ndarray] = None
+        verify: List[str] = []
+        for tok in tokens:
+            docs, inexact = self._candidates(tok)
+            if inexact:
+                verify.append(tok)
+            matched = docs if matched is None else np.intersect1d(matched, docs, assume_unique=True)
+            if not len(matched):
+                return []
+
+        if sub_code is not None:
+            matched = np.intersect1d(
+                matched, self._category_docs.get(sub_code, _EMPTY), assume_unique=True
+            )
+        fresh_after = (datetime.now(timezone.utc) - FRESHNESS).timestamp()
+        matched = matched[self._last_price[matched] > fresh_after]
+        if not len(matched):
+            return []
+
+        # Pikemate sõnade trigrammide ühisosa on ülemhulk — kontrollime
+        # ainult neid dokumente, mis vastusesse jõuaksid.
+        text = self._text
+
+        def ok(doc: int) -> bool:
+            return all(tok in text[doc] for tok in verify)
+
+        # Relevantsuse korvid: 0 = nimi == q, 1 = nimi algab q-ga,
+        # 2 = brand == q, 3 = muu. Korvi sees dokumendinumbri järjekord.
+        q_norm = " ".join(q.lower().split())
+        prefixed = np.intersect1d(matched, self._name_range(q_norm), assume_unique=True)
+        prefixed_docs = [d for d in prefixed.tolist() if ok(d)]
+        ordered = [d for d in prefixed_docs if self._display[d] == q_norm]
+        ordered += [d for d in prefixed_docs if self._display[d] != q_norm]
+        if len(ordered) < limit:
+            brand = np.setdiff1d(
+                np.intersect1d(matched, self._brand_docs.get(q_norm, _EMPTY), assume_unique=True),
+                prefixed, assume_unique=True,
+            )
+            ordered += [d for d in brand.tolist() if ok(d)]
+        if len(ordered) < limit:
+            seen = set(ordered)
+            for d in matched.tolist():
+                if d not in seen and ok(d):
+                    ordered.append(d)
+                    if len(ordered) >= limit:
+                        break
+        return [self._rows[d] for d in ordered[:limit]]
+
+    # ---------------- laadimine ----------------
+
+    async def refresh(self, pool) -> None:
+        """Laeb indeksi, kui see pole veel laetud või 'product_search_docs'
+        loendur on muutunud. Ilma cache_generations tabelita iga kord."""
+        async with pool.acquire() as conn:
+            generation = await current_generation(conn, "product_search_docs")
+            if self.ready and generation is not None and generation == self.generation:
+                return
+            started = time.perf_counter()
+            try:
+                rows = await conn.fetch(_LOAD_SQL)
+            except (pgerr.UndefinedTableError, pgerr.UndefinedColumnError):
+                return
+
+        out_rows: List[Dict[str, Any]] = []
+        texts: List[str] = []
+        display: List[str] = []
+        last_price = np.zeros(len(rows), dtype=np.float64)
+        gram_lists: Dict[str, List[int]] = {}
+        brand_lists: Dict[str, List[int]] = {}
+        category_lists: Dict[str, List[int]] = {}
+        for doc, r in enumerate(rows):
+            rec = dict(r)
+            out_rows.append({k: rec.get(k) for k in _ROW_KEYS})
+            text = rec.get("search_text") or ""
+            texts.append(text)
+            display.append((rec.get("display_name") or "").lower())
+            ts = rec.get("last_price_at")
+            if ts is not None:
+                last_price[doc] = ts.timestamp()
+            grams: Set[str] = set()
+            for word in set(text.split()):
+                grams |= _grams(word, 2)
+                grams |= _grams(word, 3)
+            for g in grams:
+                gram_lists.setdefault(g, []).append(doc)
+            brand = (rec.get("group_brand") or "").lower()
+            if brand:
+                brand_lists.setdefault(brand, []).append(doc)
+            category = rec.get("category_code")
+            if category is not None:
+                category_lists.setdefault(category, []).append(doc)
+
+        def _arrays(lists: Dict[str, List[int]]) -> Dict[str, np.ndarray]:
+            # doc'id lisati kasvavas järjekorras — massiivid on juba sorteeritud.
+            return {k: np.asarray(v, dtype=np.int32) for k, v in lists.items()}
+
+        (self._rows, self._text, self._display, self._last_price) = (
+            out_rows, texts, display, last_price)
+        self._gram_docs = _arrays(gram_lists)
+        self._brand_docs = _arrays(brand_lists)
+        self._category_docs = _arrays(category_lists)
+        self._names = sorted((name, doc) for doc, name in enumerate(display))
+        self.generation = generation
+        self.loaded_at = time.time()
+        logger.info(
+            "🔤 Search index loaded: %d docs, %d grams (generation %s) in %.0fms",
+            len(out_rows), len(self._gram_docs), generation,
+            (time.perf_counter() - started) * 1000,
+        )
+
+
+_index = SearchIndex()
+
+
+def get_search_index() -> SearchIndex:
+    return _index
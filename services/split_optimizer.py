@@ -0,0 +1,107 @@
+# services/split_optimizer.py
+"""
+Korvi jagamine kuni k (2 või 3) poe vahel.
+
+Sisend on (korvi read × poed) kulumaatriks: rea hind × kogus, +inf kui
+poes rida pole. Otsitakse poodide hulk S (|S| <= k), mis minimeerib
+sum_i min_{s in S} C[i, s] + penalty * (|S| - 1); iga rida ostetakse
+hulga odavaimast poest.
+
+Kõik kombinatsioonid arvutatakse NumPy-s korraga, kärbitakse enne:
+  * domineerimine — pood, mis pole üheski reas odavam kui mõni teine
+    pood (ja võrdsete puhul hilisem ehk kaugem), ei saa kunagi parimasse
+    hulka kuuluda: selle asendamine domineerijaga ei tõsta hinda;
+  * rea alampiirid — iga rea miinimum üle (järelejäänud) poodide annab
+    alampiiri kõigile hulkadele; kui see + trahv pole odavam kui parim
+    seni leitud lahendus, jäetakse paarid/kolmikud või ülejäänud
+    kolmikute harud vahele.
+50 poe × 50 rea juures on kolmikute täisvõrdlus ~6M elementi.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Rea puudumise "hind": suurem kui ükski korvi summa, nii et enne
+# minimeeritakse katmata ridade arvu ja alles siis hinda.
+MISSING_COST = 1e6
+
+
+@dataclass
+class SplitPlan:
+    stores: Tuple[int, ...]   # valitud poodide indeksid (sisendi järjekorras)
+    assignment: np.ndarray    # (read,) poe indeks, -1 = rida pole valitud poodides
+    total: float              # leitud ridade summa ilma trahvita
+    single_total: Optional[float]  # parim ühe poe summa, kui mõni pood katab kõik read
+
+
+def _dominated(cost: np.ndarray) -> np.ndarray:
+    """(poed,) bool — pood on mõne teise poe poolt domineeritud."""
+    n = cost.shape[1]
+    le = (cost[:, :, None] <= cost[:, None, :]).all(axis=0)   # le[a, b]: a <= b igas reas
+    order = np.arange(n)
+    strict = le & ~le.T
+    tie = le & le.T & (order[:, None] < order[None, :])
+    return (strict | tie).any(axis=0)
+
+
+def best_split(cost: np.ndarray, max_stores: int, penalty: float = 0.0) -> Optional[SplitPlan]:
+    """Odavaim kuni max_stores poe hulk. Eelistab enim ridu katvat hulka;
+    read, mida valitud poed ei müü, saavad assignment = -1. None, kui
+    ühtki rida ei leitud."""
+    n_lines, n_stores = cost.shape
+    covered = np.isfinite(cost).any(axis=1) if n_stores else np.zeros(n_lines, dtype=bool)
+    if not covered.any():
+        return None
+    C = np.where(np.isfinite(cost[covered]), cost[covered], MISSING_COST)
+
+    singles = C.sum(axis=0)
+    single_total = float(singles.min())
+    best_cost = single_total
+    best_set: Tuple[int, ...] = (int(singles.argmin()),)
+
+    # Kandidaadid: mittedomineeritud poed ühe poe summa järjekorras —
+    # odavamad ees, et järelejäänud poodide alampiir kasvaks kiiresti.
+    cand = np.flatnonzero(~_dominated(C))
+    cand = cand[np.argsort(singles[cand], kind="stable")]
+    Cc = C[:, cand]
+    m = len(cand)
+    lower = float(C.min(axis=1).sum())
+
+    if max_stores >= 2 and m >= 2 and lower + penalty < best_cost:
+        pair = np.minimum(Cc[:, :, None], Cc[:, None, :]).sum(axis=0) + penalty
+        pair[np.tril_indices(m)] = np.inf
+        a, b = np.unravel_index(int(pair.argmin()), pair.shape)
+        if pair[a, b] < best_cost:
+            best_cost, best_set = float(pair[a, b]), (int(cand[a]), int(cand[b]))
+
+    if max_stores >= 3 and m >= 3 and lower + 2 * penalty < best_cost:
+        # suffix[:, a] = rea miinimum poodide a.. hulgas; kolmik (a < b < c)
+        # ei saa olla odavam kui suffix_lb[a] + 2 * trahv.
+        suffix_lb = np.minimum.accumulate(Cc[:, ::-1], axis=1)[:, ::-1].sum(axis=0)
+        for a in range(m - 2):
+            if suffix_lb[a] + 2 * penalty >= best_cost:
+                break   # suffix_lb on kasvav — edasised harud ei aita
+            rest = Cc[:, a + 1:]
+            with_a = np.minimum(Cc[:, a:a + 1], rest)
+            triple = np.minimum(with_a[:, :, None], rest[:, None, :]).sum(axis=0) + 2 * penalty
+            triple[np.tril_indices(rest.shape[1])] = np.inf
+            b, c = np.unravel_index(int(triple.argmin()), triple.shape)
+            if triple[b, c] < best_cost:
+                best_cost = float(triple[b, c])
+                best_set = (int(cand[a]), int(cand[a + 1 + b]), int(cand[a + 1 + c]))
+
+    chosen = tuple(sorted(best_set))   # sisendi järjekord = lähim enne (võrdse hinna korral)
+    sub = cost[:, list(chosen)]
+    line_min = sub.min(axis=1)
+    found = np.isfinite(line_min)
+    # Poed, kes ühtki rida ei saanud (nt kõik viigid läksid lähemale), jäävad välja.
+    assignment = np.where(found, np.asarray(chosen)[sub.argmin(axis=1)], -1)
+    return SplitPlan(
+        stores=tuple(s for s in chosen if (assignment == s).any()),
+        assignment=assignment,
+        total=float(line_min[found].sum()),
+        single_total=single_total if single_total < MISSING_COST else None,
+    )
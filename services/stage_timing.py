@@ -0,0 +1,123 @@
+# services/stage_timing.py
+"""
+/compare etappide ajamõõtmine.
+
+Iga päringu jaoks avab router StageTimer'i (contextvar), teenus mähib
+etapid `with stage("names"):` plokki. Päringu lõpus läheb kogum
+Server-Timing päisesse (brauseri devtools, scripts/loadtest_compare.py)
+ja iga etapi kestus lisatakse protsessi-ülesesse histogrammi, mida
+GET /metrics Prometheuse tekstivormingus välja annab.
+
+Ilma avatud taimerita (nt compute_compare() või skriptid) `stage()`
+ainult täidab histogrammi — Server-Timing päist pole kuhugi panna.
+"""
+from __future__ import annotations
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Histogrammi ülemised piirid millisekundites (Prometheuse "le").
+BUCKETS_MS: Tuple[float, ...] = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class StageHistogram:
+    __slots__ = ("counts", "count", "sum_ms")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS_MS)   # mitte-kumulatiivsed; +Inf = count
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.count += 1
+        self.sum_ms += ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+
+
+class StageTimer:
+    """Ühe päringu etapid lisamise järjekorras (sama nimi liidetakse)."""
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[Optional[StageTimer]] = contextvars.ContextVar(
+    "compare_stage_timer", default=None
+)
+# (endpoint, stage) -> histogramm. Ühe lõime asyncio — lukku pole vaja.
+_histograms: Dict[Tuple[str, str], StageHistogram] = {}
+
+
+def _observe(endpoint: str, name: str, ms: float) -> None:
+    hist = _histograms.get((endpoint, name))
+    if hist is None:
+        hist = _histograms[(endpoint, name)] = StageHistogram()
+    hist.observe(ms)
+
+
+def start_timer(endpoint: str) -> StageTimer:
+    """Avab selle päringu (asyncio ülesande konteksti) taimeri."""
+    timer = StageTimer(endpoint)
+    _current.set(timer)
+    return timer
+
+
+def finish_timer(timer: StageTimer) -> str:
+    """Kannab etapid histogrammidesse ja tagastab Server-Timing väärtuse."""
+    header = timer.server_timing()
+    for name, ms in timer.stages.items():
+        _observe(timer.endpoint, name, ms)
+    _observe(timer.endpoint, "total", timer.total_ms())
+    if _current.get() is timer:
+        _current.set(None)
+    return header
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        timer = _current.get()
+        if timer is not None:
+            timer.add(name, ms)
+        else:
+            _observe("internal", name, ms)
+
+
+def render_prometheus() -> List[str]:
+    """compare_stage_duration_ms histogrammid Prometheuse tekstiridadena."""
+    lines = [
+        "# HELP compare_stage_duration_ms Duration of /compare stages in milliseconds.",
+        "# TYPE compare_stage_duration_ms histogram",
+    ]
+    for (endpoint, name), hist in sorted(_histograms.items()):
+        labels = f'endpoint="{endpoint}",stage="{name}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS_MS, hist.counts):
+            cumulative += n
+            lines.append(f'compare_stage_duration_ms_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'compare_stage_duration_ms_bucket{{{labels},le="+Inf"}} {hist.count}')
+        lines.append(f"compare_stage_duration_ms_sum{{{labels}}} {hist.sum_ms:.3f}")
+        lines.append(f"compare_stage_duration_ms_count{{{labels}}} {hist.count}")
+    return lines
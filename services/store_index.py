@@ -0,0 +1,208 @@
+# services/store_index.py
+"""
+Protsessisisene poodide geoindeks.
+
+Poode on paarsada, aga /compare, retsepti võrdlus ja /stores/nearby
+arvutasid igal päringul SQL-is haversine'i üle kogu stores tabeli.
+Indeks hoiab kõiki poode mälus (chain, is_online, store_price_source
+allikas) ja koordinaatidega poode lat/lon ruudustikus (CELL_DEG
+kraadi), nii et raadiuse päring vaatab ainult ümbritsevaid lahtreid.
+
+Laetakse taustal (main.py) ja laetakse uuesti, kui cache_generations
+'stores' loendur muutub — seda tõstavad trigerid stores ja
+store_price_source tabelil, st ka GitHub Actionsis jooksvad
+seemneskriptid (scrape_*_stores.py, seed_selver_stores.py).
+Kuni esimene laadimine pole valmis, on `ready` False ja kutsujad
+kasutavad vana SQL-rada.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.cache_generation import current_generation
+
+logger = logging.getLogger("uvicorn.error")
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.0
+
+# Lahtri suurus kraadides (~5.5 km laiuskraadil, Eesti kohal ~3 km pikkuskraadil).
+CELL_DEG = 0.05
+
+_STORES_SQL = """
+SELECT s.id, s.name, s.chain, s.lat, s.lon,
+       COALESCE(s.is_online, false) AS is_online,
+       COALESCE(ses.source_store_id, s.id) AS source_store_id
+FROM stores s
+LEFT JOIN store_effective_source ses ON ses.store_id = s.id
+"""
+
+
+@dataclass(frozen=True)
+class StoreEntry:
+    id: int
+    name: Optional[str]
+    chain: Optional[str]
+    lat: Optional[float]
+    lon: Optional[float]
+    is_online: bool
+    source_store_id: int
+
+    def as_row(self, distance_km: Optional[float]) -> Dict[str, Any]:
+        """Sama kuju, mida _candidate_stores() SQL tagastas."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "chain": self.chain,
+            "lat": self.lat,
+            "lon": self.lon,
+            "distance_km": distance_km,
+        }
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Sama valem mis SQL-is: 2*6371*asin(sqrt(...)).
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((p2 - p1) / 2) ** 2
+        + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return (math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG))
+
+
+class StoreIndex:
+    def __init__(self) -> None:
+        self._by_id: Dict[int, StoreEntry] = {}
+        self._grid: Dict[Tuple[int, int], List[StoreEntry]] = {}
+        self._physical: List[StoreEntry] = []   # koordinaatidega füüsilised poed id järjekorras
+        self.generation: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+
+    # ---------------- olek ----------------
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "stores": len(self._by_id),
+            "geo_cells": len(self._grid),
+            "generation": self.generation,
+        }
+
+    def get(self, store_id: int) -> Optional[StoreEntry]:
+        return self._by_id.get(int(store_id))
+
+    def source_store_id(self, store_id: int) -> int:
+        entry = self._by_id.get(int(store_id))
+        return entry.source_store_id if entry else int(store_id)
+
+    def physical_stores(self) -> List[StoreEntry]:
+        return self._physical
+
+    # ---------------- laadimine ----------------
+
+    def _build(self, rows) -> None:
+        by_id: Dict[int, StoreEntry] = {}
+        grid: Dict[Tuple[int, int], List[StoreEntry]] = defaultdict(list)
+        for r in rows:
+            entry = StoreEntry(
+                id=int(r["id"]),
+                name=r["name"],
+                chain=r["chain"],
+                lat=float(r["lat"]) if r["lat"] is not None else None,
+                lon=float(r["lon"]) if r["lon"] is not None else None,
+                is_online=bool(r["is_online"]),
+                source_store_id=int(r["source_store_id"]),
+            )
+            by_id[entry.id] = entry
+            if entry.lat is not None and entry.lon is not None:
+                grid[_cell(entry.lat, entry.lon)].append(entry)
+        physical = sorted(
+            (e for e in by_id.values() if not e.is_online and e.lat is not None and e.lon is not None),
+            key=lambda e: e.id,
+        )
+        # Vahetame korraga — päringud näevad kas vana või uut indeksit.
+        self._by_id, self._grid, self._physical = by_id, dict(grid), physical
+
+    async def refresh(self, pool) -> None:
+        """Laeb indeksi, kui see pole veel laetud või 'stores' loendur on
+        muutunud. Ilma cache_generations tabelita laetakse iga kord."""
+        async with pool.acquire() as conn:
+            generation = await current_generation(conn, "stores")
+            if self.ready and generation is not None and generation == self.generation:
+                return
+            started = time.perf_counter()
+            rows = await conn.fetch(_STORES_SQL)
+        self._build(rows)
+        changed = not self.ready or self.generation != generation
+        self.generation = generation
+        self.loaded_at = time.time()
+        if changed:
+            logger.info(
+                "📍 Store index loaded: %d stores in %d cells (generation %s) in %.0fms",
+                len(self._by_id), len(self._grid), generation,
+                (time.perf_counter() - started) * 1000,
+            )
+
+    # ---------------- päringud ----------------
+
+    def within(
+        self, lat: float, lon: float, radius_km: float, physical_only: bool = True
+    ) -> List[Tuple[StoreEntry, float]]:
+        """Poed raadiuses, sorditud (kaugus, chain, name)."""
+        lat, lon, radius_km = float(lat), float(lon), float(radius_km)
+        dlat = radius_km / KM_PER_DEG_LAT
+        # Pikkuskraadi laius kitseneb pooluste poole — võtame kasti
+        # poolusepoolseima serva järgi, et ükski pood välja ei jääks.
+        edge = min(abs(lat) + dlat, 89.9)
+        dlon = min(radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(edge)), 1e-6)), 180.0)
+        lat_lo, lon_lo = _cell(lat - dlat, lon - dlon)
+        lat_hi, lon_hi = _cell(lat + dlat, lon + dlon)
+
+        n_cells = (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1)
+        if n_cells > len(self._grid):
+            keys = [k for k in self._grid if lat_lo <= k[0] <= lat_hi and lon_lo <= k[1] <= lon_hi]
+        else:
+            keys = [(i, j) for i in range(lat_lo, lat_hi + 1) for j in range(lon_lo, lon_hi + 1)]
+
+        hits: List[Tuple[StoreEntry, float]] = []
+        for key in keys:
+            for entry in self._grid.get(key, ()):
+                if physical_only and entry.is_online:
+                    continue
+                d = haversine_km(lat, lon, entry.lat, entry.lon)
+                if d <= radius_km:
+                    hits.append((entry, d))
+        hits.sort(key=lambda h: (h[1], h[0].chain or "", h[0].name or "", h[0].id))
+        return hits
+
+    def nearest(
+        self, lat: float, lon: float, k: int, physical_only: bool = True
+    ) -> List[Tuple[StoreEntry, float]]:
+        """k lähimat poodi. Kahekordistab raadiust, kuni raadiuses on
+        vähemalt k poodi (raadiuses olevate seas on ka k lähimat)."""
+        radius_km = 5.0
+        while True:
+            hits = self.within(lat, lon, radius_km, physical_only=physical_only)
+            if len(hits) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return hits[:k]
+            radius_km *= 2
+
+
+_index = StoreIndex()
+
+
+def get_store_index() -> StoreIndex:
+    return _index
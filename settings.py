@@ -97,6 +97,37 @@ def r2_public_url(key: str) -> str:
         return ""
     return f"{R2_PUBLIC_BASE}/{key.lstrip('/')}"
 
+# -----------------------------------------------------------------------------
+# In-process caches (loaded at startup, refreshed in the background by main.py)
+# -----------------------------------------------------------------------------
+# Set PRICE_MATRIX_ENABLED=false to keep /compare on the pure SQL price path.
+PRICE_MATRIX_ENABLED = (os.getenv("PRICE_MATRIX_ENABLED") or "true").lower() in {"1", "true", "yes"}
+CACHE_REFRESH_SECONDS = float(os.getenv("CACHE_REFRESH_SECONDS", "120"))
+# /compare name -> product LRU (services/name_cache.py)
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "20000"))
+NAME_CACHE_NEGATIVE_TTL = float(os.getenv("NAME_CACHE_NEGATIVE_TTL", "600"))
+# Recipe ingredient -> search terms LRU (services/ingredient_resolver.py)
+INGREDIENT_CACHE_SIZE = int(os.getenv("INGREDIENT_CACHE_SIZE", "5000"))
+INGREDIENT_CACHE_TTL = float(os.getenv("INGREDIENT_CACHE_TTL", "3600"))
+INGREDIENT_NEGATIVE_TTL = float(os.getenv("INGREDIENT_NEGATIVE_TTL", "300"))
+# /compare result cache (services/compare_cache.py); Redis tier uses REDIS_URL.
+# Keyed on the price matrix version, so it is off when PRICE_MATRIX_ENABLED=false.
+COMPARE_CACHE_ENABLED = (os.getenv("COMPARE_CACHE_ENABLED") or "true").lower() in {"1", "true", "yes"}
+COMPARE_CACHE_SIZE = int(os.getenv("COMPARE_CACHE_SIZE", "2000"))
+COMPARE_CACHE_TTL = int(os.getenv("COMPARE_CACHE_TTL", "900"))
+# /products/search typeahead index (services/search_index.py); false = SQL only
+SEARCH_INDEX_ENABLED = (os.getenv("SEARCH_INDEX_ENABLED") or "true").lower() in {"1", "true", "yes"}
+# /categories counts (services/category_tree.py): recount at most this often
+# after products change; refresh-views.yml forces one nightly.
+CATEGORY_COUNTS_MIN_INTERVAL = float(os.getenv("CATEGORY_COUNTS_MIN_INTERVAL", "600"))
+# ETag / 304 on catalog read endpoints (utils/http_cache.py). The salt
+# defaults to the deployed commit so a deploy invalidates old ETags.
+CATALOG_CACHE_MAX_AGE = int(os.getenv("CATALOG_CACHE_MAX_AGE", "60"))
+CATALOG_ETAG_SALT = os.getenv("CATALOG_ETAG_SALT") or os.getenv("RAILWAY_GIT_COMMIT_SHA", "")
+# GET /metrics (per-stage /compare histograms + cache stats). If set, requires
+# "Authorization: Bearer <METRICS_TOKEN>"; empty = endpoint disabled (404).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
 # -----------------------------------------------------------------------------
 # Helper for accessing DB pool in routes
 # -----------------------------------------------------------------------------
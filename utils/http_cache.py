@@ -0,0 +1,83 @@
+# utils/http_cache.py
+import hashlib
+from functools import wraps
+from typing import Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from services.catalog_version import get_catalog_version
+from settings import CATALOG_CACHE_MAX_AGE, CATALOG_ETAG_SALT
+
+
+def _etag(request: Request, version: str) -> str:
+    # Same data version + same path + same query (order-insensitive) ->
+    # same body. The salt changes on deploy, when the code that renders
+    # the body may have changed while the data did not.
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    raw = f"{CATALOG_ETAG_SALT}|{version}|{request.url.path}|{query}"
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored.
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def catalog_cache(*generations: str, private_if_authorized: bool = False):
+    """
+    Conditional GET for catalog read endpoints. The ETag is derived from
+    the in-process catalog data version (services/catalog_version.py) for
+    the given cache_generations names plus the request URL, so a matching
+    If-None-Match is answered with 304 before the endpoint touches the DB.
+
+    private_if_authorized: the response is personalised when an
+    Authorization header is sent -- no ETag, no shared caching.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs.get("request")
+            if not request:
+                for a in args:
+                    if isinstance(a, Request):
+                        request = a
+                        break
+
+            vary = {"Vary": "Authorization"} if private_if_authorized else {}
+            if request is None:
+                return await fn(*args, **kwargs)
+            if private_if_authorized and request.headers.get("authorization"):
+                result = await fn(*args, **kwargs)
+                if isinstance(result, Response):
+                    return result
+                return JSONResponse(
+                    jsonable_encoder(result),
+                    headers={"Cache-Control": "private, no-cache", **vary},
+                )
+
+            version = get_catalog_version().version(generations)
+            if version is None:
+                return await fn(*args, **kwargs)
+
+            etag = _etag(request, version)
+            headers = {
+                "ETag": etag,
+                "Cache-Control": f"public, max-age={CATALOG_CACHE_MAX_AGE}",
+                **vary,
+            }
+            if _matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers=headers)
+
+            result = await fn(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+            return JSONResponse(jsonable_encoder(result), headers=headers)
+        return wrapper
+    return decorator
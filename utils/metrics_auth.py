@@ -0,0 +1,22 @@
+import hmac
+
+from fastapi import Request
+
+from settings import METRICS_TOKEN
+
+
+def metrics_authorized(request: Request) -> bool:
+    """
+    True when the request carries "Authorization: Bearer <METRICS_TOKEN>".
+    Shared by the /metrics route (401 otherwise) and RateLimitMiddleware
+    (which lets only the authenticated scraper skip throttling).
+
+    Compared as bytes: Starlette decodes headers as latin-1, and
+    hmac.compare_digest() raises TypeError for str arguments with
+    non-ASCII characters. That would make such a request a 500, not a
+    401 or a rate-limit response.
+    """
+    if not METRICS_TOKEN:
+        return False
+    auth = request.headers.get("authorization") or ""
+    return hmac.compare_digest(auth.encode(), f"Bearer {METRICS_TOKEN}".encode())